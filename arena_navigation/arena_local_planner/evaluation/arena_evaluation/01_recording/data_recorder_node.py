@@ -2,8 +2,6 @@
 
 # general packages
 import time
-import numpy as np
-import csv
 import os
 
 # ros packages
@@ -17,44 +15,43 @@ from nav_msgs.msg import Odometry
 # for transformations
 from tf.transformations import euler_from_quaternion
 
+from recording import RecordingWriter, export_csv
+
 class recorder():
     def __init__(self) -> None:
-        # create rawdata csv file
+        # rows are buffered and written in chunks to a columnar recording, see recording.py
         self.local_planner = rospy.get_param("local_planner")
         self.waypoint_generator = rospy.get_param("waypoint_generator")
         self.record_only_planner = rospy.get_param("record_only_planner")
         self.scenario = rospy.get_param("scenario_file").replace(".json","").replace("eval/","")
+        self.chunk_size = rospy.get_param("~chunk_size", 256) # rows per write
+        self.export_csv = rospy.get_param("~export_csv", True) # csv for get_metrics.py when the node shuts down
         self.now = time.strftime("%y-%m-%d_%H:%M:%S")
         self.dir_path = "/root/mount/" # get path for current file, does not work if os.chdir() was used
         if self.record_only_planner:
-            with open(self.dir_path+"/{0}_{1}_{2}.csv".format(self.local_planner,self.scenario,self.now), "w+", newline = "") as file:
-                writer = csv.writer(file, delimiter = ',')
-                header = [["episode","time","laser_scan","robot_lin_vel_x","robot_lin_vel_y","robot_ang_vel","robot_orientation","robot_pos_x","robot_pos_y","action"]]
-                writer.writerows(header)
-                file.close()
+            self.file_name = "{0}_{1}_{2}".format(self.local_planner,self.scenario,self.now)
         else:
-            with open(self.dir_path+"/{0}_{1}_{2}_{3}.csv".format(self.local_planner,self.waypoint_generator,self.scenario,self.now), "w+", newline = "") as file:
-                writer = csv.writer(file, delimiter = ',')
-                header = [["episode","time","laser_scan","robot_lin_vel_x","robot_lin_vel_y","robot_ang_vel","robot_orientation","robot_pos_x","robot_pos_y","action"]]
-                writer.writerows(header)
-                file.close()
+            self.file_name = "{0}_{1}_{2}_{3}".format(self.local_planner,self.waypoint_generator,self.scenario,self.now)
+        self.rec_path = os.path.join(self.dir_path, self.file_name + ".rec")
+        self.writer = None # created with the first scan, which determines the number of beams
         
         # initialize variables to be recorded with default values, NOTE: time is recorded as well, but no need for seperate variable
         self.episode = 0
-        self.laserscan = ["None"]
+        self.laserscan = None
         self.robot_lin_vel_x = 0
         self.robot_lin_vel_y = 0
         self.robot_ang_vel = 0
         self.robot_orientation = 0
         self.robot_pos_x = 0
         self.robot_pos_y = 0
-        self.action = ["None"]
+        self.action = [0, 0, 0]
 
         # subscribe to topics
         rospy.Subscriber("/scenario_reset", Int16, self.episode_callback)
         rospy.Subscriber("/scan", LaserScan, self.laserscan_callback)
         rospy.Subscriber("/odom", Odometry, self.odometry_callback)
         rospy.Subscriber("/cmd_vel", Twist, self.action_callback)
+        rospy.on_shutdown(self.close)
 
     # define callback function for all variables and their respective topics
     def episode_callback(self, msg_scenario_reset: Int16):
@@ -62,6 +59,8 @@ class recorder():
 
     def laserscan_callback(self, msg_laserscan: LaserScan):
         self.laserscan = msg_laserscan.ranges
+        if self.writer is None:
+            self.writer = RecordingWriter(self.rec_path, len(self.laserscan), self.chunk_size)
 
     def odometry_callback(self, msg_Odometry: Odometry):
         pose3d = msg_Odometry.pose.pose
@@ -88,27 +87,30 @@ class recorder():
         pose2d.theta = yaw
         return pose2d
 
-    def action_callback(self, msg_action: Twist): # variables will be written to csv whenever an action is published
+    def action_callback(self, msg_action: Twist): # variables will be recorded whenever an action is published
         self.action = [msg_action.linear.x,msg_action.linear.y,msg_action.angular.z]
+        if self.writer is None: # no scan received yet
+            return
 
-        self.addData(np.array(
-            [self.episode,
+        self.writer.add_row(
+            self.episode,
             time.time(),
-            list(self.laserscan),
+            self.laserscan,
             self.robot_lin_vel_x,
             self.robot_lin_vel_y,
             self.robot_ang_vel,
             self.robot_orientation,
             self.robot_pos_x,
             self.robot_pos_y,
-            self.action]
-        ))
+            self.action
+        )
 
-    def addData(self, data:np.array): #add new row to the csv file 
-        with open(self.dir_path+"/{0}_{1}_{2}.csv".format(self.local_planner,self.scenario,self.now), "a+", newline = "") as file:
-            writer = csv.writer(file, delimiter = ',') # writer has to be defined again for the code to work
-            writer.writerows(data.reshape(1,-1)) # reshape into line vector
-            file.close()
+    def close(self): # write the buffered rows and export the csv
+        if self.writer is None:
+            return
+        self.writer.close()
+        if self.export_csv:
+            export_csv(self.rec_path, os.path.join(self.dir_path, self.file_name + ".csv"))
 
 
 if __name__=="__main__":
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# columnar binary recordings of data_recorder_node.py and their export to the csv format of get_metrics.py
+#
+# A recording is a directory <name>.rec with one raw file per column (<column>.bin) and meta.json, which holds the
+# dtype and row shape of every column and the number of rows written so far. The rows are buffered and appended in
+# chunks, the laser scans are a float32 matrix (rows x beams).
+#
+# usage: python recording.py <name>.rec [...]  exports the recordings to <name>.csv
+
+import argparse
+import csv
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# columns of the recording in the order of the csv header, laser_scan has one value per beam
+COLUMNS = [
+    ("episode", np.int32, ()),
+    ("time", np.float64, ()),
+    ("laser_scan", np.float32, None),
+    ("robot_lin_vel_x", np.float64, ()),
+    ("robot_lin_vel_y", np.float64, ()),
+    ("robot_ang_vel", np.float64, ()),
+    ("robot_orientation", np.float64, ()),
+    ("robot_pos_x", np.float64, ()),
+    ("robot_pos_y", np.float64, ()),
+    ("action", np.float64, (3,)),
+]
+CSV_HEADER = [name for name, _, _ in COLUMNS]
+
+
+class RecordingWriter:
+    """
+    Buffers the rows of a recording and appends them to the column files in chunks of chunk_size rows.
+
+    The chunks are written by a background thread, add_row only copies the values into the buffer. meta.json is
+    replaced after every chunk, so that a recording which is interrupted is readable up to its last chunk.
+    """
+
+    def __init__(self, path, num_beams, chunk_size=256):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.chunk_size = chunk_size
+        self.meta = {
+            "num_rows": 0,
+            "columns": [
+                {"name": name, "dtype": np.dtype(dtype).str, "shape": list((num_beams,) if shape is None else shape)}
+                for name, dtype, shape in COLUMNS
+            ],
+        }
+        self._write_meta()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._lock = threading.Lock()
+        self._new_buffer()
+
+    def _new_buffer(self):
+        self._buffer = [np.empty((self.chunk_size, *column["shape"]), dtype=column["dtype"])
+                        for column in self.meta["columns"]]
+        self._num_buffered = 0
+
+    def add_row(self, *values): # values in the order of COLUMNS
+        with self._lock:
+            for column, value in zip(self._buffer, values):
+                column[self._num_buffered] = value
+            self._num_buffered += 1
+            if self._num_buffered == self.chunk_size:
+                self._flush_buffer()
+
+    def _flush_buffer(self):
+        if self._num_buffered:
+            self._executor.submit(self._write_chunk, self._buffer, self._num_buffered)
+            self._new_buffer()
+
+    def _write_chunk(self, buffer, num_rows):
+        for column, values in zip(self.meta["columns"], buffer):
+            with open(os.path.join(self.path, column["name"] + ".bin"), "ab") as file:
+                file.write(values[:num_rows].tobytes())
+        self.meta["num_rows"] += num_rows
+        self._write_meta()
+
+    def _write_meta(self):
+        tmp_path = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp_path, "w") as file:
+            json.dump(self.meta, file)
+        os.replace(tmp_path, os.path.join(self.path, "meta.json"))
+
+    def flush(self): # writes the buffered rows and waits until all chunks are written
+        with self._lock:
+            self._flush_buffer()
+        self._executor.submit(lambda: None).result()
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown()
+
+
+def read_recording(path):
+    """columns of a recording as numpy arrays, memory mapped"""
+    with open(os.path.join(path, "meta.json")) as file:
+        meta = json.load(file)
+    num_rows = meta["num_rows"]
+    data = {}
+    for column in meta["columns"]:
+        if num_rows == 0:
+            data[column["name"]] = np.empty((0, *column["shape"]), dtype=column["dtype"])
+            continue
+        # the file may be longer than num_rows if the recording was interrupted while a chunk was written
+        data[column["name"]] = np.memmap(os.path.join(path, column["name"] + ".bin"), dtype=column["dtype"],
+                                         mode="r", shape=(num_rows, *column["shape"]))
+    return data
+
+
+def export_csv(path, csv_path=None):
+    """writes the recording in the csv format of the former data_recorder_node, which get_metrics.py reads"""
+    if csv_path is None:
+        csv_path = os.path.splitext(path.rstrip("/"))[0] + ".csv"
+    data = read_recording(path)
+    # tolist returns python floats, their repr equals the values the node used to write
+    columns = [data[name].tolist() for name in CSV_HEADER]
+    with open(csv_path, "w", newline="") as file:
+        writer = csv.writer(file, delimiter=",")
+        writer.writerow(CSV_HEADER)
+        writer.writerows(zip(*columns))
+    return csv_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="export recordings of data_recorder_node.py to csv")
+    parser.add_argument("recordings", type=str, nargs="+", help="<name>.rec directories")
+    args = parser.parse_args()
+    for recording in args.recordings:
+        print(export_csv(recording))
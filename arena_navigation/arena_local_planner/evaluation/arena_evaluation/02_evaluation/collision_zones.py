@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# collision zones of get_metrics.py: the places of a map where a planner collides repeatedly
+#
+# The collision samples of an episode which follow each other are one collision event, it is located where the
+# robot ran into the obstacle (first sample). The events are binned into a grid of cell_size x cell_size cells and
+# clustered like DBSCAN with the neighbouring cells as neighbourhood, but a zone is the area around one density peak,
+# see grid_clusters, so dense clouds of neighbouring obstacles do not chain into one zone. Single collisions far from
+# the others belong to no zone. Binning and clustering are O(n log n) in the number of samples, unlike the former
+# KMeans fits for every k from 2 to the number of samples with a silhouette score each.
+#
+# usage: python collision_zones.py  benchmarks the clustering on synthetic collision clouds
+
+import argparse
+import time
+
+import numpy as np
+
+# offsets of the 8 neighbouring cells
+NEIGHBOURS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx != 0 or dy != 0]
+
+
+def collision_events(collision, episode):
+    """indices of the first sample of every run of collision samples within an episode"""
+    collision = np.asarray(collision, dtype=bool)
+    episode = np.asarray(episode)
+    continued = np.zeros_like(collision)
+    continued[1:] = collision[:-1] & (episode[1:] == episode[:-1])
+    return np.flatnonzero(collision & ~continued)
+
+
+def grid_clusters(points, cell_size, min_events=3):
+    """
+    Density based clustering on a grid of cell_size x cell_size cells with the 3 x 3 cells around a point as its
+    neighbourhood: cells with at least min_events points in their neighbourhood are core cells. Every core cell climbs
+    to its densest neighbouring core cell until it reaches a density peak, the core cells of a peak form a cluster and
+    the other cells join the cluster of their densest neighbouring core cell.
+
+    Unlike DBSCAN, which joins all touching core cells, a cluster does not grow with the density: the core cells of
+    two obstacles touch once enough events are recorded, but they still climb to different peaks.
+
+    :return: cluster label of every point starting at 0, -1 for the points which are in no cluster
+    """
+    cells = np.floor(np.asarray(points, dtype=float) / cell_size).astype(np.int64)
+    cells -= cells.min(axis=0) - 1  # keep a free row and column around the occupied cells
+    height = cells[:, 1].max() + 2
+    keys, inverse, cell_counts = np.unique(
+        cells[:, 0] * height + cells[:, 1], return_inverse=True, return_counts=True
+    )
+    # neighbouring occupied cells of every cell, as index into keys
+    sources, targets = [], []
+    for dx, dy in NEIGHBOURS:
+        neighbour_keys = keys + dx * height + dy
+        idx = np.minimum(np.searchsorted(keys, neighbour_keys), len(keys) - 1)
+        found = keys[idx] == neighbour_keys
+        sources.append(np.flatnonzero(found))
+        targets.append(idx[found])
+    sources, targets = np.concatenate(sources), np.concatenate(targets)
+    density = cell_counts + np.bincount(sources, weights=cell_counts[targets], minlength=len(keys))
+    core = density >= min_events
+    # rank of the cells by density, ties are broken by the index so that every cell has one densest neighbour
+    by_density = np.lexsort((np.arange(len(keys)), density))
+    rank = np.empty(len(keys), dtype=np.int64)
+    rank[by_density] = np.arange(len(keys))
+    # every core cell points to its densest neighbouring core cell or itself, pointer jumping leads it to its peak
+    core_edges = core[sources] & core[targets]
+    parent_rank = rank.copy()
+    np.maximum.at(parent_rank, sources[core_edges], rank[targets[core_edges]])
+    peaks = by_density[parent_rank]
+    while True:
+        new_peaks = peaks[peaks]
+        if np.array_equal(new_peaks, peaks):
+            break
+        peaks = new_peaks
+    # border cells join the peak of their densest neighbouring core cell, the other cells are noise
+    border_edges = ~core[sources] & core[targets]
+    border_rank = np.full(len(keys), -1)
+    np.maximum.at(border_rank, sources[border_edges], rank[targets[border_edges]])
+    border = border_rank >= 0
+    no_label = len(keys)
+    cell_labels = np.where(core, peaks, no_label)
+    cell_labels[border] = peaks[by_density[border_rank[border]]]
+    clusters, cell_labels = np.unique(cell_labels, return_inverse=True)
+    cell_labels[clusters[cell_labels] == no_label] = -1
+    return cell_labels[inverse]
+
+
+def get_collision_zones(points, collision, episode, cell_size=1.0, min_events=3):
+    """
+    :param points: robot position of every sample (n x 2)
+    :param collision: whether the robot collided in the sample
+    :param episode: episode of the sample, the samples of an episode follow each other
+    :param cell_size: edge length of the grid cells in m
+    :param min_events: number of collision events within 3 x 3 cells a zone needs at least
+    :return: dict with the centroid and the number of collision events of every zone and the collision samples
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    collision = np.asarray(collision, dtype=bool)
+    samples = [[x, y, True] for x, y in points[collision].tolist()]
+    events = points[collision_events(collision, episode)]
+    if len(events) == 0:
+        return {"centroids": [], "counts": [], "collisions": samples}
+    labels = grid_clusters(events, cell_size, min_events)
+    events, labels = events[labels >= 0], labels[labels >= 0]
+    if len(events) == 0:
+        return {"centroids": [], "counts": [], "collisions": samples}
+    counts = np.bincount(labels)
+    centroids = np.stack(
+        [np.bincount(labels, weights=events[:, 0]), np.bincount(labels, weights=events[:, 1])], axis=1
+    ) / counts[:, None]
+    return {"centroids": centroids.tolist(), "counts": counts.tolist(), "collisions": samples}
+
+
+def kmeans_collision_zones(points):
+    """the former clustering of get_metrics.py, KMeans for every k with the best silhouette score, for comparison"""
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import silhouette_score
+
+    if len(points) <= 3:
+        return {"centroids": [], "counts": []}
+    scores = []
+    for k in range(2, len(points)):
+        labels = KMeans(n_clusters=k, n_init=10).fit(points).labels_
+        scores.append(silhouette_score(points, labels, metric="euclidean"))
+    kmeans = KMeans(n_clusters=int(np.argmax(scores)) + 2, n_init=10).fit(points)
+    _, counts = np.unique(kmeans.labels_, return_counts=True)
+    return {"centroids": kmeans.cluster_centers_.tolist(), "counts": counts.tolist()}
+
+
+def synthetic_collisions(num_events, num_zones, rng, zone_spread=0.3, map_size=25.0, num_single=10):
+    """
+    collision samples around num_zones obstacles and num_single single collisions anywhere on the map, every event
+    lasts 1 to 10 samples
+
+    :return: samples, collision, episode like the arguments of get_collision_zones and the positions of the obstacles
+    """
+    zones = rng.uniform(0, map_size, (num_zones, 2))
+    positions = zones[rng.integers(num_zones, size=num_events)] + rng.normal(0, zone_spread, (num_events, 2))
+    positions[:num_single] = rng.uniform(0, map_size, (min(num_single, num_events), 2))
+    lengths = rng.integers(1, 11, num_events)
+    # every event is followed by a sample without collision, the robot drifts a little while colliding
+    samples = np.repeat(positions, lengths + 1, axis=0) + rng.normal(0, 0.02, (lengths.sum() + num_events, 2))
+    collision = np.ones(len(samples), dtype=bool)
+    collision[np.cumsum(lengths + 1) - 1] = False
+    episode = np.repeat(np.arange(num_events) // 20, lengths + 1)
+    return samples, collision, episode, zones
+
+
+def recovered_zones(centroids, zones, max_distance):
+    """number of obstacles with a centroid within max_distance, every centroid is matched to one obstacle at most"""
+    if len(centroids) == 0:
+        return 0
+    distances = np.linalg.norm(np.asarray(centroids)[:, None] - np.asarray(zones)[None], axis=2)
+    matched_centroids = np.zeros(len(distances), dtype=bool)
+    matched_zones = np.zeros(len(zones), dtype=bool)
+    # match the closest pairs first
+    for centroid, zone in zip(*np.unravel_index(np.argsort(distances, axis=None), distances.shape)):
+        if distances[centroid, zone] > max_distance:
+            break
+        if not matched_centroids[centroid] and not matched_zones[zone]:
+            matched_centroids[centroid], matched_zones[zone] = True, True
+    return int(matched_zones.sum())
+
+
+def benchmark(num_events_list, num_zones, kmeans_max_samples, seed=0, cell_size=1.0):
+    """
+    times the grid clustering and the former KMeans sweep, the zones columns are the number of zones found and the
+    number of obstacles with a zone within cell_size
+    """
+    rng = np.random.default_rng(seed)
+    print("{:>8} {:>8} {:>12} {:>9} {:>12} {:>9}".format(
+        "events", "samples", "grid [s]", "zones", "kmeans [s]", "zones"))
+    for num_events in num_events_list:
+        samples, collision, episode, true_zones = synthetic_collisions(num_events, num_zones, rng)
+        start = time.perf_counter()
+        zones = get_collision_zones(samples, collision, episode, cell_size)
+        grid_time = time.perf_counter() - start
+        grid_zones = "{}/{}".format(
+            len(zones["counts"]), recovered_zones(zones["centroids"], true_zones, cell_size))
+        kmeans_time, kmeans_zones = "-", "-"
+        if collision.sum() <= kmeans_max_samples:
+            start = time.perf_counter()
+            kmeans_centroids = kmeans_collision_zones(samples[collision].tolist())["centroids"]
+            kmeans_time = "{:.4f}".format(time.perf_counter() - start)
+            kmeans_zones = "{}/{}".format(
+                len(kmeans_centroids), recovered_zones(kmeans_centroids, true_zones, cell_size))
+        print("{:>8} {:>8} {:>12.4f} {:>9} {:>12} {:>9}".format(
+            num_events, collision.sum(), grid_time, grid_zones, kmeans_time, kmeans_zones))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark the collision zones on synthetic collision clouds")
+    parser.add_argument("--events", type=int, nargs="+", default=[5, 10, 20, 100, 1000, 10000, 100000])
+    parser.add_argument("--zones", type=int, default=5, help="number of obstacles the robot collides with")
+    parser.add_argument("--kmeans_max_samples", type=int, default=150,
+                        help="largest number of collision samples the former KMeans sweep is run for (needs sklearn)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cell_size", type=float, default=1.0,
+                        help="cell size of the grid and largest distance of a recovered zone to its obstacle in m")
+    args = parser.parse_args()
+    benchmark(args.events, args.zones, args.kmeans_max_samples, args.seed, args.cell_size)
@@ -1,24 +1,46 @@
+import argparse
+import hashlib
 import numpy as np
 import pandas as pd
 import glob  # usefull for listing all files of a type in a directory
 import os
+from concurrent.futures import ProcessPoolExecutor
 import time
 import yaml
 import json
 import warnings
-from sklearn.cluster import KMeans
-from sklearn.metrics import silhouette_score
 import sys
 
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "01_recording")
+)
+from recording import read_recording
+from collision_zones import get_collision_zones
+
+# part of the cache key, increase it when the metrics change
+CACHE_VERSION = 3
+
 
 class get_metrics:
-    def __init__(self):
+    def __init__(self, data_dirs=None, workers=None, use_cache=True, keep_files=False):
+        """
+        :param data_dirs (list): directories of the csv files and recordings, defaults to 01_recording.
+            Only the files in 01_recording are moved into the data folder after the evaluation.
+        :param workers (int): number of processes the files are evaluated in, defaults to the number of cpus
+        :param use_cache (bool): reuse the results of files which were evaluated before, see evaluate_file
+        :param keep_files (bool): do not move the files from 01_recording into the data folder
+        """
         self.dir_path = os.path.dirname(
             os.path.abspath(__file__)
         )  # get path for current file, does not work if os.chdir() was used
         self.data_dir = (
             os.path.dirname(self.dir_path) + "/01_recording"
         )  # parent_directory_path + directory name where csv files are located
+        self.data_dirs = [self.data_dir] if not data_dirs else data_dirs
+        self.cache_dir = self.dir_path + "/cache"
+        self.workers = workers
+        self.use_cache = use_cache
+        self.keep_files = keep_files
         self.now = time.strftime("%y-%m-%d_%H:%M:%S")
         self.read_config()
 
@@ -33,51 +55,36 @@ class get_metrics:
             )
         )
         data = {}
-        files = glob.glob(
-            "{0}/*.csv".format(self.data_dir)
-        )  # get all the csv files paths in the directory where this script is located
+        files = self.get_files()
         if len(files) == 0:
             print(
-                "INFO: No files to evaluate were found in /01_recording. Terminating script."
+                "INFO: No files to evaluate were found in {}. Terminating script.".format(
+                    ", ".join(self.data_dirs)
+                )
             )
             sys.exit()
-        for file in files:  # summarize all the csv files and add to dictionary
-            file_name = file.split("/")[-1].split("_")[
-                :-2
-            ]  # cut off date and time and .csv ending
-            file_name = "_".join(
-                file_name
-            )  # join together to only include local planner, map and obstacle number
-            print(
-                "-------------------------------------------------------------------------------------------------"
-            )
+        # the files are evaluated in parallel, the results are merged in the order of the files
+        if self.workers == 1:
+            results = map(self.evaluate_file, files)
+        else:
+            executor = ProcessPoolExecutor(max_workers=self.workers)
+            results = executor.map(self.evaluate_file, files)
+        for file, (file_name, file_data, cached) in zip(files, results):
+            file_name = self.get_unique_name(file_name, data)
+            data[file_name] = file_data
             print(
-                "INFO: Beginning data tranformation and evaluation for: {}".format(
-                    file_name
+                "INFO: Data tranformation and evaluation {} for: {} ({})".format(
+                    "loaded from cache" if cached else "finished",
+                    file_name,
+                    file.split("/")[-1],
                 )
             )
-            df = self.extend_df(
-                pd.read_csv(
-                    file,
-                    converters={
-                        "laser_scan": self.string_to_float_list,
-                        "action": self.string_to_float_list,
-                    },
-                )
+        if self.workers != 1:
+            executor.shutdown()
+        if not self.keep_files:
+            self.grab_data(
+                [file for file in files if os.path.dirname(file) == self.data_dir]
             )
-            df = self.drop_last_episode(df)
-            data[file_name] = {
-                # "df": df.to_dict(orient = "list"),
-                "summary_df": self.get_summary_df(df).to_dict(orient="list"),
-                "paths_travelled": self.get_paths_travelled(df),
-                "collision_zones": self.get_collision_zones(df),
-            }
-            print(
-                "INFO: Data tranformation and evaluation finished for: {}".format(
-                    file_name
-                )
-            )
-        self.grab_data(files)  # TODO: activate
         with open(
             self.dir_path + "/data_{}.json".format(self.now), "w"
         ) as outfile:
@@ -92,9 +99,87 @@ class get_metrics:
         )
         return data
 
+    def get_unique_name(self, file_name, data):
+        """
+        Runs of the same local planner, map and obstacle number (e.g. former runs merged with --data_dirs) are
+        kept apart, the second one is named <file_name>_run2 and so on in the order of the files. get_plots.py
+        matches the planner, map and obstacle number within the names, the suffix does not change them.
+        """
+        unique_name, run = file_name, 1
+        while unique_name in data:
+            run += 1
+            unique_name = "{}_run{}".format(file_name, run)
+        return unique_name
+
+    def get_files(self):  # csv files and recordings of all data directories, sorted
+        files = []
+        for data_dir in self.data_dirs:
+            csv_files = glob.glob("{0}/*.csv".format(data_dir))
+            # recordings of data_recorder_node.py which were not exported to csv
+            recordings = [
+                recording
+                for recording in glob.glob("{0}/*.rec".format(data_dir))
+                if os.path.splitext(recording)[0] + ".csv" not in csv_files
+            ]
+            files += sorted(csv_files + recordings)
+        return files
+
+    def evaluate_file(self, file):
+        """
+        Computes the metrics of a file, returns the name of the file in the data json (local planner, map and
+        obstacle number), its data and whether it was loaded from the cache.
+
+        The data of every file is cached under the hash of its content and the config, so only new or changed
+        files are evaluated again.
+        """
+        file_name = file.split("/")[-1].split("_")[
+            :-2
+        ]  # cut off date and time and .csv ending
+        file_name = "_".join(
+            file_name
+        )  # join together to only include local planner, map and obstacle number
+        cache_path = os.path.join(self.cache_dir, self.get_file_digest(file) + ".json")
+        if self.use_cache and os.path.isfile(cache_path):
+            with open(cache_path) as cache_file:
+                return file_name, json.load(cache_file), True
+
+        df, scans, actions = self.read_file(file)
+        df = self.extend_df(df, scans, actions)
+        df = self.drop_last_episode(df)
+        file_data = {
+            # "df": df.to_dict(orient = "list"),
+            "summary_df": self.get_summary_df(df).to_dict(orient="list"),
+            "paths_travelled": self.get_paths_travelled(df),
+            "collision_zones": self.get_collision_zones(df),
+        }
+        if self.use_cache:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = "{}.{}.tmp".format(cache_path, os.getpid())
+            with open(tmp_path, "w") as cache_file:
+                json.dump(file_data, cache_file)
+            os.replace(tmp_path, cache_path)
+        return file_name, file_data, False
+
+    def get_file_digest(self, file):  # hash of the content of a file or recording and the config
+        digest = hashlib.sha1()
+        digest.update(
+            json.dumps([CACHE_VERSION, self.config], sort_keys=True).encode()
+        )
+        paths = (
+            sorted(glob.glob(os.path.join(file, "*"))) if os.path.isdir(file) else [file]
+        )
+        for path in paths:
+            digest.update(os.path.basename(path).encode())
+            with open(path, "rb") as content:
+                for chunk in iter(lambda: content.read(1 << 20), b""):
+                    digest.update(chunk)
+        return digest.hexdigest()
+
     def grab_data(
         self, files
     ):  # move data from 01_recording into 02_evaluattion into a data folder with timestamp
+        if len(files) == 0:
+            return
         os.mkdir(self.dir_path + "/data_{}".format(self.now))
         for file in files:
             file_name = file.split("/")[-1]
@@ -103,6 +188,25 @@ class get_metrics:
                 self.dir_path + "/data_{}/".format(self.now) + file_name,
             )  # move file from dir_path to data folder
 
+    def read_file(self, file):
+        """
+        Reads a csv file or a recording of data_recorder_node.py. The laser scans and actions are returned as
+        2D arrays (rows x beams, rows x 3) instead of list cells, the data frame holds the other columns.
+        """
+        if file.endswith(".rec"):
+            data = read_recording(file)
+            scans = np.asarray(data.pop("laser_scan"), dtype=float)
+            actions = np.asarray(data.pop("action"), dtype=float)
+            df = pd.DataFrame(
+                {name: np.asarray(values) for name, values in data.items()}
+            )
+            df["episode"] = df["episode"].astype(np.int64)
+            return df, scans, actions
+        df = pd.read_csv(file)
+        scans = self.string_column_to_array(df.pop("laser_scan"))
+        actions = self.string_column_to_array(df.pop("action"))
+        return df, scans, actions
+
     def string_to_float_list(
         self, df_column
     ):  # convert list from csv saved as string to list of floats
@@ -112,162 +216,148 @@ class get_metrics:
             ).astype(float)
         )
 
-    def extend_df(self, df):
+    def string_column_to_array(self, column):
+        # all lists of the column are parsed at once, np.fromstring rounds like the astype of string_to_float_list
+        lengths = column.str.count(",").to_numpy() + 1
+        if len(lengths) and np.all(lengths == lengths[0]):
+            text = ",".join(column).replace("[", "").replace("]", "")
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                values = np.fromstring(text, sep=",")
+            if len(values) == len(lengths) * lengths[0]:
+                return values.reshape(len(lengths), lengths[0])
+        # lists of different length, e.g. the number of beams changed, or values fromstring can not read
+        return [np.array(self.string_to_float_list(x)) for x in column]
+
+    def extend_df(self, df, scans, actions):
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
-            df["collision"] = [
-                np.any(np.less_equal(x, self.config["robot_radius"]))
-                for x in df["laser_scan"]
-            ]
-            df["action_type"] = self.get_action_type(df)
+            df["collision"] = self.reduce_scans(
+                scans,
+                lambda x, axis=None: np.any(
+                    np.less_equal(x, self.config["robot_radius"]), axis=axis
+                ),
+            )
+            df["action_type"] = self.get_action_type(actions)
             df["computation_time"] = self.get_computation_time(df)
-            df["max_clearing_distance"] = [
-                np.nanmax(x) for x in df["laser_scan"]
-            ]
-            df["min_clearing_distance"] = [
-                np.nanmin(x) for x in df["laser_scan"]
-            ]
-            df["mean_clearing_distance"] = [
-                np.nanmean(x) for x in df["laser_scan"]
-            ]
-            df["median_clearing_distance"] = [
-                np.nanmedian(x) for x in df["laser_scan"]
-            ]
+            df["max_clearing_distance"] = self.reduce_scans(scans, np.nanmax)
+            df["min_clearing_distance"] = self.reduce_scans(scans, np.nanmin)
+            df["mean_clearing_distance"] = self.reduce_scans(scans, np.nanmean)
+            df["median_clearing_distance"] = self.reduce_scans(
+                scans, np.nanmedian
+            )
             df["curvature"], df["normalized_curvature"] = self.get_curvature(df)
             df["roughness"] = self.get_roughness(df)
         return df
 
-    def get_action_type(self, df):
-        action_type_column = []
-        for x in df["action"]:
-            if x[0] == 0.0 and x[1] == 0.0 and x[2] == 0.0:
-                action_type_column.append("stop")
-            elif x[0] == 0.0 and x[1] == 0.0 and x[2] != 0.0:
-                action_type_column.append("rotate")
-            else:
-                action_type_column.append("move")
-        return action_type_column
+    def reduce_scans(self, scans, reduction):
+        # one reduction over the beams of all scans, the values equal the reduction of every single scan
+        if isinstance(scans, list):
+            return [reduction(x) for x in scans]
+        if scans.shape[0] == 0:
+            return np.zeros(0)
+        return reduction(scans, axis=1)
+
+    def get_action_type(self, actions):
+        actions = np.asarray(actions).reshape(-1, 3)
+        stop = (actions[:, 0] == 0.0) & (actions[:, 1] == 0.0)
+        return np.select(
+            [stop & (actions[:, 2] == 0.0), stop & (actions[:, 2] != 0.0)],
+            ["stop", "rotate"],
+            "move",
+        )
 
     def get_computation_time(self, df):
-        computation_time_column = []
-        for i, x in enumerate(df["time"]):
-            if i == 0:
-                computation_time_column.append(np.nan)
-            else:
-                computation_time_column.append(x - df["time"][i - 1])
-        return computation_time_column
+        return np.concatenate([[np.nan], np.diff(df["time"].to_numpy())])
+
+    def get_episode_groups(self, df):
+        """
+        Order of the rows sorted by episode (stable, like np.unique(df["episode"]) with the rows of an episode in
+        their order in df) and the first and last index of every episode in it.
+
+        The per row metrics are in this order, get_curvature, get_roughness and get_jerk return their values
+        episode by episode like the former loops over np.unique(df["episode"]).
+        """
+        episodes = df["episode"].to_numpy()
+        order = np.argsort(episodes, kind="stable")
+        sorted_episodes = episodes[order]
+        starts = np.flatnonzero(
+            np.concatenate([[True], sorted_episodes[1:] != sorted_episodes[:-1]])
+        )
+        ends = np.concatenate([starts[1:], [len(order)]]) - 1
+        return order, starts, ends
+
+    def get_triples(self, df, column_x, column_y):
+        # the values of every row and the two following rows of its episode, nan if they are in another episode
+        order, starts, ends = self.get_episode_groups(df)
+        values = np.stack(
+            [df[column_x].to_numpy()[order], df[column_y].to_numpy()[order]], axis=1
+        ).astype(float)
+        valid = np.arange(len(order)) + 2 <= np.repeat(ends, np.diff(np.append(starts, len(order))))
+        padded = np.concatenate([values, np.full((2, 2), np.nan)])
+        return padded[:-2], padded[1:-1], padded[2:], valid
 
     def get_curvature(self, df):
-        curvature_list = []
-        normalized_curvature_list = []
-        episodes = np.unique(df["episode"])
-        for episode in episodes:
-            points = [
-                list(x)
-                for x in zip(
-                    df.loc[df["episode"] == episode, "robot_pos_x"],
-                    df.loc[df["episode"] == episode, "robot_pos_y"],
-                )
-            ]
-            for i, point in enumerate(points):
-                try:
-                    x = np.array(point)
-                    y = np.array(points[i + 1])
-                    z = np.array(points[i + 2])
-                    curvature_list.append(self.calc_curvature(x, y, z)[0])
-                    normalized_curvature_list.append(
-                        self.calc_curvature(x, y, z)[1]
-                    )
-                    continue
-                except:
-                    curvature_list.append(np.nan)
-                    normalized_curvature_list.append(np.nan)
-                    continue
-        return curvature_list, normalized_curvature_list
+        x, y, z, valid = self.get_triples(df, "robot_pos_x", "robot_pos_y")
+        curvature, normalized_curvature = self.calc_curvature(x.T, y.T, z.T)
+        curvature[~valid] = np.nan
+        normalized_curvature[~valid] = np.nan
+        return curvature, normalized_curvature
 
     def calc_curvature(self, x, y, z):  # Menger curvature of 3 points
         triangle_area = 0.5 * np.abs(
             x[0] * (y[1] - z[1]) + y[0] * (z[1] - x[1]) + z[0] * (x[1] - y[1])
         )
-        with warnings.catch_warnings():
+        with warnings.catch_warnings(), np.errstate(all="ignore"):
             warnings.simplefilter("ignore")
             curvature = (
                 4
                 * triangle_area
                 / (
-                    np.abs(np.linalg.norm(x - y))
-                    * np.abs(np.linalg.norm(y - z))
-                    * np.abs(np.linalg.norm(z - x))
+                    np.abs(self.norm(x - y))
+                    * np.abs(self.norm(y - z))
+                    * np.abs(self.norm(z - x))
                 )
             )
             normalized_curvature = curvature * (
-                np.abs(np.linalg.norm(x - y)) + np.abs(np.linalg.norm(y - z))
+                np.abs(self.norm(x - y)) + np.abs(self.norm(y - z))
             )
         return [curvature, normalized_curvature]
 
+    def norm(self, v):
+        # euclidean norm of 2D vectors (2 x n or 2), equals np.linalg.norm of every vector
+        return np.sqrt(v[0] * v[0] + v[1] * v[1])
+
     def get_roughness(self, df):
-        roughness_list = []
-        episodes = np.unique(df["episode"])
-        for episode in episodes:
-            points = [
-                list(x)
-                for x in zip(
-                    df.loc[df["episode"] == episode, "robot_pos_x"],
-                    df.loc[df["episode"] == episode, "robot_pos_y"],
-                )
-            ]
-            for i, point in enumerate(points):
-                try:
-                    x = np.array(point)
-                    y = np.array(points[i + 1])
-                    z = np.array(points[i + 2])
-                    roughness_list.append(self.calc_roughness(x, y, z))
-                    continue
-                except:
-                    roughness_list.append(np.nan)
-                    continue
-        return roughness_list
+        x, y, z, valid = self.get_triples(df, "robot_pos_x", "robot_pos_y")
+        roughness = self.calc_roughness(x.T, y.T, z.T)
+        roughness[~valid] = np.nan
+        return roughness
 
     def calc_roughness(self, x, y, z):
-        with warnings.catch_warnings():
+        with warnings.catch_warnings(), np.errstate(all="ignore"):
             warnings.simplefilter("ignore")
             triangle_area = 0.5 * np.abs(
                 x[0] * (y[1] - z[1])
                 + y[0] * (z[1] - x[1])
                 + z[0] * (x[1] - y[1])
             )
+            # np.power instead of ** keeps the rounding of the scalar power, ** 2 of an array is a multiplication
             roughness = (
-                2 * triangle_area / np.abs(np.linalg.norm(z - x)) ** 2
+                2 * triangle_area / np.power(np.abs(self.norm(z - x)), 2.0)
             )  # basically height / base (relative height)
         return roughness
 
     def get_jerk(self, df):
-        jerk_list = []
-        episodes = np.unique(df["episode"])
-        for episode in episodes:
-            velocities = [
-                list(x)
-                for x in zip(
-                    df.loc[df["episode"] == episode, "robot_lin_vel_x"],
-                    df.loc[df["episode"] == episode, "robot_lin_vel_y"],
-                )
-            ]
-            for i, vel in enumerate(velocities):
-                try:
-                    v1 = np.array(vel)
-                    v2 = np.array(velocities[i + 1])
-                    v3 = np.array(velocities[i + 2])
-                    jerk_list.append(self.calc_jerk(v1, v2, v3))
-                    continue
-                except:
-                    jerk_list.append(np.nan)
-                    continue
-        return jerk_list
+        v1, v2, v3, valid = self.get_triples(df, "robot_lin_vel_x", "robot_lin_vel_y")
+        jerk = self.calc_jerk(v1.T, v2.T, v3.T)
+        jerk[~valid] = np.nan
+        return jerk
 
     def calc_jerk(self, v1, v2, v3):
-        v1 = (v1[0] ** 2 + v1[1] ** 2) ** 0.5  # total velocity
-        v2 = (v2[0] ** 2 + v2[1] ** 2) ** 0.5
-        v3 = (v3[0] ** 2 + v3[1] ** 2) ** 0.5
+        v1 = np.power(np.power(v1[0], 2.0) + np.power(v1[1], 2.0), 0.5)  # total velocity
+        v2 = np.power(np.power(v2[0], 2.0) + np.power(v2[1], 2.0), 0.5)
+        v3 = np.power(np.power(v3[0], 2.0) + np.power(v3[1], 2.0), 0.5)
         a1 = v2 - v1  # acceleration
         a2 = v3 - v2
         jerk = a2 - a1
@@ -279,11 +369,10 @@ class get_metrics:
         return df
 
     def get_summary_df(self, df):  # NOTE: column specification hardcoded !
-        sum_df = df.groupby(["episode"]).sum()
-        mean_df = df.groupby(["episode"]).mean()
+        mean_df = df.groupby(["episode"]).mean(numeric_only=True)
         summary_df = mean_df
         summary_df["time"] = self.get_time(df)
-        summary_df["collision"] = sum_df["collision"]
+        summary_df["collision"] = df.groupby(["episode"])["collision"].sum()
         summary_df["path_length"] = self.get_path_length(df)
         summary_df["success"], summary_df["done_reason"] = self.get_success(
             summary_df
@@ -305,33 +394,26 @@ class get_metrics:
         return summary_df
 
     def get_time(self, df):
-        time_list = []
-        episodes = np.unique(df["episode"])
-        for episode in episodes:
-            times = list(df.loc[df["episode"] == episode, "time"])
-            time_list.append(times[-1] - times[0])
-        return time_list
+        order, starts, ends = self.get_episode_groups(df)
+        times = df["time"].to_numpy()[order]
+        return list(times[ends] - times[starts])
+
+    def get_episode_sums(self, values, starts, ends):
+        # sums of the values from the second to the last row of every episode, 0 for episodes of a single row. The
+        # values are added one after another like in the former loops, np.sum would add them pairwise
+        return [
+            np.cumsum(values[start + 1 : end + 1])[-1] if end > start else 0
+            for start, end in zip(starts, ends)
+        ]
 
     def get_path_length(self, df):
-        path_length_list = []
-        episodes = np.unique(df["episode"])
-        for episode in episodes:
-            path_length = 0
-            points = list(
-                zip(
-                    df.loc[df["episode"] == episode, "robot_pos_x"],
-                    df.loc[df["episode"] == episode, "robot_pos_y"],
-                )
-            )
-            for i, point in enumerate(points):
-                if i == 0:
-                    continue
-                else:
-                    path_length = path_length + np.linalg.norm(
-                        np.array(point) - np.array(points[i - 1])
-                    )
-            path_length_list.append(path_length)
-        return path_length_list
+        order, starts, ends = self.get_episode_groups(df)
+        points = np.stack(
+            [df["robot_pos_x"].to_numpy()[order], df["robot_pos_y"].to_numpy()[order]]
+        ).astype(float)
+        # length of the step from the previous row, the first row of an episode is skipped by get_episode_sums
+        steps = self.norm(np.diff(points, axis=1, prepend=points[:, :1]))
+        return self.get_episode_sums(steps, starts, ends)
 
     def get_success(self, summary_df):
         success_list = []
@@ -355,81 +437,69 @@ class get_metrics:
         return success_list, done_reason_list
 
     def get_max_curvature(self, df):
-        max_curvature_list = []
-        episodes = np.unique(df["episode"])
-        for episode in episodes:
-            max_curvature_list.append(
-                np.max(df.loc[df["episode"] == episode, "curvature"])
-            )
-        return max_curvature_list
+        # the maximum skips nan like np.max of the former episode series
+        return list(df.groupby(["episode"])["curvature"].max())
 
     def get_AOL(self, df, summary_df):
-        AOL_list = []
-        cusps_list = []
-        episodes = np.unique(df["episode"])
-        for episode in episodes:
-            path_length = summary_df.loc[episode, "path_length"]
-            total_yaw = 0
-            cusps = 0
-            yaws = list(df.loc[df["episode"] == episode, "robot_orientation"])
-            for i, yaw in enumerate(yaws):
-                if i == 0:
-                    continue
-                else:
-                    yaw_diff = np.abs(yaw - yaws[i - 1])
-                    if yaw_diff == np.pi:
-                        cusps += 1
-                    total_yaw += yaw_diff
-            AOL_list.append(total_yaw / path_length)
-            cusps_list.append(cusps)
-        return AOL_list, cusps_list
+        order, starts, ends = self.get_episode_groups(df)
+        yaws = df["robot_orientation"].to_numpy()[order]
+        yaw_diffs = np.abs(np.diff(yaws, prepend=yaws[:1]))
+        yaw_diffs[starts] = 0  # no difference to the previous episode
+        total_yaws = self.get_episode_sums(yaw_diffs, starts, ends)
+        cusps = (
+            np.add.reduceat(yaw_diffs == np.pi, starts) if len(starts) else []
+        )
+        path_lengths = summary_df["path_length"].to_numpy()
+        with np.errstate(all="ignore"):
+            AOL_list = [
+                total_yaw / path_length
+                for total_yaw, path_length in zip(total_yaws, path_lengths)
+            ]
+        return AOL_list, [int(x) for x in cusps]
 
     def get_paths_travelled(self, df):
-        paths_travelled = {}
-        episodes = np.unique(df["episode"])
-        for episode in episodes:
-            paths_travelled[str(episode)] = list(
-                zip(
-                    df.loc[df["episode"] == episode, "robot_pos_x"],
-                    df.loc[df["episode"] == episode, "robot_pos_y"],
-                )
-            )
-        return paths_travelled
-
-    def get_collision_zones(self, df):
-        collisions = df.loc[
-            df["collision"] == True, ["robot_pos_x", "robot_pos_y", "collision"]
-        ]
-        points = [
-            list(x)
-            for x in list(
-                zip(collisions["robot_pos_x"], collisions["robot_pos_y"])
-            )
-        ]
-
-        silhouette_score_list = []
-        kmax = len(points) - 1
-        if len(points) <= 3:
-            return {"centroids": [], "counts": [], "collisions": []}
-        for k in range(2, kmax + 1):
-            kmeans = KMeans(n_clusters=k).fit(points)
-            labels = kmeans.labels_
-            silhouette_score_list.append(
-                silhouette_score(points, labels, metric="euclidean")
-            )
-        best_k = (
-            np.argmax(silhouette_score_list) + 2
-        )  # kmeans here starts at 2 centroids so argmax 0 equals 2 centroids
-        kmeans = KMeans(n_clusters=best_k).fit(points)
-        centroids = kmeans.cluster_centers_
-        _, counts = np.unique(kmeans.labels_, return_counts=True)
+        order, starts, _ = self.get_episode_groups(df)
+        episodes = df["episode"].to_numpy()[order][starts]
+        points = np.stack(
+            [df["robot_pos_x"].to_numpy()[order], df["robot_pos_y"].to_numpy()[order]],
+            axis=1,
+        )
         return {
-            "centroids": centroids.tolist(),
-            "counts": counts.tolist(),
-            "collisions": collisions.values.tolist(),
+            str(episode): episode_points.tolist()
+            for episode, episode_points in zip(
+                episodes, np.split(points, starts[1:])
+            )
         }
 
+    def get_collision_zones(self, df):  # see collision_zones.py
+        return get_collision_zones(
+            df[["robot_pos_x", "robot_pos_y"]].to_numpy(dtype=float),
+            df["collision"].to_numpy(dtype=bool),
+            df["episode"].to_numpy(),
+            cell_size=self.config.get("collision_zone_size", 1.0),
+            min_events=self.config.get("collision_zone_min_events", 3),
+        )
+
 
 if __name__ == "__main__":
-    metrics = get_metrics()
+    parser = argparse.ArgumentParser(
+        description="compute the metrics of the recordings into data_<timestamp>.json"
+    )
+    parser.add_argument(
+        "--data_dirs",
+        type=str,
+        nargs="*",
+        default=None,
+        help="directories of the csv files and recordings, defaults to 01_recording, e.g. 01_recording 02_evaluation/data_* to merge new runs with all former ones",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="defaults to the number of cpus")
+    parser.add_argument("--no_cache", action="store_true", help="evaluate all files again")
+    parser.add_argument("--keep_files", action="store_true", help="do not move the files from 01_recording")
+    args = parser.parse_args()
+    metrics = get_metrics(
+        data_dirs=args.data_dirs,
+        workers=args.workers,
+        use_cache=not args.no_cache,
+        keep_files=args.keep_files,
+    )
     metrics_data = metrics.evaluate_data()
@@ -0,0 +1,91 @@
+# streams the topics the evaluation scripts need from a rosbag into typed numpy arrays
+#
+# Replaces bagpy.bagreader(...).message_by_topic(...), which writes a csv per topic next to the bag that is read back
+# with pandas. The bag is read once for all topics and only the requested fields are kept, appended to compact
+# typed buffers, so the memory grows with the number of values and not with the messages.
+#
+# The time of a message is the time it was recorded, as in the "Time" column of bagpy.
+
+import array
+from operator import attrgetter
+
+import numpy as np
+import rosbag
+
+# fields of the messages as column name: attribute path
+ODOM_FIELDS = {
+    "x": "pose.pose.position.x",
+    "y": "pose.pose.position.y",
+    "vel_x": "twist.twist.linear.x",
+    "vel_y": "twist.twist.linear.y",
+}
+POSE_FIELDS = {"x": "pose.position.x", "y": "pose.position.y"}
+AGENT_STATE_FIELDS = {"x": "pose.position.x", "y": "pose.position.y", "type": "type"}
+RESET_TOPIC = "/scenario_reset"
+
+
+def read_topics(bag_name, topics, marker_topics=(), path_topics=()):
+    """
+    :param bag_name: path of the bag
+    :param topics: dict topic: fields (column name: attribute path), None to read only the times of the messages
+    :param marker_topics: MarkerArray topics, the points of all markers of a message are the columns "x" and "y" and
+        "offsets" holds the index of the first point of every message (one more than messages)
+    :param path_topics: Path topics, the positions of the poses like the points of marker_topics
+    :return: dict topic: dict column: np.ndarray, every topic has the column "time". Topics which are not in the bag
+        have empty columns.
+    """
+    topics = {topic: fields or {} for topic, fields in topics.items()}
+    getters = {topic: [attrgetter(path) for path in fields.values()] for topic, fields in topics.items()}
+    buffers = {topic: _new_buffers(["secs", "nsecs"] + list(fields)) for topic, fields in topics.items()}
+    # points of the messages of the point topics
+    point_getters = {topic: _marker_points for topic in marker_topics}
+    point_getters.update({topic: _path_points for topic in path_topics})
+    for topic in point_getters:
+        buffers[topic] = _new_buffers(["secs", "nsecs", "x", "y", "offsets"])
+        buffers[topic]["offsets"].append(0)
+
+    with rosbag.Bag(bag_name) as bag:
+        for topic, msg, t in bag.read_messages(topics=list(buffers)):
+            columns = buffers[topic]
+            columns["secs"].append(t.secs)
+            columns["nsecs"].append(t.nsecs)
+            if topic in topics:
+                for getter, column in zip(getters[topic], topics[topic]):
+                    columns[column].append(getter(msg))
+            else:
+                for point in point_getters[topic](msg):
+                    columns["x"].append(point.x)
+                    columns["y"].append(point.y)
+                columns["offsets"].append(len(columns["x"]))
+
+    data = {}
+    for topic, columns in buffers.items():
+        data[topic] = {name: np.frombuffer(values, dtype=values.typecode) for name, values in columns.items()}
+        # same as secs + nsecs * 1e-9 for every message, like bagpy
+        data[topic]["time"] = data[topic].pop("secs").astype(np.float64) + data[topic].pop("nsecs") * 1e-9
+    return data
+
+
+def _marker_points(msg):
+    return (point for marker in msg.markers for point in marker.points)
+
+
+def _path_points(msg):
+    return (pose.pose.position for pose in msg.poses)
+
+
+def _new_buffers(columns):
+    return {name: array.array("q" if name in ("secs", "nsecs", "offsets") else "d") for name in columns}
+
+
+def episode_bounds(times, reset_times):
+    """
+    index of the first stamp of every episode in the sorted times, episode k starts with the k-th reset, so
+    times[bounds[k - 1]:bounds[k]] are the stamps of episode k and times[:bounds[0]] were recorded before the first reset
+    """
+    return np.searchsorted(times, reset_times, side="left")
+
+
+def episode_of(times, reset_times):
+    """episode of every stamp: 0 before the first reset, k from the k-th reset on"""
+    return np.searchsorted(reset_times, times, side="right")
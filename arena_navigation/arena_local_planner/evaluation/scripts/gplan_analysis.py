@@ -2,6 +2,7 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import re
+from bag_reader import episode_of
 
 def gplan_to_df(gplan_csv, reset_csv): # takes csv file names as arguments
     gplan = pd.read_csv(gplan_csv) # read csv file
@@ -31,6 +32,16 @@ def gplan_to_df(gplan_csv, reset_csv): # takes csv file names as arguments
 
     return global_plan_df # return cleaned and structured pandas dataframe
 
+def gplan_arrays_to_df(gplan, reset_times): # takes the Path topic of bag_reader.read_topics and the reset stamps
+    global_plan = {}
+    offsets = gplan["offsets"]
+    # x and y inverted to match ros, like gplan_to_df
+    global_plan["pos"] = [np.stack([-gplan["y"][a:b], gplan["x"][a:b]], axis=1).tolist() for a, b in zip(offsets[:-1], offsets[1:])]
+    global_plan["time"] = gplan["time"]
+    # run n lasts from the n-th reset to the next one, like the runs of scenario_eval.newBag.split_runs
+    global_plan["run"] = episode_of(gplan["time"], reset_times)
+    return pd.DataFrame.from_dict(global_plan)
+
 def plot_run(global_plan_df,run = 1, color = "tab:cyan", pwp="True"):
     run_df = global_plan_df.loc[lambda global_plan_df: global_plan_df["run"] == run,:]
     replannings = len(run_df) # number of replannings
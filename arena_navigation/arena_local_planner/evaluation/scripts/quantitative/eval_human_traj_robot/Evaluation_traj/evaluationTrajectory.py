@@ -2,8 +2,6 @@
 import sys
 import copy
 import pprint as pp
-import bagpy
-from bagpy import bagreader
 import pandas as pd
 import json
 #import rospkg
@@ -24,6 +22,8 @@ import rospy
 from visualization_msgs.msg import Marker, MarkerArray
 import pathlib
 import os
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[3]))
+from bag_reader import read_topics, episode_bounds, ODOM_FIELDS, AGENT_STATE_FIELDS, RESET_TOPIC
 from sklearn.cluster import AgglomerativeClustering
 # gplan
 #import gplan_analysis as gplan
@@ -39,8 +39,6 @@ class newBag():
         self.color_circle=colorCircle
         self.color_traj=colorTraj
         self.line_stl=lineStyle
-        # csv dir
-        self.csv_dir         = bag_name.replace(".bag","")
         # bag topics
         self.odom_topic      = "/police/odom"         
         self.collision_topic = "/police/collision"
@@ -55,7 +53,7 @@ class newBag():
 
         self.nc_total = 0
         # eval bags
-        self.bag = bagreader(bag_name)
+        self.bag_name = bag_name
         eps = self.split_runs()
         if len(eps) != 0:
             self.evalPath(file_name, eps) #self.planner,
@@ -76,123 +74,36 @@ class newBag():
 
 
     def split_runs(self):
-        # get odometry
-        odom_csv = self.bag.message_by_topic(self.odom_topic)
-        df_odom  = pd.read_csv(odom_csv, error_bad_lines=False)
-        df_collision = []
-
-        # get topics
-        try:
-            # check if collision was published
-            collision_csv = self.bag.message_by_topic(self.collision_topic)
-            df_collision  = pd.read_csv(collision_csv, error_bad_lines=False)
-
-
-        except Exception as e:
-            # otherwise run had zero collisions
-            print(e)
-
-
-        t_col = []
-   
-        try:
-            for i in range(len(df_collision)): 
-                t_col.append(df_collision.loc[i, "Time"])   
-                
-            self.nc_total = len(t_col)
-            # get reset time
-            reset_csv = self.bag.message_by_topic("/scenario_reset")
-            df_reset  = pd.read_csv(reset_csv, error_bad_lines=False)
-            t_reset   = []
-            for i in range(len(df_reset)): 
-                t_reset.append(df_reset.loc[i, "Time"])        
-
-
-            pose_x = [-2]
-            pose_y = [8]
-            t = [0.0]
-
-            bags = {}
-            # run idx
-            n = 0
-            # collsion pos
-            col_xy = []
-            nc = 0
-            
-            old_x = None
-            old_y = None
-            dist2_oldp = 2500
-
-
-            global start, select_run
-            select_run=[10] #die reihenfolge should be descend
-
-            for i in range(len(df_odom)): 
-                current_time = df_odom.loc[i, "Time"]
-                x = df_odom.loc[i, "pose.pose.position.x"]
-                x = round(x,2)
-                y = df_odom.loc[i, "pose.pose.position.y"]
-                y = round(y,2)
-                reset = t_reset[n]
-                
-                start_x = start[0] + 0.5
-
-                dist2_oldp = 0
-                if old_x != None:
-                    dist2_oldp = math.sqrt((x-old_x)**2+(y-old_y)**2)
-
-                # if current_time > reset-6 and n < len(t_reset)-1 and x < start_x:
-                # if current_time > reset and n < len(t_reset)-1:
-                dis_rt = 5
-                # print('reach here')
-                if dist2_oldp > dis_rt and n < len(t_reset)-1:
-                    n += 1
-
-                    if n == select_run[-1]:
-                        select_run.pop()
-                        bags["run_"+str(n)] = [pose_x, pose_y, t, col_xy] #, subgoal_x, subgoal_y, wpg_x, wpg_y
-
-                    pose_x    = [-2]
-                    pose_y    = [8]
-                    t         = [0.0]
-
-                    col_xy    = []
-
-
-                    old_x = None
-                    old_y = None
-
-                # if n+1 in select_run or len(select_run) == 0 and dist2_oldp < dis_rt:
-                if len(select_run)!=0 and dist2_oldp < dis_rt:
-                  
-                    pose_x.append(x)
-                    pose_y.append(y)
-
-                    t.append(current_time)
-                    # get trajectory
-
-                    # check for col
-                    if len(t_col) > nc:
-                        if current_time >= t_col[nc]:
-                            col_xy.append([x,y])
-                            nc += 1
-
-                    old_x = x
-                    old_y = y
-
-
-            # remove first 
-            if "run_1" in bags:    
-                bags.pop("run_1")
-
-            df = pd.DataFrame(data=bags)
-            run_csv = self.csv_dir + "/" + self.csv_dir.rsplit('/', 1)[-1] + ".csv"
-            df.to_csv(run_csv,index=False)   
-            print("csv created in: " + self.csv_dir)  
-        except Exception as e:
-            # otherwise run had zero collisions
-            print(e)
-            bags = {}
+        global select_run
+        bag = read_topics(self.bag_name, {self.odom_topic: ODOM_FIELDS, self.collision_topic: None, RESET_TOPIC: None})
+        odom    = bag[self.odom_topic]
+        t_reset = bag[RESET_TOPIC]["time"]
+        t_col   = bag[self.collision_topic]["time"]
+        self.nc_total = len(t_col)
+
+        t      = odom["time"]
+        pose_x = np.round(odom["x"], 2)
+        pose_y = np.round(odom["y"], 2)
+
+        # run n lasts from the n-th reset to the next one, the last run is not finished
+        bounds = episode_bounds(t, t_reset)
+        # a collision is at the first pose recorded after it
+        col_idx = np.unique(np.searchsorted(t, t_col, side="left"))
+        col_idx = col_idx[col_idx < len(t)]
+
+        bags = {}
+        select_run=[10]
+        for n in range(1, len(t_reset)):
+            if n not in select_run:
+                continue
+            begin, end = bounds[n-1], bounds[n]
+            if begin == end:
+                continue
+            run_col = col_idx[(col_idx >= begin) & (col_idx < end)]
+            bags["run_"+str(n)] = [
+                [-2] + pose_x[begin:end].tolist(), [8] + pose_y[begin:end].tolist(), [0.0] + t[begin:end].tolist(),
+                np.stack([pose_x[run_col], pose_y[run_col]], axis=1).tolist(),
+            ]
         return bags
     
     def average(self,lst): 
@@ -436,31 +347,17 @@ def eval_run(filetype):
     # file_human = 'HUMAN_2021-07-04-00-25-52.bag' #scenario1
     file_human = 'HUMAN_vh.bag'
 
-    bag_human = bagreader(file_human)
-
-
     num_humans      = 10
     ns_prefix='eval_sim/'
     human_odom_topic_list=[]
     for i in range(num_humans):
         human_odom_topic_list.append(f'/police/pedsim_agent_{i+1}/agent_state')
     
-    # human_odom_csv=[]
-    df_human_odom=[]
+    bag_human = read_topics(file_human, {topic: AGENT_STATE_FIELDS for topic in human_odom_topic_list})
     delete_idx=[8]
-    for i in range(num_humans):
-        # if i in delete_idx:
-        #     continue
-        human_odom_csv = bag_human.message_by_topic(human_odom_topic_list[i])
-        df_human = pd.read_csv(human_odom_csv, error_bad_lines=False)
-        df_human_odom.append(df_human)
     
     t_0_h=None
 
-    t_h=[]
-    x_h=[]
-    y_h=[]
-    t_rate_h=[]
     color=None
     circle2=None
     circle3=None
@@ -470,26 +367,13 @@ def eval_run(filetype):
         if i in delete_idx:
             continue
 
-        for j in range(len(df_human_odom[i])):
-            current_time = df_human_odom[i].loc[j, "Time"]
-            if t_0_h==None:
-                t_0_h=current_time
-            if t_0_h!=None:
-                current_time-=t_0_h
-            current_time=round(current_time,1)
-            x = df_human_odom[i].loc[j, "pose.position.x"]
-            x = round(x,2)
-            y = df_human_odom[i].loc[j, "pose.position.y"]
-            y = round(y,2)
-            ty=df_human_odom[i].loc[j,'type']
-            # print(f'the {i} th human at time of {j} ',ty)
-
-            t_h.append(current_time)            
-            x_h.append(x)
-            y_h.append(y)
-            # print(x)
-            # print(y)
-            # reset = t_reset[n]
+        human = bag_human[human_odom_topic_list[i]]
+        if t_0_h==None:
+            t_0_h=human["time"][0]
+        t_h = np.round(human["time"] - t_0_h, 1)
+        x_h = np.round(human["x"], 2)
+        y_h = np.round(human["y"], 2)
+        ty  = human["type"][-1]
         # print(x_h)
         # ax.plot(y_h, x_h, line_clr, linestyle = line_stl, alpha=0.8)
         if ty==0:
@@ -500,7 +384,7 @@ def eval_run(filetype):
             color1='tab:pink'
         # print(i+1)
         if(t_h[0]<0):
-            t_h+=-t_h[0]
+            t_h-=t_h[0]
         #here I plot the trajectory of one spefic human
         for k,t_e in enumerate(t_h):
             t_rate=t_e/t_h[-1]
@@ -523,11 +407,6 @@ def eval_run(filetype):
                     circle4=circle
                 else:
                     continue
-        
-        t_h=[]
-        x_h=[]
-        t_rate_h=[]
-        y_h=[]
 
     plt.legend(line_traj_legend  + [circle2,circle3,circle4],['Raw','Static Zone','Dyn. Zone','Adult','Child','Elder'],framealpha=0.4,fontsize=15,loc='upper left')
 
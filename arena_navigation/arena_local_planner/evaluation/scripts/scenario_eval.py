@@ -2,7 +2,6 @@
 import sys
 import copy
 import pprint as pp
-from bagpy import bagreader
 import pandas as pd
 import json
 # import rospkg
@@ -25,6 +24,7 @@ import os
 # from sklearn.cluster import AgglomerativeClustering
 # gplan
 import gplan_analysis as gplan
+from bag_reader import read_topics, episode_bounds, ODOM_FIELDS, POSE_FIELDS, RESET_TOPIC
 matplotlib.rcParams.update({'font.size': 15})
 # 
 from termcolor import colored, cprint
@@ -35,8 +35,6 @@ class newBag():
         self.planner         = planner.split("wpg")[0]
         self.wpg             = planner.split("wpg")[1]
         self.file_name       = file_name
-        # csv dir
-        self.csv_dir         = bag_name.replace(".bag","")
         # bag topics
         self.odom_topic      = "/sensorsim/police/odom"
         self.collision_topic = "/police/collision"
@@ -51,7 +49,7 @@ class newBag():
 
 
         # eval bags
-        self.bag = bagreader(bag_name)
+        self.bag_name = bag_name
         eps = self.split_runs()
         if len(eps) != 0:
             self.evalPath(self.planner, file_name, eps)
@@ -87,251 +85,73 @@ class newBag():
         # return
 
     def split_runs(self):
-        # get odometry
-        global plot_sm
+        global plot_sm, select_run, plt_cfg
         print(plot_sm)
-        if plot_sm:
-            sm_csv = self.bag.message_by_topic(self.topic_sm)
-            df_sm  = pd.read_csv(sm_csv, error_bad_lines=False)
+        topics = {
+            self.odom_topic:      ODOM_FIELDS,
+            self.collision_topic: None,
+            self.subgoal_topic:   POSE_FIELDS,
+            self.wpg_topic:       POSE_FIELDS,
+            RESET_TOPIC:          None,
+        }
+        bag = read_topics(self.bag_name, topics, marker_topics=[self.topic_sm] if plot_sm else [],
+                          path_topics=[self.gp_topic] if plt_cfg["plot_gp"] else [])
 
+        if plot_sm:
             # get origin from map yml
             map = (self.file_name.split("_")[0])
-            # remmeber curr dir
-            remember_path = os.path.abspath(os.curdir)
-            # change to map dir
-            os.chdir("../../../../simulator_setup/maps/"+map)
-            path_map = os.path.abspath(os.curdir)
-            # move back to eval path
-            os.chdir(remember_path)
+            path_map = os.path.abspath("../../../../simulator_setup/maps/"+map)
             with open(path_map+"/map.yaml", "r") as ymlfile:
                 map_yml = yaml.safe_load(ymlfile)
             orig_x = map_yml["origin"][0]
             orig_y = map_yml["origin"][1]
 
-            for i in range(len(df_sm)): 
-                df_str = (df_sm.loc[i,"markers"])
-                df_str = df_str.split("points:")[1] 
-                df_str = df_str.split("colors: []")[0]
-                df_str = df_str.replace("z: 0.0","")
-                df_str = df_str.replace("  - ","")
-                df_str = df_str.replace("\n\n","-\n")
-                df_str = df_str.replace("x: ","")
-                df_str = df_str.replace("y: ","")
-                df_str = df_str.replace("    ","")
-                points = df_str.split("-\n")
-
-                # print((df_str))
-                points_x = []
-                points_y = []
-
-                for p in points:
-                    pxy = p.split("\n")
-                    try:
-                        px = round(float(pxy[0]),2) + orig_x
-                        py = round(float(pxy[1]),2) + orig_y
-                        points_x.append(px)
-                        points_y.append(py)
-                    except Exception as e:
-                        print(e)
-
-            
-            img = plt.imread(path_map+"/map.png")
-            # plt.imshow(img, extent=[-16, -50, -6, 17])
+            # the static map is the same in every message, plot the points of the last one
+            sm      = bag[self.topic_sm]
+            first   = sm["offsets"][-2] if len(sm["offsets"]) > 1 else 0
+            points_x = np.round(sm["x"][first:], 2) + orig_x
+            points_y = np.round(sm["y"][first:], 2) + orig_y
             plt.scatter(points_x, points_y, s = 0.2, c = "grey")
 
-            # print(self.csv_dir)
-
-        odom_csv = self.bag.message_by_topic(self.odom_topic)
-        df_odom  = pd.read_csv(odom_csv, error_bad_lines=False)
-
-        df_collision = []
-        df_subg      = []
-        df_gp        = []
-        df_wpg       = []
-
-        # get topics
-        try:
-            # check if collision was published
-            collision_csv = self.bag.message_by_topic(self.collision_topic)
-            df_collision  = pd.read_csv(collision_csv, error_bad_lines=False)
-
-            #check if subgoals in bag
-            subg_csv = self.bag.message_by_topic(self.subgoal_topic)
-            df_subg  = pd.read_csv(subg_csv, error_bad_lines=False)
-
-            gp       = self.bag.message_by_topic(self.gp_topic)
-            # df_gp    = pd.read_csv(gp, error_bad_lines=False)
-
-            wpg      = self.bag.message_by_topic(self.wpg_topic)
-            df_wpg   = pd.read_csv(wpg, error_bad_lines=False)
-
-            # print(df_goal)
-
-
-        except Exception as e:
-            # otherwise run had zero collisions
-            print(e)
-
-
-        t_col = []
-   
-        try:
-            for i in range(len(df_collision)): 
-                t_col.append(df_collision.loc[i, "Time"])   
-                
-            self.nc_total = len(t_col)
-            # get reset time
-            reset_csv = self.bag.message_by_topic("/scenario_reset")
-            df_reset  = pd.read_csv(reset_csv, error_bad_lines=False)
-            t_reset   = []
-            for i in range(len(df_reset)): 
-                t_reset.append(df_reset.loc[i, "Time"])
-
-            # subgoals
-            sg_n = 0
-            subgoal_x = []
-            subgoal_y = []
-
-            # wpg
-            wpg_n = 0
-            wpg_x = []
-            wpg_y = []
-
-            pose_x = []
-            pose_y = []
-            vel_total = []
-            t = []
-
-            bags = {}
-            # run idx
-            n = 0
-            # collsion pos
-            col_xy = []
-            nc = 0
-            
-            old_x = None
-            old_y = None
-            dist2_oldp = 2500
-
-
-            global start, select_run
-
-            for i in range(len(df_odom)): 
-                current_time = df_odom.loc[i, "Time"]
-                x = df_odom.loc[i, "pose.pose.position.x"]
-                x = round(x,2)
-                y = df_odom.loc[i, "pose.pose.position.y"]
-                y = round(y,2)
-                reset = t_reset[n]
-
-                # vel
-                v_lin_x = round(df_odom.loc[i, "twist.twist.linear.x"],2)
-                v_lin_y = round(df_odom.loc[i, "twist.twist.linear.y"],2)
-                v_total = round(abs(v_lin_x**2+v_lin_y**2),2)
-                # v_ang_z = round(df_odom.loc[i, "twist.twist.angular.z"],2)
-
-                # print(vx, vy, vz)
-                # print(reset)
-
-                # check if respawned
-                
-                start_x = start[0] + 0.5
-
-                dist2_oldp = 0
-                if old_x != None:
-                    dist2_oldp = math.sqrt((x-old_x)**2+(y-old_y)**2)
-
-                # if current_time > reset-6 and n < len(t_reset)-1 and x < start_x:
-                # if current_time > reset and n < len(t_reset)-1:
-                res_tol = 1
-                if dist2_oldp > res_tol and n < len(t_reset)-1:
-                    n += 1
-                    # store the run
-                    # print("run_"+str(n))
-                    # print(pose_x)
-                    if n in select_run or len(select_run) == 0:
-                        bags["run_"+str(n)] = [pose_x, pose_y, t, col_xy, subgoal_x, subgoal_y, wpg_x, wpg_y, vel_total]
-
-
-                    # reset 
-                    wpg_x     = []
-                    wpg_y     = []
-
-                    subgoal_x = []
-                    subgoal_y = []
-
-                    pose_x    = []
-                    pose_y    = []
-                    vel_total = []
-                    t         = []
-
-                    col_xy    = []
-
-                    old_x = None
-                    old_y = None
-
-                if n+1 in select_run or len(select_run) == 0 and dist2_oldp < res_tol:
-
-                    # append pos if pose is empty
-                    # if len(pose_x) == 0:
-                    #     pose_x.append(x)
-                    #     pose_y.append(y)
-                    # print("run_"+str(n))
-                   
-                    pose_x.append(x)
-                    pose_y.append(y)
-                    vel_total.append(v_total)
-
-                    t.append(current_time)
-                    # get trajectory
-
-                    # check for col
-                    if len(t_col) > nc:
-                        if current_time >= t_col[nc]:
-                            col_xy.append([x,y])
-                            nc += 1
-
-                    # check for goals
-                    if len(df_subg) > 0:
-                        sg_t = round(df_subg.loc[sg_n, "Time"],3)
-                        sg_x = round(df_subg.loc[sg_n, "pose.position.x"],3)
-                        sg_y = round(df_subg.loc[sg_n, "pose.position.y"],3)
-
-                        if current_time > sg_t and sg_n < len(df_subg) - 1:
-
-                            subgoal_x.append(sg_x)
-                            subgoal_y.append(sg_y)
-
-                            sg_n += 1
-
-                    if len(df_wpg) > 0:
-                        wp_t = round(df_wpg.loc[wpg_n, "Time"],3)
-                        wp_x = round(df_wpg.loc[wpg_n, "pose.position.x"],3)
-                        wp_y = round(df_wpg.loc[wpg_n, "pose.position.y"],3)
-
-                        if current_time > wp_t and wpg_n < len(df_wpg) - 1:
-
-                            wpg_x.append(wp_x)
-                            wpg_y.append(wp_y)
-
-                            wpg_n += 1
-
-                    old_x = x
-                    old_y = y
-
-
-            # remove first 
-            #if "run_1" in bags:    
-                #bags.pop("run_1")
-
-            df = pd.DataFrame(data=bags)
-            run_csv = self.csv_dir + "/" + self.csv_dir.rsplit('/', 1)[-1] + ".csv"
-            df.to_csv(run_csv,index=False)   
-            print("csv created in: " + self.csv_dir)  
-        except Exception as e:
-            # otherwise run had zero collisions
-            print(e)
-            bags = {}
+        odom    = bag[self.odom_topic]
+        t_reset = bag[RESET_TOPIC]["time"]
+        t_col   = bag[self.collision_topic]["time"]
+        self.nc_total = len(t_col)
+        if plt_cfg["plot_gp"]:
+            self.gplan_df = gplan.gplan_arrays_to_df(bag[self.gp_topic], t_reset)
+        if len(t_reset) < 2:
+            return {}
+
+        t      = odom["time"]
+        pose_x = np.round(odom["x"], 2)
+        pose_y = np.round(odom["y"], 2)
+        vel_total = np.round(np.abs(np.round(odom["vel_x"], 2)**2 + np.round(odom["vel_y"], 2)**2), 2)
+
+        # run n lasts from the n-th reset to the next one, the last run is not finished
+        bounds = episode_bounds(t, t_reset)
+        # a collision is at the first pose recorded after it
+        col_idx = np.unique(np.searchsorted(t, t_col, side="left"))
+        col_idx = col_idx[col_idx < len(t)]
+        subg = bag[self.subgoal_topic]
+        wpg  = bag[self.wpg_topic]
+
+        bags = {}
+        for n in range(1, len(t_reset)):
+            if n not in select_run and len(select_run) != 0:
+                continue
+            begin, end = bounds[n-1], bounds[n]
+            if begin == end:
+                continue
+            run_col = col_idx[(col_idx >= begin) & (col_idx < end)]
+            run_subg = slice(*np.searchsorted(subg["time"], t_reset[n-1:n+1], side="left"))
+            run_wpg  = slice(*np.searchsorted(wpg["time"], t_reset[n-1:n+1], side="left"))
+            bags["run_"+str(n)] = [
+                pose_x[begin:end].tolist(), pose_y[begin:end].tolist(), t[begin:end].tolist(),
+                np.stack([pose_x[run_col], pose_y[run_col]], axis=1).tolist(),
+                np.round(subg["x"][run_subg], 3).tolist(), np.round(subg["y"][run_subg], 3).tolist(),
+                np.round(wpg["x"][run_wpg], 3).tolist(), np.round(wpg["y"][run_wpg], 3).tolist(),
+                vel_total[begin:end].tolist(),
+            ]
         return bags
     
     def average(self,lst): 
@@ -344,21 +164,12 @@ class newBag():
         global plt_cfg
 
         if plt_cfg["plot_gp"] and self.plot_gp:
-            csv_dir = self.csv_dir 
-            # print(csv_dir+"/scenario_reset.csv")
-            if os.path.isfile(csv_dir+"/sensorsim-police-gplan.csv") and os.path.isfile(csv_dir+"/scenario_reset.csv"): 
-                esdf = gplan.gplan_to_df(csv_dir+"/sensorsim-police-gplan.csv", csv_dir+"/scenario_reset.csv")
-                gplan.plot_run(esdf, run_n, "tab:cyan",pwp)
-                self.plot_gp = False
+            # global plans of the bag read in split_runs
+            if (self.gplan_df["run"] == run_n).any():
+                gplan.plot_run(self.gplan_df, run_n, "tab:cyan",pwp)
             else:
-                if "empty" in csv_dir:
-                    csv_dir = "../bags/scenarios/run_2/subsample/cadrl_vel_03_empty_obs20"
-                    esdf = gplan.gplan_to_df(csv_dir+"/sensorsim-police-gplan.csv", csv_dir+"/scenario_reset.csv")
-                else:
-                    csv_dir = "../bags/scenarios/run_2/subsample/cadrl_map1_ob20_vel_03_subsampling"
-                    esdf = gplan.gplan_to_df(csv_dir+"/sensorsim-police-gplan.csv", csv_dir+"/scenario_reset.csv")
-                gplan.plot_run(esdf, run_n, "tab:cyan")
-                self.plot_gp = False
+                print("no global plan for run " + str(run_n))
+            self.plot_gp = False
 
     def plot_collisions(self, xya, clr):
         global ax, plt_cfg, lgnd
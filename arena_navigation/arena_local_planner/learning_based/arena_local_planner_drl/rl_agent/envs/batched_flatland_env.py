@@ -0,0 +1,164 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Sequence, Union
+
+import numpy as np
+import rospy
+from stable_baselines3.common.vec_env.base_vec_env import VecEnv, VecEnvIndices
+
+from rl_agent.envs.flatland_gym_env import FlatlandEnv
+
+
+class BatchedFlatlandVecEnv(VecEnv):
+    """
+    Steps the FlatlandEnvs of all training namespaces (sim_1, ..., sim_n) from the training process.
+
+    Instead of one subprocess per namespace, which serializes the step_world call, the observation
+    collection and the pickling of the results for every env, the actions of all envs are published at once,
+    the step_world services of all namespaces are called with one fan-out and the observations are
+    gathered in a single pass afterwards.
+
+    If the envs were created with pipelined=True, every env advances its simulation on its own I/O thread and
+    the observations, rewards and infos of an env are gathered as soon as its step_world call returned, while
+    the calls of the following envs are still in flight. The envs are gathered in a fixed order, therefore the
+    results are the same as in the non-pipelined mode.
+
+    The time of every step is split into:
+        simulation: mean duration of the step_world calls
+        waiting: time the fan-out waited for the slowest namespace on top of that (retries included)
+        messaging: publishing the actions, collecting the observations and computing the rewards
+    """
+
+    def __init__(self, env_fns: List[Callable[[], FlatlandEnv]], max_workers: Union[int, None] = None):
+        """
+        Args:
+            env_fns (List[Callable[[], FlatlandEnv]]): functions creating the envs, e.g. make_envs(...).
+                The envs must be created with debug=True since all of them share the node of the training process.
+            max_workers (int, optional): number of threads of the fan-out. Defaults to the number of envs.
+        """
+        self.envs = [fn() for fn in env_fns]
+        env = self.envs[0]
+        assert env._is_train_mode, "BatchedFlatlandVecEnv needs the step_world service of the training mode"
+        super().__init__(len(self.envs), env.observation_space, env.action_space)
+
+        self._pipelined = env._pipelined
+        self._pool = ThreadPoolExecutor(max_workers=max_workers or self.num_envs)
+        self._actions = None
+        self._timings = {"simulation": 0.0, "waiting": 0.0, "messaging": 0.0}
+        self._num_timed_steps = 0
+
+    @staticmethod
+    def _timed_sim_step(env: FlatlandEnv) -> float:
+        start = time.perf_counter()
+        env.observation_collector.call_service_takeSimStep(env.observation_collector._action_frequency)
+        return time.perf_counter() - start
+
+    def reset(self) -> np.ndarray:
+        obs = list(self._pool.map(lambda env: env.reset(), self.envs))
+        return np.stack(obs)
+
+    def step_async(self, actions: np.ndarray) -> None:
+        self._actions = actions
+
+    def step_wait(self):
+        if self._pipelined:
+            obs, rewards, dones, infos = self._step_pipelined()
+        else:
+            obs, rewards, dones, infos = self._step_batched()
+
+        done_idx = [i for i, done in enumerate(dones) if done]
+        if done_idx:
+            for i in done_idx:
+                # the observation is a row of the ring buffer of the env, which the reset and later steps reuse
+                infos[i]["terminal_observation"] = obs[i].copy()
+            reset_obs = self._pool.map(lambda i: self.envs[i].reset(), done_idx)
+            for i, new_obs in zip(done_idx, reset_obs):
+                obs[i] = new_obs
+
+        return np.stack(obs), np.array(rewards, dtype=np.float32), np.array(dones), infos
+
+    def _step_pipelined(self):
+        t_start = time.perf_counter()
+        for env, action in zip(self.envs, self._actions):
+            env.step_async(action)
+
+        # gather every env as soon as its simulation step is done, in a fixed order
+        results = [env.step_wait() for env in self.envs]
+        t_gathered = time.perf_counter()
+
+        mean_sim_duration = float(np.mean([env.last_sim_duration for env in self.envs]))
+        wait_duration = sum(env.last_wait_duration for env in self.envs)
+        self._timings["simulation"] += mean_sim_duration
+        self._timings["waiting"] += max(wait_duration - mean_sim_duration, 0.0)
+        self._timings["messaging"] += (t_gathered - t_start) - wait_duration
+        self._num_timed_steps += 1
+        return map(list, zip(*results))
+
+    def _step_batched(self):
+        t_start = time.perf_counter()
+        processed_actions = []
+        for env, action in zip(self.envs, self._actions):
+            action = env._process_action(action)
+            env._pub_action(action)
+            env._steps_curr_episode += 1
+            processed_actions.append(action)
+        t_published = time.perf_counter()
+
+        # one fan-out over the step_world services of all namespaces
+        sim_durations = list(self._pool.map(self._timed_sim_step, self.envs))
+        t_simulated = time.perf_counter()
+
+        # single gathering pass
+        results = []
+        for env, action in zip(self.envs, processed_actions):
+            merged_obs, obs_dict = env.observation_collector.collect_observations(last_action=env._last_action)
+            results.append(env._get_step_result(action, merged_obs, obs_dict))
+        obs, rewards, dones, infos = map(list, zip(*results))
+        t_gathered = time.perf_counter()
+
+        mean_sim_duration = float(np.mean(sim_durations))
+        self._timings["simulation"] += mean_sim_duration
+        self._timings["waiting"] += (t_simulated - t_published) - mean_sim_duration
+        self._timings["messaging"] += (t_published - t_start) + (t_gathered - t_simulated)
+        self._num_timed_steps += 1
+        return obs, rewards, dones, infos
+
+    def get_step_timings(self) -> dict:
+        """mean time in seconds spent per step on simulation, waiting and messaging"""
+        return {key: value / max(self._num_timed_steps, 1) for key, value in self._timings.items()}
+
+    def close(self) -> None:
+        timings = self.get_step_timings()
+        rospy.loginfo(
+            "BatchedFlatlandVecEnv mean step time: "
+            + ", ".join(f"{key} {value * 1000:.2f}ms" for key, value in timings.items())
+        )
+        self._pool.shutdown()
+        for env in self.envs:
+            env.close()
+
+    def seed(self, seed: Optional[int] = None) -> List[Union[None, int]]:
+        return [env.seed(seed + idx if seed is not None else None) for idx, env in enumerate(self.envs)]
+
+    def get_attr(self, attr_name: str, indices: VecEnvIndices = None) -> List[Any]:
+        return [getattr(self.envs[i], attr_name) for i in self._get_indices(indices)]
+
+    def set_attr(self, attr_name: str, value: Any, indices: VecEnvIndices = None) -> None:
+        for i in self._get_indices(indices):
+            setattr(self.envs[i], attr_name, value)
+
+    def env_method(self, method_name: str, *method_args, indices: VecEnvIndices = None, **method_kwargs) -> List[Any]:
+        return [getattr(self.envs[i], method_name)(*method_args, **method_kwargs) for i in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class: type, indices: VecEnvIndices = None) -> List[bool]:
+        return [isinstance(self.envs[i], wrapper_class) for i in self._get_indices(indices)]
+
+    def get_images(self) -> Sequence[np.ndarray]:
+        return [env.render(mode="rgb_array") for env in self.envs]
+
+    def _get_indices(self, indices: VecEnvIndices) -> Sequence[int]:
+        if indices is None:
+            return range(self.num_envs)
+        if isinstance(indices, int):
+            return [indices]
+        return indices
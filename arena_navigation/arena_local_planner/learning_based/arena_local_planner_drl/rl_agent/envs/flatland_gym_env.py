@@ -5,6 +5,7 @@ import gym
 from gym import spaces
 from gym.spaces import space
 from typing import Union
+from concurrent.futures import ThreadPoolExecutor
 from stable_baselines3.common.env_checker import check_env
 import yaml
 from rl_agent.utils.observation_collector import ObservationCollector
@@ -42,6 +43,7 @@ class FlatlandEnv(gym.Env):
         task_mode: str = "staged",
         PATHS: dict = dict(),
         extended_eval: bool = False,
+        pipelined: bool = False,
         *args,
         **kwargs,
     ):
@@ -58,17 +60,20 @@ class FlatlandEnv(gym.Env):
             safe_dist (float, optional): [description]. Defaults to None.
             goal_radius (float, optional): [description]. Defaults to 0.1.
             extended_eval (bool): more episode info provided, no reset when crashing
+            pipelined (bool): advance the simulation on a dedicated I/O thread, so that step_async returns
+                right after publishing the action and step_wait collects the results (train mode only)
         """
         super(FlatlandEnv, self).__init__()
 
         self.ns = ns
-        try:
-            # given every environment enough time to initialize, if we dont put sleep,
-            # the training script may crash.
-            ns_int = int(ns.split("_")[1])
-            time.sleep(ns_int * 2)
-        except Exception:
-            rospy.logwarn(f"Can't not determinate the number of the environment, training script may crash!")
+        if not debug:
+            try:
+                # given every environment enough time to initialize, if we dont put sleep,
+                # the training script may crash.
+                ns_int = int(ns.split("_")[1])
+                time.sleep(ns_int * 2)
+            except Exception:
+                rospy.logwarn(f"Can't not determinate the number of the environment, training script may crash!")
 
         # process specific namespace in ros system
         self.ns_prefix = "" if (ns == "" or ns is None) else "/" + ns + "/"
@@ -124,6 +129,13 @@ class FlatlandEnv(gym.Env):
             self._service_name_step = f"{self.ns_prefix}step_world"
             self._sim_step_client = rospy.ServiceProxy(self._service_name_step, StepWorld)
 
+        # the single worker keeps the step_world calls of this env in order
+        self._pipelined = pipelined and self._is_train_mode
+        self._io_executor = ThreadPoolExecutor(max_workers=1) if self._pipelined else None
+        self._pending_step = None
+        self.last_sim_duration = 0.0
+        self.last_wait_duration = 0.0
+
         # instantiate task manager
         self.task = get_predefined_task(ns, mode=task_mode, start_stage=kwargs["curr_stage"], PATHS=PATHS)
 
@@ -131,6 +143,7 @@ class FlatlandEnv(gym.Env):
         self._episode = 0
         self._max_steps_per_episode = max_steps_per_episode
         self._last_action = np.array([0, 0, 0])  # linear x, linear y, angular z
+        self._last_obs_dict = None
 
         # for extended eval
         self._action_frequency = 1 / rospy.get_param("/robot_action_rate")
@@ -243,9 +256,11 @@ class FlatlandEnv(gym.Env):
                         1   -   collision with obstacle
                         2   -   goal reached
         """
-        if self._is_action_space_discrete:
-            action = self._translate_disc_action(action)
-        action = self._extend_action_array(action)
+        if self._pipelined:
+            self.step_async(action)
+            return self.step_wait()
+
+        action = self._process_action(action)
 
         self._pub_action(action)
         # print(f"Linear: {action[0]}, Angular: {action[1]}")
@@ -253,7 +268,42 @@ class FlatlandEnv(gym.Env):
 
         # wait for new observations
         merged_obs, obs_dict = self.observation_collector.get_observations(last_action=self._last_action)
+        return self._get_step_result(action, merged_obs, obs_dict)
+
+    def step_async(self, action: np.ndarray):
+        """publishes the action and hands the simulation step over to the I/O thread (pipelined mode)"""
+        assert self._pipelined, "step_async is only available in pipelined mode"
+        assert self._pending_step is None, "step_wait has to be called before the next step_async"
+        action = self._process_action(action)
+        self._pub_action(action)
+        self._steps_curr_episode += 1
+        self._pending_step = (action, self._io_executor.submit(self._timed_sim_step))
+
+    def step_wait(self):
+        """waits for the simulation step started by step_async and returns the results of the step"""
+        action, sim_step = self._pending_step
+        start = time.perf_counter()
+        self.last_sim_duration = sim_step.result()
+        self.last_wait_duration = time.perf_counter() - start
+        self._pending_step = None
+
+        merged_obs, obs_dict = self.observation_collector.collect_observations(last_action=self._last_action)
+        return self._get_step_result(action, merged_obs, obs_dict)
+
+    def _timed_sim_step(self) -> float:
+        start = time.perf_counter()
+        self.observation_collector.call_service_takeSimStep(self.observation_collector._action_frequency)
+        return time.perf_counter() - start
+
+    def _process_action(self, action: np.ndarray) -> np.ndarray:
+        if self._is_action_space_discrete:
+            action = self._translate_disc_action(action)
+        return self._extend_action_array(action)
+
+    def _get_step_result(self, action: np.ndarray, merged_obs: np.ndarray, obs_dict: dict):
+        """calculate reward, done and info of a step from the observations received after the action was applied"""
         self._last_action = action
+        self._last_obs_dict = obs_dict
 
         # calculate reward
         reward, reward_info = self.reward_calculator.get_reward(
@@ -305,6 +355,8 @@ class FlatlandEnv(gym.Env):
         # set task
         # regenerate start position end goal position of the robot and change the obstacles accordingly
         self._episode += 1
+        if self._pending_step is not None:
+            self.step_wait()
         self.agent_action_pub.publish(Twist())
         if self._is_train_mode:
             self._sim_step_client()
@@ -320,11 +372,15 @@ class FlatlandEnv(gym.Env):
             self._safe_dist_counter = 0
             self._collisions = 0
 
-        obs, _ = self.observation_collector.get_observations()
+        obs, self._last_obs_dict = self.observation_collector.get_observations()
         return obs  # reward, done, info can't be included
 
     def close(self):
-        pass
+        if self._io_executor is not None:
+            self._io_executor.shutdown()
+        sync_statistics = self.observation_collector.get_sync_statistics()
+        if sync_statistics:
+            rospy.loginfo(f"[{self.ns}] observation synchronization: {sync_statistics}")
 
     def _update_eval_statistics(self, obs_dict: dict, reward_info: dict):
         """
@@ -0,0 +1,192 @@
+from typing import Any, List, Optional, Sequence, Union
+
+import gym
+import numpy as np
+from stable_baselines3.common.vec_env.base_vec_env import VecEnv, VecEnvIndices
+
+from rl_agent.envs.headless_sim import HeadlessSimulator, load_map_yaml
+from rl_agent.envs.robot_configuration import YamlRobotConfiguration
+from rl_agent.utils.reward import BatchedRewardCalculator
+
+
+class HeadlessFlatlandEnv(YamlRobotConfiguration, VecEnv):
+    """
+    Vectorized counterpart of FlatlandEnv which runs all environments in-process on a HeadlessSimulator.
+    No roscore, flatland_server or task generator is needed, therefore the environments are ready instantly.
+
+    Observations, action spaces, discrete action translation and rewards are the same as in FlatlandEnv.
+    The goal is fed as subgoal and no global plan is available, so the global plan related reward terms
+    of rule_02 and upwards are skipped.
+    """
+
+    def __init__(
+        self,
+        n_envs: int,
+        reward_fnc: str,
+        is_action_space_discrete: bool,
+        map_yaml_path: str,
+        safe_dist: float = None,
+        goal_radius: float = 0.1,
+        max_steps_per_episode: int = 100,
+        PATHS: dict = dict(),
+        actions_in_obs: bool = False,
+        action_frequency: float = 0.2,
+        num_obstacles: int = 0,
+        seed: Union[int, None] = None,
+        **kwargs,
+    ):
+        """
+        Args:
+            n_envs (int): number of environments simulated in parallel
+            reward_fnc (str): name of the reward rule, see RewardCalculator
+            is_action_space_discrete (bool): [description]
+            map_yaml_path (str): map_server style yaml file of the map to train on
+            safe_dist (float, optional): [description]. Defaults to None.
+            goal_radius (float, optional): [description]. Defaults to 0.1.
+            max_steps_per_episode (int, optional): Defaults to 100.
+            PATHS (dict): script relevant paths, "robot_setting" and "robot_as" are needed
+            actions_in_obs (bool, optional): append the last action to the observation. Defaults to False.
+            action_frequency (float, optional): simulated time per step, 1 / robot_action_rate. Defaults to 0.2.
+            num_obstacles (int, optional): number of obstacles per environment. Defaults to 0.
+            seed (int, optional): seed of the simulator
+            kwargs: passed to HeadlessSimulator
+        """
+        self._is_action_space_discrete = is_action_space_discrete
+        self._action_in_obs = actions_in_obs
+        self._action_frequency = action_frequency
+        self.setup_by_configuration(PATHS["robot_setting"], PATHS["robot_as"])
+
+        self.sim = HeadlessSimulator(
+            load_map_yaml(map_yaml_path),
+            n_envs,
+            self._laser_num_beams,
+            self._laser_max_range,
+            self._footprint_radius,
+            angle_min=self._laser_angle_min,
+            angle_increment=self._laser_angle_increment,
+            holonomic=self._holonomic,
+            num_obstacles=num_obstacles,
+            seed=seed,
+            **kwargs,
+        )
+
+        # same robot radius and safe distance as FlatlandEnv
+        self._robot_radius = self._footprint_radius + 0.25
+        if safe_dist is None:
+            safe_dist = self._robot_radius + 0.1
+        self.reward_calculator = BatchedRewardCalculator(
+            n_envs,
+            holonomic=self._holonomic,
+            robot_radius=self._robot_radius,
+            safe_dist=safe_dist,
+            goal_radius=goal_radius,
+            rule=reward_fnc,
+        )
+
+        obs_size = self._laser_num_beams + 2 + (3 if self._action_in_obs else 0)
+        observation_space = self._get_observation_space()
+        assert observation_space.shape == (obs_size,)
+        super().__init__(n_envs, observation_space, self.action_space)
+
+        self._max_steps_per_episode = max_steps_per_episode
+        self._steps_curr_episode = np.zeros(n_envs, dtype=np.int64)
+        self._last_actions = np.zeros((n_envs, 3))
+        self._obs = np.zeros((n_envs, obs_size), dtype=np.float32)
+        self._actions = None
+
+    def _extend_actions(self, actions: np.ndarray) -> np.ndarray:
+        """translate the actions of the agent to (N, 3) arrays of linear x, linear y and angular z"""
+        if self._is_action_space_discrete:
+            return self._discrete_actions[np.asarray(actions, dtype=np.int64).reshape(-1)]
+        actions = np.asarray(actions, dtype=np.float64).reshape(self.num_envs, -1)
+        if self._holonomic:
+            return actions
+        extended = np.zeros((self.num_envs, 3))
+        extended[:, 0] = actions[:, 0]
+        extended[:, 2] = actions[:, 1]
+        return extended
+
+    def _collect_observations(self):
+        scans = self.sim.get_scans()
+        rho, theta = self.sim.get_goals_in_robot_frame()
+        num_beams = self._laser_num_beams
+        self._obs[:, :num_beams] = scans
+        self._obs[:, num_beams] = rho
+        self._obs[:, num_beams + 1] = theta
+        if self._action_in_obs:
+            self._obs[:, num_beams + 2 :] = self._last_actions
+        return scans, rho, theta
+
+    def reset(self) -> np.ndarray:
+        self.sim.reset()
+        self.reward_calculator.reset()
+        self._steps_curr_episode[:] = 0
+        self._last_actions[:] = 0
+        self._collect_observations()
+        return self._obs.copy()
+
+    def step_async(self, actions: np.ndarray) -> None:
+        self._actions = self._extend_actions(actions)
+
+    def step_wait(self):
+        actions = self._actions
+        self.sim.step(actions, self._action_frequency)
+        self._steps_curr_episode += 1
+
+        scans, rho, theta = self._collect_observations()
+        self._last_actions[:] = actions
+
+        rewards, reward_info = self.reward_calculator.get_reward(scans, np.stack([rho, theta], axis=1), actions)
+        rewards = rewards.astype(np.float32)
+        dones = reward_info["is_done"]
+        infos = [{} for _ in range(self.num_envs)]
+        for i in np.flatnonzero(dones):
+            infos[i]["done_reason"] = int(reward_info["done_reason"][i])
+            infos[i]["is_success"] = int(reward_info["is_success"][i])
+
+        timeout = self._steps_curr_episode > self._max_steps_per_episode
+        for i in np.flatnonzero(timeout & ~dones):
+            infos[i]["done_reason"] = 0
+            infos[i]["is_success"] = 0
+        dones |= timeout
+
+        obs = self._obs.copy()
+        if dones.any():
+            for i in np.flatnonzero(dones):
+                infos[i]["terminal_observation"] = obs[i].copy()
+            self.reward_calculator.reset(dones)
+            self.sim.reset(dones)
+            self._steps_curr_episode[dones] = 0
+            self._last_actions[dones] = 0
+            self._collect_observations()
+            obs[dones] = self._obs[dones]
+        return obs, rewards, dones, infos
+
+    def close(self) -> None:
+        pass
+
+    def seed(self, seed: Optional[int] = None) -> List[Union[None, int]]:
+        self.sim._rng = np.random.default_rng(seed)
+        return [seed] * self.num_envs
+
+    def get_attr(self, attr_name: str, indices: VecEnvIndices = None) -> List[Any]:
+        return [getattr(self, attr_name) for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name: str, value: Any, indices: VecEnvIndices = None) -> None:
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name: str, *method_args, indices: VecEnvIndices = None, **method_kwargs) -> List[Any]:
+        return [getattr(self, method_name)(*method_args, **method_kwargs) for _ in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class: type, indices: VecEnvIndices = None) -> List[bool]:
+        return [False for _ in self._get_indices(indices)]
+
+    def get_images(self) -> Sequence[np.ndarray]:
+        raise NotImplementedError("HeadlessFlatlandEnv does not support rendering")
+
+    def _get_indices(self, indices: VecEnvIndices) -> Sequence[int]:
+        if indices is None:
+            return range(self.num_envs)
+        if isinstance(indices, int):
+            return [indices]
+        return indices
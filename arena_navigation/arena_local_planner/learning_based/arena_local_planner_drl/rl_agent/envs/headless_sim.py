@@ -0,0 +1,289 @@
+import math
+import warnings
+from typing import Tuple, Union
+
+import numpy as np
+import scipy.ndimage
+from nav_msgs.msg import OccupancyGrid
+
+from task_generator.utils import generate_freespace_indices, load_map_yaml
+
+
+class HeadlessSimulator:
+    """
+    A pure NumPy 2D simulator stepping N environments which share the same map at once.
+    It replaces flatland_server for training: the laser scan is raycasted on the occupancy grid,
+    the robot is integrated with diff-drive or holonomic kinematics and the obstacles are circles
+    which move like the flatland plugin "RandomMove". Walls and obstacles block the robot, the
+    dynamic obstacles turn around at walls and at the robot.
+
+    All states are stored as arrays with the environment index as first dimension:
+        robot_pose (N, 3): x, y, theta
+        goal (N, 2): x, y
+        obstacles_pos (N, M, 2), obstacles_heading (N, M), obstacles_radius (N, M), obstacles_vel (N, M)
+    """
+
+    def __init__(
+        self,
+        map_: OccupancyGrid,
+        n_envs: int,
+        num_beams: int,
+        laser_range: float,
+        robot_radius: float,
+        angle_min: float = 0.0,
+        angle_increment: float = None,
+        holonomic: bool = False,
+        num_obstacles: int = 0,
+        p_dynamic: float = 0.4,
+        obstacle_radius_range: Tuple[float, float] = (0.1, 0.3),
+        obstacle_linear_vel: float = 0.3,
+        obstacle_angular_vel_max: float = math.pi / 6,
+        step_size: float = 0.01,
+        min_start_goal_dist: float = 1.0,
+        seed: Union[int, None] = None,
+    ):
+        """
+        Args:
+            map_ (OccupancyGrid): map of all environments, e.g. provided by load_map_yaml
+            n_envs (int): number of environments simulated in parallel
+            num_beams (int): number of laser beams
+            laser_range (float): maximum range of the laser
+            robot_radius (float): radius of the robot footprint, used to block the robot at walls and obstacles
+            angle_min (float, optional): angle of the first beam in the robot frame. Defaults to 0.
+            angle_increment (float, optional): angle between two beams. Defaults to a full circle.
+            holonomic (bool, optional): if False the lateral velocity of the action is ignored.
+            num_obstacles (int, optional): number of obstacles per environment. Defaults to 0.
+            p_dynamic (float, optional): ratio of dynamic obstacles. Defaults to 0.4.
+            obstacle_radius_range (Tuple[float, float], optional): radius range of the obstacles.
+            obstacle_linear_vel (float, optional): linear velocity of the dynamic obstacles.
+            obstacle_angular_vel_max (float, optional): maximum angular velocity the dynamic obstacles
+                apply when they got stuck (same semantics as the RandomMove plugin).
+            step_size (float, optional): integration step of the physics. Defaults to 0.01.
+            min_start_goal_dist (float, optional): minimum distance between start and goal. Defaults to 1.
+            seed (int, optional): seed of the random generator.
+        """
+        self.n_envs = n_envs
+        self.num_beams = num_beams
+        self.laser_range = laser_range
+        self.robot_radius = robot_radius
+        self.holonomic = holonomic
+        self.step_size = step_size
+        self.min_start_goal_dist = min_start_goal_dist
+        self.obstacle_radius_range = obstacle_radius_range
+        self.obstacle_linear_vel = obstacle_linear_vel
+        self.obstacle_angular_vel_max = obstacle_angular_vel_max
+        self._rng = np.random.default_rng(seed)
+
+        if angle_increment is None:
+            angle_increment = 2 * np.pi / num_beams
+        self._beam_angles = angle_min + angle_increment * np.arange(num_beams)
+
+        self.update_map(map_)
+
+        self.robot_pose = np.zeros((n_envs, 3))
+        self.goal = np.zeros((n_envs, 2))
+        self.num_obstacles = num_obstacles
+        self.obstacles_pos = np.zeros((n_envs, num_obstacles, 2))
+        self.obstacles_heading = np.zeros((n_envs, num_obstacles))
+        self.obstacles_radius = np.zeros((n_envs, num_obstacles))
+        self.obstacles_vel = np.zeros((n_envs, num_obstacles))
+        self._is_dynamic = np.arange(num_obstacles) < int(num_obstacles * p_dynamic)
+
+    def update_map(self, new_map: OccupancyGrid):
+        self.map = new_map
+        self._resolution = new_map.info.resolution
+        self._origin = np.array([new_map.info.origin.position.x, new_map.info.origin.position.y])
+        self._height, self._width = new_map.info.height, new_map.info.width
+        # unknown cells are treated as occupied, as get_random_pos_on_map does
+        self._occupied = np.reshape(new_map.data, (self._height, self._width)) != 0
+        # a tuple stores the indices of the non-occupied spaces. format ((y,....),(x,...)
+        self._free_space_indices = generate_freespace_indices(new_map)
+        # distance of every cell to the closest occupied cell in meters
+        self._clearance = scipy.ndimage.distance_transform_edt(~self._occupied) * self._resolution
+
+    def reset(self, env_mask: Union[np.ndarray, None] = None):
+        """reset start position, goal and obstacles of the selected environments.
+
+        Args:
+            env_mask (np.ndarray, optional): boolean mask of shape (N,), if None all environments are reset
+        """
+        env_idx = np.arange(self.n_envs) if env_mask is None else np.flatnonzero(env_mask)
+        n = len(env_idx)
+        if n == 0:
+            return
+
+        # same clearances as RobotManager.set_start_pos_goal_pos
+        start = self.sample_free_positions(n, 2 * self.robot_radius)
+        goal = self.sample_free_positions(n, 2 * self.robot_radius)
+        too_close = np.hypot(*(start - goal).T) < self.min_start_goal_dist
+        while too_close.any():
+            goal[too_close] = self.sample_free_positions(too_close.sum(), 2 * self.robot_radius)
+            too_close = np.hypot(*(start - goal).T) < self.min_start_goal_dist
+
+        self.robot_pose[env_idx, :2] = start
+        self.robot_pose[env_idx, 2] = self._rng.uniform(-np.pi, np.pi, n)
+        self.goal[env_idx] = goal
+
+        if self.num_obstacles > 0:
+            m = self.num_obstacles
+            radius = self._rng.uniform(*self.obstacle_radius_range, (n, m))
+            # keep the obstacles away from start and goal, see RandomTask.reset
+            forbidden = np.stack([start, goal], axis=1)
+            forbidden_radius = self.robot_radius + radius.max()
+            pos = self.sample_free_positions(n * m, radius.max()).reshape(n, m, 2)
+            invalid = self._in_zones(pos, forbidden, forbidden_radius)
+            n_tries = 0
+            while invalid.any() and n_tries < 100:
+                pos[invalid] = self.sample_free_positions(invalid.sum(), radius.max())
+                invalid = self._in_zones(pos, forbidden, forbidden_radius)
+                n_tries += 1
+            vel = np.where(self._is_dynamic, self.obstacle_linear_vel, 0.0) * np.ones((n, m))
+            if invalid.any():
+                # park the obstacles which still block start or goal outside of the map for this episode, farther
+                # than the laser range from the map, without radius and velocity they are neither seen nor hit
+                warnings.warn(f"{invalid.sum()} of the obstacles could not be placed away from start and goal, "
+                              "they are left out of the episode")
+                pos[invalid] = self._origin - (self._width + self._height) * self._resolution - self.laser_range
+                radius[invalid] = 0.0
+                vel[invalid] = 0.0
+            self.obstacles_pos[env_idx] = pos
+            self.obstacles_radius[env_idx] = radius
+            self.obstacles_heading[env_idx] = self._rng.uniform(-np.pi, np.pi, (n, m))
+            self.obstacles_vel[env_idx] = vel
+
+    @staticmethod
+    def _in_zones(pos: np.ndarray, zones: np.ndarray, radius: float) -> np.ndarray:
+        # pos (n, m, 2), zones (n, k, 2) -> (n, m)
+        dist = np.linalg.norm(pos[:, :, None, :] - zones[:, None, :, :], axis=-1)
+        return (dist < radius).any(axis=-1)
+
+    def sample_free_positions(self, num: int, safe_dist: float) -> np.ndarray:
+        """draw positions whose distance to the next occupied cell is at least safe_dist.
+
+        Args:
+            num (int): number of positions
+            safe_dist (float): minimum clearance in meters
+        Returns:
+            positions (np.ndarray): array of shape (num, 2) in meters
+        """
+        indices_y, indices_x = self._free_space_indices
+        valid = self._clearance[indices_y, indices_x] >= safe_dist
+        if not valid.any():
+            raise Exception("cann't find any no-occupied space please check the map information")
+        indices_y, indices_x = indices_y[valid], indices_x[valid]
+        idx = self._rng.integers(0, len(indices_y), num)
+        return np.stack([indices_x[idx], indices_y[idx]], axis=1) * self._resolution + self._origin
+
+    def _clearance_at(self, pos: np.ndarray) -> np.ndarray:
+        """clearance at positions (..., 2) in meters, positions outside of the map have zero clearance"""
+        cells = np.floor((pos - self._origin) / self._resolution).astype(np.int64)
+        inside = (
+            (cells[..., 0] >= 0) & (cells[..., 0] < self._width) & (cells[..., 1] >= 0) & (cells[..., 1] < self._height)
+        )
+        clearance = np.zeros(pos.shape[:-1])
+        clearance[inside] = self._clearance[cells[..., 1][inside], cells[..., 0][inside]]
+        return clearance
+
+    def step(self, actions: np.ndarray, dt: float):
+        """advance all environments by dt seconds.
+
+        Args:
+            actions (np.ndarray): array of shape (N, 3) with linear x, linear y and angular z velocity
+                in the robot frame, same layout as FlatlandEnv publishes
+            dt (float): simulated time
+        """
+        actions = np.asarray(actions, dtype=np.float64)
+        vel_x, vel_y, vel_ang = actions[:, 0], actions[:, 1], actions[:, 2]
+        if not self.holonomic:
+            vel_y = np.zeros_like(vel_x)
+
+        n_substeps = max(1, int(round(dt / self.step_size)))
+        h = dt / n_substeps
+        for _ in range(n_substeps):
+            theta = self.robot_pose[:, 2] + vel_ang * h / 2
+            cos, sin = np.cos(theta), np.sin(theta)
+            new_xy = self.robot_pose[:, :2] + h * np.stack([vel_x * cos - vel_y * sin, vel_x * sin + vel_y * cos], 1)
+            # the robot is blocked by walls and obstacles like a rigid body in flatland
+            free = self._clearance_at(new_xy) >= self.robot_radius
+            if self.num_obstacles > 0:
+                free &= ~self._hits_obstacles(self.robot_pose[:, :2], new_xy).any(axis=1)
+            self.robot_pose[free, :2] = new_xy[free]
+            self.robot_pose[:, 2] = (self.robot_pose[:, 2] + vel_ang * h + np.pi) % (2 * np.pi) - np.pi
+
+            if self.num_obstacles > 0:
+                self._move_obstacles(h)
+
+    def _hits_obstacles(self, robot_xy: np.ndarray, new_robot_xy: np.ndarray, obstacles_pos: np.ndarray = None,
+                        new_obstacles_pos: np.ndarray = None) -> np.ndarray:
+        """whether robot and obstacle (N, M) touch after the move and get closer, so that a robot or an obstacle
+        which already touches the other one can still move away"""
+        if obstacles_pos is None:
+            obstacles_pos = new_obstacles_pos = self.obstacles_pos
+        dist = np.linalg.norm(obstacles_pos - robot_xy[:, None], axis=-1)
+        new_dist = np.linalg.norm(new_obstacles_pos - new_robot_xy[:, None], axis=-1)
+        return (new_dist < self.robot_radius + self.obstacles_radius) & (new_dist < dist)
+
+    def _move_obstacles(self, h: float):
+        heading = self.obstacles_heading
+        step = self.obstacles_vel[..., None] * h * np.stack([np.cos(heading), np.sin(heading)], -1)
+        new_pos = self.obstacles_pos + step
+        robot_xy = self.robot_pose[:, :2]
+        blocked = (self._clearance_at(new_pos) < self.obstacles_radius) | self._hits_obstacles(
+            robot_xy, robot_xy, self.obstacles_pos, new_pos
+        )
+        moved = ~blocked & (self.obstacles_vel > 0)
+        self.obstacles_pos[moved] = new_pos[moved]
+        # like RandomMove: a stuck obstacle turns around with a random angular offset to escape
+        stuck = blocked & (self.obstacles_vel > 0)
+        if stuck.any():
+            max_turn = self.obstacle_angular_vel_max
+            heading[stuck] += np.pi + self._rng.uniform(-max_turn, max_turn, stuck.sum())
+
+    def get_scans(self) -> np.ndarray:
+        """raycast the laser scans of all environments.
+
+        Returns:
+            scans (np.ndarray): array of shape (N, num_beams) in float32, beams without hit return the laser range
+        """
+        angles = self.robot_pose[:, 2:3] + self._beam_angles  # (N, B)
+        cos, sin = np.cos(angles), np.sin(angles)
+
+        # walls: sphere tracing on the clearance map, every beam advances by the free space around it
+        # until it enters an occupied cell or leaves the map
+        dir_x, dir_y = cos.ravel(), sin.ravel()
+        origin_x = np.repeat(self.robot_pose[:, 0], self.num_beams)
+        origin_y = np.repeat(self.robot_pose[:, 1], self.num_beams)
+        dist = np.zeros(angles.size)
+        active = np.arange(angles.size)
+        while active.size:
+            x = origin_x[active] + dist[active] * dir_x[active]
+            y = origin_y[active] + dist[active] * dir_y[active]
+            clearance = self._clearance_at(np.stack([x, y], -1))
+            hit = clearance == 0
+            dist[active] += np.where(hit, 0, np.maximum(clearance - self._resolution, self._resolution / 2))
+            active = active[~hit & (dist[active] < self.laser_range)]
+        scans = np.minimum(dist.reshape(angles.shape), self.laser_range)
+
+        # obstacles: analytic ray-circle intersection
+        if self.num_obstacles > 0:
+            rel = self.obstacles_pos - self.robot_pose[:, None, :2]  # (N, M, 2)
+            t_closest = cos[..., None] * rel[:, None, :, 0] + sin[..., None] * rel[:, None, :, 1]  # (N, B, M)
+            dist_sq = (rel ** 2).sum(-1)[:, None, :] - t_closest ** 2
+            radius_sq = (self.obstacles_radius ** 2)[:, None, :]
+            intersects = (dist_sq <= radius_sq) & (t_closest >= 0)
+            t_hit = t_closest - np.sqrt(np.maximum(radius_sq - dist_sq, 0))
+            t_hit = np.where(intersects, np.maximum(t_hit, 0), np.inf)
+            scans = np.minimum(scans, t_hit.min(axis=-1))
+
+        return scans.astype(np.float32)
+
+    def get_goals_in_robot_frame(self) -> Tuple[np.ndarray, np.ndarray]:
+        """same as ObservationCollector._get_goal_pose_in_robot_frame for all environments
+
+        Returns:
+            rho, theta (np.ndarray): arrays of shape (N,)
+        """
+        rel = self.goal - self.robot_pose[:, :2]
+        rho = np.hypot(rel[:, 0], rel[:, 1])
+        theta = (np.arctan2(rel[:, 1], rel[:, 0]) - self.robot_pose[:, 2] + 4 * np.pi) % (2 * np.pi) - np.pi
+        return rho, theta
@@ -0,0 +1,190 @@
+from typing import Union
+
+import gym
+import numpy as np
+from geometry_msgs.msg import Pose2D
+
+from rl_agent.envs.robot_configuration import YamlRobotConfiguration
+from rl_agent.utils.observation_buffer import ObservationRingBuffer
+from rl_agent.utils.reward import RewardCalculator
+from rl_agent.utils.trajectory_recorder import TrajectoryDataset
+
+
+class ReplayFlatlandEnv(YamlRobotConfiguration, gym.Env):
+    """
+    Re-serves the episodes recorded by TrajectoryRecorder with the interface of FlatlandEnv.
+
+    Scans, goals, robot poses and global plans are read from the memory-mapped columns of the recording instead
+    of the ROS topics, no roscore or simulator is needed. The recorded transitions are replayed open loop:
+    every step advances to the next recorded row whatever action the agent chose. The action of the agent is
+    only used for the reward and the last action in the observation, therefore the replay is meant for
+    benchmarking feature extractors and reward rules and for regression tests of the observation and reward
+    pipeline, not for training.
+
+    The reward is calculated by a RewardCalculator from the recorded observations, the recorded reward is
+    returned in info["recorded_reward"]. An episode ends when the RewardCalculator reports done, after
+    max_steps_per_episode steps or at the last recorded row of the episode, then the recorded done reason is used.
+    """
+
+    def __init__(
+        self,
+        recording_path: str,
+        reward_fnc: str,
+        is_action_space_discrete: bool,
+        safe_dist: float = None,
+        goal_radius: float = 0.1,
+        max_steps_per_episode: int = 100,
+        PATHS: dict = dict(),
+        extended_eval: bool = False,
+        actions_in_obs: bool = False,
+        shuffle: bool = False,
+        seed: Union[int, None] = None,
+        **kwargs,
+    ):
+        """
+        Args:
+            recording_path (str): directory of a recording of TrajectoryRecorder
+            reward_fnc (str): name of the reward rule, see RewardCalculator
+            is_action_space_discrete (bool): [description]
+            safe_dist (float, optional): [description]. Defaults to None.
+            goal_radius (float, optional): [description]. Defaults to 0.1.
+            max_steps_per_episode (int, optional): Defaults to 100.
+            PATHS (dict): script relevant paths, "robot_setting" and "robot_as" are needed
+            extended_eval (bool, optional): passed to the RewardCalculator. Defaults to False.
+            actions_in_obs (bool, optional): append the last action to the observation. Defaults to False.
+            shuffle (bool, optional): serve the episodes in random order instead of the recorded one.
+                Defaults to False.
+            seed (int, optional): seed of the episode order
+        """
+        super(ReplayFlatlandEnv, self).__init__()
+        self._is_action_space_discrete = is_action_space_discrete
+        self._action_in_obs = actions_in_obs
+        self.setup_by_configuration(PATHS["robot_setting"], PATHS["robot_as"])
+
+        self.dataset = TrajectoryDataset(recording_path)
+        assert self.dataset.num_episodes > 0, f"{recording_path} contains no finished episode"
+        assert self.dataset.columns["scan"].shape[1] == self._laser_num_beams, (
+            f"the recording has {self.dataset.columns['scan'].shape[1]} laser beams, "
+            f"the robot model {self._laser_num_beams}"
+        )
+        self._scans = self.dataset.columns["scan"]
+        self._goals = self.dataset.columns["goal_in_robot_frame"]
+        self._robot_poses = self.dataset.columns["robot_pose"]
+        self._recorded_rewards = self.dataset.columns["reward"]
+        self._plan_ids = self.dataset.columns["plan_id"]
+
+        self.observation_space = self._get_observation_space()
+        self._obs_buffer = ObservationRingBuffer(self._laser_num_beams, self.observation_space.shape[0])
+
+        # same robot radius and safe distance as HeadlessFlatlandEnv
+        self._robot_radius = self._footprint_radius + 0.25
+        if safe_dist is None:
+            safe_dist = self._robot_radius + 0.1
+        self.reward_calculator = RewardCalculator(
+            holonomic=self._holonomic,
+            robot_radius=self._robot_radius,
+            safe_dist=safe_dist,
+            goal_radius=goal_radius,
+            rule=reward_fnc,
+            extended_eval=extended_eval,
+        )
+
+        self._max_steps_per_episode = max_steps_per_episode
+        self._shuffle = shuffle
+        self._rng = np.random.default_rng(seed)
+        self._episode_order = np.arange(self.dataset.num_episodes)
+        self._episode_cursor = -1
+        self._row = 0
+        self._episode_end = 0
+        self._done_reason = -1
+        self._steps_curr_episode = 0
+        self._last_action = np.zeros(3)
+        self._robot_pose = Pose2D()
+        # the plan of the current row is kept, so that the RewardCalculator does not rebuild its plan index
+        self._plan_id = -1
+        self._plan = None
+
+    def _next_episode(self) -> int:
+        self._episode_cursor = (self._episode_cursor + 1) % len(self._episode_order)
+        if self._episode_cursor == 0 and self._shuffle:
+            self._rng.shuffle(self._episode_order)
+        return self._episode_order[self._episode_cursor]
+
+    def _process_action(self, action: np.ndarray) -> np.ndarray:
+        """translate the action of the agent to linear x, linear y and angular z"""
+        if self._is_action_space_discrete:
+            return self._discrete_actions[int(action)]
+        action = np.asarray(action, dtype=np.float64).reshape(-1)
+        return action if self._holonomic else np.array([action[0], 0, action[1]])
+
+    def _get_observations(self):
+        row = self._row
+        plan_id = self._plan_ids[row]
+        if plan_id != self._plan_id:
+            self._plan_id = plan_id
+            self._plan = self.dataset.get_plan(plan_id) if plan_id >= 0 else None
+        self._robot_pose.x, self._robot_pose.y, self._robot_pose.theta = self._robot_poses[row]
+
+        rho, theta = self._goals[row]
+        obs = self._obs_buffer.next_slot()
+        scan = self._obs_buffer.write_scan(obs, self._scans[row], self._laser_max_range)
+        self._obs_buffer.write_goal(obs, rho, theta)
+        if self._action_in_obs:
+            self._obs_buffer.write_action(obs, self._last_action)
+        obs_dict = {
+            "laser_scan": scan,
+            "goal_in_robot_frame": (rho, theta),
+            "global_plan": self._plan,
+            "robot_pose": self._robot_pose,
+        }
+        return obs, obs_dict
+
+    def reset(self):
+        start, length, done_reason, _ = self.dataset.episodes[self._next_episode()]
+        self._row = start
+        self._episode_end = start + length - 1
+        self._done_reason = done_reason
+        self._steps_curr_episode = 0
+        self._last_action = np.zeros(3)
+        self.reward_calculator.reset()
+        obs, _ = self._get_observations()
+        return obs
+
+    def step(self, action: np.ndarray):
+        """
+        done_reasons:   0   -   exceeded max steps
+                        1   -   collision with obstacle
+                        2   -   goal reached
+        """
+        action = self._process_action(action)
+        self._row = min(self._row + 1, self._episode_end)
+        self._steps_curr_episode += 1
+
+        merged_obs, obs_dict = self._get_observations()
+        self._last_action = action
+        reward, reward_info = self.reward_calculator.get_reward(
+            obs_dict["laser_scan"],
+            obs_dict["goal_in_robot_frame"],
+            action=action,
+            global_plan=obs_dict["global_plan"],
+            robot_pose=obs_dict["robot_pose"],
+        )
+        done = reward_info["is_done"]
+
+        info = {"recorded_reward": float(self._recorded_rewards[self._row])}
+        if done:
+            info["done_reason"] = reward_info["done_reason"]
+            info["is_success"] = reward_info["is_success"]
+        elif self._steps_curr_episode > self._max_steps_per_episode:
+            done = True
+            info["done_reason"] = 0
+            info["is_success"] = 0
+        elif self._row == self._episode_end:
+            # the recording ends here, the recorded done reason is -1 if the episode was cut off
+            done = True
+            info["done_reason"] = max(int(self._done_reason), 0)
+            info["is_success"] = int(self._done_reason == 2)
+        return merged_obs, reward, done, info
+
+    def close(self):
+        pass
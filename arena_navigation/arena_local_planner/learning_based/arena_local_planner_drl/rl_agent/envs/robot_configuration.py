@@ -0,0 +1,75 @@
+import numpy as np
+import yaml
+from gym import spaces
+
+
+class YamlRobotConfiguration:
+    """
+    Mixin of the environments which run without the ros parameter server (HeadlessFlatlandEnv,
+    ReplayFlatlandEnv): reads the robot model and action space from the yaml files and builds the
+    observation space of FlatlandEnv.
+    """
+
+    def setup_by_configuration(self, robot_yaml_path: str, settings_yaml_path: str):
+        """get the configuration from the yaml files, see FlatlandEnv.setup_by_configuration.
+        The robot radius is read from the first footprint of the robot model instead of the ros parameter server.
+        _is_action_space_discrete has to be set before.
+        """
+        with open(robot_yaml_path, "r") as fd:
+            robot_data = yaml.safe_load(fd)
+
+            footprint = robot_data["bodies"][0]["footprints"][0]
+            if footprint["type"] == "circle":
+                self._footprint_radius = footprint["radius"]
+            else:
+                self._footprint_radius = float(np.linalg.norm(footprint["points"], axis=1).max())
+
+            # get laser related information
+            for plugin in robot_data["plugins"]:
+                if plugin["type"] == "Laser" and plugin["name"] == "static_laser":
+                    self._laser_angle_min = plugin["angle"]["min"]
+                    laser_angle_max = plugin["angle"]["max"]
+                    self._laser_angle_increment = plugin["angle"]["increment"]
+                    self._laser_num_beams = int(
+                        round((laser_angle_max - self._laser_angle_min) / self._laser_angle_increment)
+                    )
+                    self._laser_max_range = plugin["range"]
+
+        with open(settings_yaml_path, "r") as fd:
+            setting_data = yaml.safe_load(fd)
+
+            self._holonomic = setting_data["robot"]["holonomic"]
+
+            if self._is_action_space_discrete:
+                assert not self._holonomic, "Discrete action space currently not supported for holonomic robots"
+                discrete_actions = setting_data["robot"]["discrete_actions"]
+                self._discrete_actions = np.array(
+                    [[action["linear"], 0, action["angular"]] for action in discrete_actions]
+                )
+                self.action_space = spaces.Discrete(len(discrete_actions))
+            else:
+                linear_range = setting_data["robot"]["continuous_actions"]["linear_range"]
+                angular_range = setting_data["robot"]["continuous_actions"]["angular_range"]
+
+                if not self._holonomic:
+                    self.action_space = spaces.Box(
+                        low=np.array([linear_range[0], angular_range[0]]),
+                        high=np.array([linear_range[1], angular_range[1]]),
+                        dtype=np.float,
+                    )
+                else:
+                    linear_range_x, linear_range_y = linear_range["x"], linear_range["y"]
+                    self.action_space = spaces.Box(
+                        low=np.array([linear_range_x[0], linear_range_y[0], angular_range[0]]),
+                        high=np.array([linear_range_x[1], linear_range_y[1], angular_range[1]]),
+                        dtype=np.float,
+                    )
+
+    def _get_observation_space(self) -> spaces.Box:
+        # same bounds as ObservationCollector, _action_in_obs has to be set before
+        low = [0.0] * self._laser_num_beams + [0.0, -np.pi]
+        high = [self._laser_max_range] * self._laser_num_beams + [15.0, np.pi]
+        if self._action_in_obs:
+            low += [-2.0, -2.0, -4.0]
+            high += [2.0, 2.0, 4.0]
+        return spaces.Box(np.array(low), np.array(high))
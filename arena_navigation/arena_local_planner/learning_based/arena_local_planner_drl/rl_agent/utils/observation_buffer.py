@@ -0,0 +1,151 @@
+from typing import Sequence, Union
+
+import numpy as np
+
+
+class ObservationRingBuffer:
+    """
+    Preallocated float32 storage of the merged observations [scan, rho, theta, (last action)].
+
+    Every call of next_slot() hands out the next row of a ring of ring_size rows which is then filled in place,
+    so assembling an observation does not allocate new arrays. The returned rows are only valid until the ring
+    wrapped around, i.e. for ring_size - 1 further observations. This is enough for the VecEnvs which copy or
+    send the observation within the step (the terminal observation and the first observation after the reset
+    included), everything else has to copy the observation.
+    """
+
+    def __init__(self, num_lidar_beams: int, obs_size: int, ring_size: int = 4):
+        assert ring_size >= 2, "the ring needs at least two slots to hold the terminal and the reset observation"
+        self._num_beams = num_lidar_beams
+        self._buffers = np.zeros((ring_size, obs_size), dtype=np.float32)
+        self._nan_mask = np.zeros(num_lidar_beams, dtype=bool)
+        self._idx = 0
+
+    def next_slot(self) -> np.ndarray:
+        self._idx = (self._idx + 1) % len(self._buffers)
+        return self._buffers[self._idx]
+
+    def write_scan(self, obs: np.ndarray, ranges: Union[np.ndarray, Sequence[float]], range_max: float) -> np.ndarray:
+        """decodes the ranges of a LaserScan into the scan part of obs and replaces NaNs by range_max
+
+        Returns:
+            np.ndarray: view of the scan part of obs
+        """
+        scan = obs[: self._num_beams]
+        if len(ranges) == 0:
+            scan.fill(0)
+            return scan
+        scan[:] = ranges
+        np.isnan(scan, out=self._nan_mask)
+        np.copyto(scan, range_max, where=self._nan_mask)
+        return scan
+
+    def write_goal(self, obs: np.ndarray, rho: float, theta: float):
+        obs[self._num_beams] = rho
+        obs[self._num_beams + 1] = theta
+
+    def write_action(self, obs: np.ndarray, action: np.ndarray):
+        obs[self._num_beams + 2 :] = action
+
+
+class GlobalPlanBuffer:
+    """
+    Parses nav_msgs/Path messages into a preallocated ring of arrays instead of a list of Pose2D per message.
+
+    parse_serialized reads the positions and quaternions of all poses at once through a strided view of the
+    serialized message, as the poses of a plan share their frame_id and are therefore equally long. parse takes
+    deserialized messages pose by pose. The yaw angles are computed vectorized from the quaternions.
+
+    Every message is written into the next of ring_size slots, so a plan handed out by the subscriber thread stays
+    valid for ring_size - 1 further messages, which is enough for the consumers of a step (the reward calculator
+    copies the plan into its index). Everything else has to copy the plan.
+    """
+
+    def __init__(self, capacity: int = 256, ring_size: int = 8):
+        assert ring_size >= 2, "the ring needs at least two slots to hand out a plan while the next one is parsed"
+        self._xy = np.zeros((ring_size, capacity, 2))
+        self._yaw = np.zeros((ring_size, capacity))
+        self._quat = np.zeros((capacity, 4))
+        self._scratch = np.zeros((capacity, 2))
+        self._idx = 0
+        self.plan = self._xy[0, :0]
+        self.yaw = self._yaw[0, :0]
+
+    def _next_slot(self, num_poses: int) -> int:
+        """index of the next slot, the ring and the working arrays are grown to at least num_poses rows"""
+        if self._xy.shape[1] < num_poses:
+            # the plans handed out before keep the former arrays alive
+            capacity = 2 ** int(np.ceil(np.log2(num_poses)))
+            self._xy = np.zeros((len(self._xy), capacity, 2))
+            self._yaw = np.zeros((len(self._yaw), capacity))
+            self._quat = np.zeros((capacity, 4))
+            self._scratch = np.zeros((capacity, 2))
+        self._idx = (self._idx + 1) % len(self._xy)
+        return self._idx
+
+    def parse(self, msg_global_plan) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: (N, 2) view of the positions of the plan
+        """
+        poses = msg_global_plan.poses
+        n = len(poses)
+        slot = self._next_slot(n)
+        xy, quat = self._xy[slot], self._quat
+        for i, pose_stamped in enumerate(poses):
+            position, orientation = pose_stamped.pose.position, pose_stamped.pose.orientation
+            xy[i, 0] = position.x
+            xy[i, 1] = position.y
+            quat[i, 0] = orientation.x
+            quat[i, 1] = orientation.y
+            quat[i, 2] = orientation.z
+            quat[i, 3] = orientation.w
+        return self._publish(slot, n)
+
+    def parse_serialized(self, buff: bytes) -> np.ndarray:
+        """
+        Parses a serialized nav_msgs/Path, e.g. the _buff of a rospy.AnyMsg. Plans whose poses have frame_ids of
+        different lengths are deserialized and parsed pose by pose.
+
+        Returns:
+            np.ndarray: (N, 2) view of the positions of the plan
+        """
+        # Path: Header (seq, secs, nsecs, frame_id), uint32 number of poses, PoseStamped[]
+        # PoseStamped: Header, Pose (position x y z, orientation x y z w as float64)
+        header_len = 16 + int(np.frombuffer(buff, dtype="<u4", count=1, offset=12)[0])
+        n = int(np.frombuffer(buff, dtype="<u4", count=1, offset=header_len)[0])
+        start = header_len + 4
+        if n == 0:
+            return self._publish(self._next_slot(0), 0)
+        frame_id_len = int(np.frombuffer(buff, dtype="<u4", count=1, offset=start + 12)[0])
+        stride = 16 + frame_id_len + 56
+        if len(buff) != start + n * stride or not np.all(
+            np.ndarray((n,), dtype="<u4", buffer=buff, offset=start + 12, strides=(stride,)) == frame_id_len
+        ):
+            from nav_msgs.msg import Path
+
+            return self.parse(Path().deserialize(buff))
+        poses = np.ndarray((n, 7), dtype="<f8", buffer=buff, offset=start + 16 + frame_id_len, strides=(stride, 8))
+        slot = self._next_slot(n)
+        self._xy[slot, :n] = poses[:, :2]
+        self._quat[:n] = poses[:, 3:]
+        return self._publish(slot, n)
+
+    def _publish(self, slot: int, n: int) -> np.ndarray:
+        xy, yaw, quat = self._xy[slot], self._yaw[slot], self._quat
+        # yaw = atan2(2 * (w * z + x * y), 1 - 2 * (y^2 + z^2)), same as euler_from_quaternion(q)[2]
+        qx, qy, qz, qw = quat[:n, 0], quat[:n, 1], quat[:n, 2], quat[:n, 3]
+        sin_yaw, cos_yaw = self._scratch[:n, 0], self._scratch[:n, 1]
+        np.multiply(qw, qz, out=sin_yaw)
+        np.multiply(qx, qy, out=cos_yaw)
+        sin_yaw += cos_yaw
+        sin_yaw *= 2
+        np.multiply(qy, qy, out=cos_yaw)
+        cos_yaw += np.square(qz, out=yaw[:n])
+        cos_yaw *= -2
+        cos_yaw += 1
+        np.arctan2(sin_yaw, cos_yaw, out=yaw[:n])
+
+        self.yaw = yaw[:n]
+        self.plan = xy[:n]
+        return self.plan
@@ -4,6 +4,7 @@ from typing import Tuple
 
 from numpy.core.numeric import normalize_axis_tuple
 import rospy
+from rospy.numpy_msg import numpy_msg
 import random
 import numpy as np
 from collections import deque
@@ -34,6 +35,8 @@ import numpy as np
 from std_msgs.msg import Bool
 
 from rl_agent.utils.debug import timeit
+from rl_agent.utils.observation_buffer import GlobalPlanBuffer, ObservationRingBuffer
+from rl_agent.utils.observation_synchronizer import SYNCHRONIZERS, DequeSynchronizer
 
 
 class ObservationCollector:
@@ -108,6 +111,11 @@ class ObservationCollector:
             )
 
         self._laser_num_beams = num_lidar_beams
+        # observations are assembled in place in preallocated buffers
+        self._obs_buffer = ObservationRingBuffer(num_lidar_beams, self.observation_space.shape[0])
+        self._globalplan_buffer = GlobalPlanBuffer()
+        self._zero_action = np.zeros(3)
+        self._obs_dict = {}
         # for frequency controlling
         self._action_frequency = 1 / rospy.get_param("/robot_action_rate")
 
@@ -129,15 +137,27 @@ class ObservationCollector:
         self.max_deque_size = 10
         self._sync_slop = 0.05
 
-        self._laser_deque = deque()
-        self._rs_deque = deque()
+        # "ring_buffer" or "deque", see rl_agent/utils/observation_synchronizer.py
+        sync_type = rospy.get_param("observation_synchronizer", default="ring_buffer")
+        if sync_type not in SYNCHRONIZERS:
+            raise ValueError(
+                f"observation_synchronizer must be one of {', '.join(map(repr, SYNCHRONIZERS))}, got {sync_type!r}"
+            )
+        if sync_type == "deque":
+            self._synchronizer = DequeSynchronizer(
+                self.max_deque_size, self._sync_slop, self._first_sync_obs
+            )
+        else:
+            self._synchronizer = SYNCHRONIZERS[sync_type](
+                self.max_deque_size, self._sync_slop
+            )
 
         # subscriptions
         # ApproximateTimeSynchronizer appears to be slow for training, but with real robot, own sync method doesn't accept almost any messages as synced
         # need to evaulate each possibility
         if self._ext_time_sync:
             self._scan_sub = message_filters.Subscriber(
-                f"{self.ns_prefix}scan", LaserScan
+                f"{self.ns_prefix}scan", numpy_msg(LaserScan)
             )
             self._robot_state_sub = message_filters.Subscriber(
                 f"{self.ns_prefix}odom", Odometry
@@ -153,7 +173,7 @@ class ObservationCollector:
         else:
             self._scan_sub = rospy.Subscriber(
                 f"{self.ns_prefix}scan",
-                LaserScan,
+                numpy_msg(LaserScan),
                 self.callback_scan,
                 tcp_nodelay=True,
             )
@@ -172,8 +192,9 @@ class ObservationCollector:
             f"{self.ns_prefix}subgoal", PoseStamped, self.callback_subgoal
         )
 
+        # the plan is parsed from the serialized message, see GlobalPlanBuffer.parse_serialized
         self._globalplan_sub = rospy.Subscriber(
-            f"{self.ns_prefix}globalPlan", Path, self.callback_global_plan
+            f"{self.ns_prefix}globalPlan", rospy.AnyMsg, self.callback_global_plan
         )
 
         # service clients
@@ -196,6 +217,10 @@ class ObservationCollector:
             except Exception:
                 pass
 
+        return self.collect_observations(*args, **kwargs)
+
+    def collect_observations(self, *args, **kwargs):
+        """merge the most recent messages into an observation without advancing the simulation"""
         if not self._ext_time_sync:
             # try to retrieve sync'ed obs
             laser_scan, robot_pose = self.get_sync_obs()
@@ -206,37 +231,27 @@ class ObservationCollector:
             # else:
             #     print("Not synced")
 
-        if len(self._scan.ranges) > 0:
-            scan = self._scan.ranges.astype(np.float32)
-        else:
-            scan = np.zeros(self._laser_num_beams, dtype=float)
+        merged_obs = self._obs_buffer.next_slot()
+        scan = self._obs_buffer.write_scan(
+            merged_obs, self._scan.ranges, self._scan.range_max
+        )
 
         rho, theta = ObservationCollector._get_goal_pose_in_robot_frame(
             self._subgoal, self._robot_pose
         )
+        self._obs_buffer.write_goal(merged_obs, rho, theta)
 
-        merged_obs = (
-            np.hstack([scan, np.array([rho, theta])])
-            if not self._action_in_obs
-            else np.hstack(
-                [
-                    scan,
-                    np.array([rho, theta]),
-                    kwargs.get("last_action", np.array([0, 0, 0])),
-                ]
-            )
-        )
+        last_action = kwargs.get("last_action", self._zero_action)
+        if self._action_in_obs:
+            self._obs_buffer.write_action(merged_obs, last_action)
 
-        obs_dict = {
-            "laser_scan": scan,
-            "goal_in_robot_frame": [rho, theta],
-            "global_plan": self._globalplan,
-            "robot_pose": self._robot_pose,
-            "last_action": kwargs.get("last_action", np.array([0, 0, 0])),
-        }
+        obs_dict = self._obs_dict
+        obs_dict["laser_scan"] = scan
+        obs_dict["goal_in_robot_frame"] = (rho, theta)
+        obs_dict["global_plan"] = self._globalplan
+        obs_dict["robot_pose"] = self._robot_pose
+        obs_dict["last_action"] = last_action
 
-        self._laser_deque.clear()
-        self._rs_deque.clear()
         return merged_obs, obs_dict
 
     @staticmethod
@@ -250,38 +265,18 @@ class ObservationCollector:
         return rho, theta
 
     def get_sync_obs(self):
-        laser_scan = None
-        robot_pose = None
-
-        # print(f"laser deque: {len(self._laser_deque)}, robot state deque: {len(self._rs_deque)}")
-        while len(self._rs_deque) > 0 and len(self._laser_deque) > 0:
-            laser_scan_msg = self._laser_deque.popleft()
-            robot_pose_msg = self._rs_deque.popleft()
-
-            laser_stamp = laser_scan_msg.header.stamp.to_sec()
-            robot_stamp = robot_pose_msg.header.stamp.to_sec()
-
-            while abs(laser_stamp - robot_stamp) > self._sync_slop:
-                if laser_stamp > robot_stamp:
-                    if len(self._rs_deque) == 0:
-                        return laser_scan, robot_pose
-                    robot_pose_msg = self._rs_deque.popleft()
-                    robot_stamp = robot_pose_msg.header.stamp.to_sec()
-                else:
-                    if len(self._laser_deque) == 0:
-                        return laser_scan, robot_pose
-                    laser_scan_msg = self._laser_deque.popleft()
-                    laser_stamp = laser_scan_msg.header.stamp.to_sec()
-
-            laser_scan = self.process_scan_msg(laser_scan_msg)
-            robot_pose, _ = self.process_robot_state_msg(robot_pose_msg)
-
-            if self._first_sync_obs:
-                break
-
-        # print(f"Laser_stamp: {laser_stamp}, Robot_stamp: {robot_stamp}")
+        laser_scan_msg, robot_pose_msg = self._synchronizer.get_sync_obs()
+        if laser_scan_msg is None or robot_pose_msg is None:
+            return None, None
+
+        laser_scan = self.process_scan_msg(laser_scan_msg)
+        robot_pose, _ = self.process_robot_state_msg(robot_pose_msg)
         return laser_scan, robot_pose
 
+    def get_sync_statistics(self) -> dict:
+        """counters of the synchronizer to tune _sync_slop and max_deque_size"""
+        return self._synchronizer.get_statistics()
+
     def call_service_takeSimStep(self, t=None):
         request = StepWorldRequest() if t is None else StepWorldRequest(t)
         timeout = 12
@@ -315,20 +310,14 @@ class ObservationCollector:
         return
 
     def callback_global_plan(self, msg_global_plan):
-        self._globalplan = ObservationCollector.process_global_plan_msg(
-            msg_global_plan
-        )
+        self._globalplan = self._globalplan_buffer.parse_serialized(msg_global_plan._buff)
         return
 
     def callback_scan(self, msg_laserscan):
-        if len(self._laser_deque) == self.max_deque_size:
-            self._laser_deque.popleft()
-        self._laser_deque.append(msg_laserscan)
+        self._synchronizer.add_scan(msg_laserscan)
 
     def callback_robot_state(self, msg_robotstate):
-        if len(self._rs_deque) == self.max_deque_size:
-            self._rs_deque.popleft()
-        self._rs_deque.append(msg_robotstate)
+        self._synchronizer.add_odom(msg_robotstate)
 
     def callback_observation_received(
         self, msg_LaserScan, msg_RobotStateStamped
@@ -342,11 +331,8 @@ class ObservationCollector:
         return
 
     def process_scan_msg(self, msg_LaserScan: LaserScan):
-        # remove_nans_from_scan
+        # the NaNs are replaced by range_max when the ranges are decoded into the observation buffer
         self._scan_stamp = msg_LaserScan.header.stamp.to_sec()
-        scan = np.array(msg_LaserScan.ranges)
-        scan[np.isnan(scan)] = msg_LaserScan.range_max
-        msg_LaserScan.ranges = scan
         return msg_LaserScan
 
     def process_robot_state_msg(self, msg_Odometry):
@@ -365,13 +351,7 @@ class ObservationCollector:
 
     @staticmethod
     def process_global_plan_msg(globalplan):
-        global_plan_2d = list(
-            map(
-                lambda p: ObservationCollector.pose3D_to_pose2D(p.pose),
-                globalplan.poses,
-            )
-        )
-        return np.array(list(map(lambda p2d: [p2d.x, p2d.y], global_plan_2d)))
+        return GlobalPlanBuffer(max(len(globalplan.poses), 1)).parse(globalplan)
 
     @staticmethod
     def pose3D_to_pose2D(pose3d):
@@ -0,0 +1,267 @@
+import threading
+import time
+from collections import deque
+from typing import Tuple
+
+import numpy as np
+
+
+class ObservationSynchronizer:
+    """
+    Pairs the laser scans and odometry messages of the robot by their header stamps.
+
+    The subscriber callbacks hand the messages over with add_scan / add_odom, get_sync_obs returns
+    a matched (scan, odom) pair or (None, None) if no pair lies within the slop.
+    """
+
+    def __init__(self, max_size: int = 10, slop: float = 0.05):
+        self.max_size = max_size
+        self.slop = slop
+
+    def add_scan(self, msg):
+        raise NotImplementedError()
+
+    def add_odom(self, msg):
+        raise NotImplementedError()
+
+    def get_sync_obs(self) -> Tuple[object, object]:
+        raise NotImplementedError()
+
+    def reset(self):
+        """forgets all buffered messages"""
+        raise NotImplementedError()
+
+    def get_statistics(self) -> dict:
+        return {}
+
+
+class DequeSynchronizer(ObservationSynchronizer):
+    """
+    The former synchronization of ObservationCollector: walks both deques and pops until the stamps lie within
+    the slop. Both deques are cleared after every observation, so the samples newer than the match are lost.
+    """
+
+    def __init__(self, max_size: int = 10, slop: float = 0.05, first_sync_obs: bool = True):
+        super().__init__(max_size, slop)
+        # whether to return first sync'd obs or most recent
+        self._first_sync_obs = first_sync_obs
+        self._laser_deque = deque()
+        self._rs_deque = deque()
+
+    def add_scan(self, msg):
+        if len(self._laser_deque) == self.max_size:
+            self._laser_deque.popleft()
+        self._laser_deque.append(msg)
+
+    def add_odom(self, msg):
+        if len(self._rs_deque) == self.max_size:
+            self._rs_deque.popleft()
+        self._rs_deque.append(msg)
+
+    def get_sync_obs(self):
+        laser_scan, robot_pose = self._match()
+        self.reset()
+        return laser_scan, robot_pose
+
+    def _match(self):
+        laser_scan = None
+        robot_pose = None
+
+        while len(self._rs_deque) > 0 and len(self._laser_deque) > 0:
+            laser_scan_msg = self._laser_deque.popleft()
+            robot_pose_msg = self._rs_deque.popleft()
+
+            laser_stamp = laser_scan_msg.header.stamp.to_sec()
+            robot_stamp = robot_pose_msg.header.stamp.to_sec()
+
+            while abs(laser_stamp - robot_stamp) > self.slop:
+                if laser_stamp > robot_stamp:
+                    if len(self._rs_deque) == 0:
+                        return laser_scan, robot_pose
+                    robot_pose_msg = self._rs_deque.popleft()
+                    robot_stamp = robot_pose_msg.header.stamp.to_sec()
+                else:
+                    if len(self._laser_deque) == 0:
+                        return laser_scan, robot_pose
+                    laser_scan_msg = self._laser_deque.popleft()
+                    laser_stamp = laser_scan_msg.header.stamp.to_sec()
+
+            laser_scan, robot_pose = laser_scan_msg, robot_pose_msg
+
+            if self._first_sync_obs:
+                break
+
+        return laser_scan, robot_pose
+
+    def reset(self):
+        self._laser_deque.clear()
+        self._rs_deque.clear()
+
+
+class _StampedRing:
+    """fixed size ring of messages with their stamps and arrival times in parallel numeric arrays"""
+
+    def __init__(self, size: int):
+        self.stamps = np.zeros(size)
+        self.arrivals = np.zeros(size)
+        self.msgs = [None] * size
+        self.start = 0
+        self.count = 0
+
+    def append(self, msg, stamp: float) -> bool:
+        """
+        Returns:
+            bool: whether the oldest message was overwritten
+        """
+        size = len(self.stamps)
+        overflow = self.count == size
+        idx = (self.start + self.count) % size
+        if overflow:
+            self.start = (self.start + 1) % size
+        else:
+            self.count += 1
+        self.stamps[idx] = stamp
+        self.arrivals[idx] = time.monotonic()
+        self.msgs[idx] = msg
+        return overflow
+
+    def stamp(self, i: int) -> float:
+        """stamp of the i-th oldest message"""
+        return self.stamps[(self.start + i) % len(self.stamps)]
+
+    def nearest(self, stamp: float) -> int:
+        """bisects the (ascending) stamps for the message closest to stamp"""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.stamp(mid) < stamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.count or (lo > 0 and stamp - self.stamp(lo - 1) <= self.stamp(lo) - stamp):
+            return lo - 1
+        return lo
+
+    def pop(self, num: int):
+        """removes the num oldest messages"""
+        for i in range(num):
+            self.msgs[(self.start + i) % len(self.msgs)] = None
+        self.start = (self.start + num) % len(self.stamps)
+        self.count -= num
+
+    def get(self, i: int):
+        idx = (self.start + i) % len(self.stamps)
+        return self.msgs[idx], self.arrivals[idx]
+
+    def clear(self):
+        self.pop(self.count)
+
+
+class RingBufferSynchronizer(ObservationSynchronizer):
+    """
+    Keeps the stamps of the last max_size scans and odometry messages in numeric ring buffers. The stamps are
+    converted once on arrival and the odometry closest to a scan is found by bisection, so a match costs
+    O(log n) instead of popping through both deques.
+
+    get_sync_obs returns the most recent scan which has an odometry message within the slop. The messages older
+    than the match are dropped, the newer ones are kept for the next observation.
+
+    The statistics count the matches and the messages which were dropped without being matched (either
+    overwritten since the ring was full or skipped by a newer match), the mean / max stamp offset of the
+    matched pairs and their mean / max age in wall time when they were consumed.
+    """
+
+    def __init__(self, max_size: int = 10, slop: float = 0.05):
+        super().__init__(max_size, slop)
+        self._scans = _StampedRing(max_size)
+        self._odoms = _StampedRing(max_size)
+        self._lock = threading.Lock()
+        self._stats = {
+            "matches": 0,
+            "no_match": 0,
+            "dropped_scans": 0,
+            "scan_overflows": 0,
+            "unmatched_odom": 0,
+            "odom_overflows": 0,
+            "stamp_offset_sum": 0.0,
+            "stamp_offset_max": 0.0,
+            "match_latency_sum": 0.0,
+            "match_latency_max": 0.0,
+        }
+
+    def add_scan(self, msg):
+        stamp = msg.header.stamp.to_sec()
+        with self._lock:
+            if self._scans.append(msg, stamp):
+                self._stats["dropped_scans"] += 1
+                self._stats["scan_overflows"] += 1
+
+    def add_odom(self, msg):
+        stamp = msg.header.stamp.to_sec()
+        with self._lock:
+            if self._odoms.append(msg, stamp):
+                self._stats["unmatched_odom"] += 1
+                self._stats["odom_overflows"] += 1
+
+    def get_sync_obs(self):
+        with self._lock:
+            scans, odoms = self._scans, self._odoms
+            if scans.count == 0 or odoms.count == 0:
+                self._stats["no_match"] += 1
+                return None, None
+
+            # newest scan first, usually it has a match
+            for scan_idx in range(scans.count - 1, -1, -1):
+                scan_stamp = scans.stamp(scan_idx)
+                odom_idx = odoms.nearest(scan_stamp)
+                offset = abs(scan_stamp - odoms.stamp(odom_idx))
+                if offset <= self.slop:
+                    break
+            else:
+                self._stats["no_match"] += 1
+                return None, None
+
+            scan_msg, scan_arrival = scans.get(scan_idx)
+            odom_msg, odom_arrival = odoms.get(odom_idx)
+            latency = time.monotonic() - min(scan_arrival, odom_arrival)
+
+            stats = self._stats
+            stats["matches"] += 1
+            stats["dropped_scans"] += scan_idx
+            stats["unmatched_odom"] += odom_idx
+            stats["stamp_offset_sum"] += offset
+            stats["stamp_offset_max"] = max(stats["stamp_offset_max"], offset)
+            stats["match_latency_sum"] += latency
+            stats["match_latency_max"] = max(stats["match_latency_max"], latency)
+
+            scans.pop(scan_idx + 1)
+            odoms.pop(odom_idx + 1)
+            return scan_msg, odom_msg
+
+    def reset(self):
+        with self._lock:
+            self._scans.clear()
+            self._odoms.clear()
+
+    def get_statistics(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        matches = max(stats["matches"], 1)
+        return {
+            "matches": stats["matches"],
+            "no_match": stats["no_match"],
+            "dropped_scans": stats["dropped_scans"],
+            "scan_overflows": stats["scan_overflows"],
+            "unmatched_odom": stats["unmatched_odom"],
+            "odom_overflows": stats["odom_overflows"],
+            "stamp_offset_mean": stats["stamp_offset_sum"] / matches,
+            "stamp_offset_max": stats["stamp_offset_max"],
+            "match_latency_mean": stats["match_latency_sum"] / matches,
+            "match_latency_max": stats["match_latency_max"],
+        }
+
+
+SYNCHRONIZERS = {
+    "deque": DequeSynchronizer,
+    "ring_buffer": RingBufferSynchronizer,
+}
@@ -1,9 +1,88 @@
 import numpy as np
-import scipy.spatial
 
 from numpy.lib.utils import safe_eval
 from geometry_msgs.msg import Pose2D
-from typing import Tuple
+from typing import List, Tuple, Union
+
+
+class GlobalPlanDistanceIndex:
+    def __init__(self, block_size: int = 20):
+        """
+        Answers nearest waypoint queries on the global plan incrementally, the results are exact.
+
+        The index remembers the plan it was built from and only rebuilds (copies the waypoints into a reused
+        buffer) when a different plan is passed, e.g. after callback_global_plan received a replanned path.
+        The plan is split into blocks of block_size consecutive waypoints with a bounding circle each. The
+        waypoint matched by the last query bounds the distance of the next one, only the blocks whose circle
+        comes closer than this bound are searched. Usually these are one or two blocks around the robot, more
+        where the plan crosses itself or loops. The waypoints are stored as complex numbers x + iy, so that
+        a distance takes one subtraction and one abs.
+
+        :param block_size (int, optional): number of waypoints per block. defaults to 20
+        """
+        self.block_size = block_size
+        self._points = np.zeros(0, dtype=np.complex128)
+        self.reset()
+
+    def reset(self):
+        self._plan = None
+        self._num_points = 0
+        self._last_idx = None
+        self.version = 0
+
+    def update(self, global_plan: np.ndarray) -> bool:
+        """
+        Rebuilds the index if global_plan is not the plan it was built from.
+
+        :return: whether the index was rebuilt
+        """
+        if global_plan is self._plan:
+            return False
+        num_points = len(global_plan)
+        if len(self._points) < num_points:
+            self._points = np.zeros(2 * num_points, dtype=np.complex128)
+        waypoints = np.asarray(global_plan)
+        points = self._points[:num_points]
+        points.real = waypoints[:, 0]
+        points.imag = waypoints[:, 1]
+        self._plan = global_plan
+        self._num_points = num_points
+        self._last_idx = None
+        self.version += 1
+        if num_points:
+            starts = np.arange(0, num_points, self.block_size)
+            counts = np.diff(np.append(starts, num_points))
+            self._centers = np.add.reduceat(points, starts) / counts
+            self._radii = np.maximum.reduceat(np.abs(points - np.repeat(self._centers, counts)), starts)
+        return True
+
+    def _search(self, point: complex, lo: int, hi: int) -> Tuple[float, int]:
+        dists = np.abs(self._points[lo:hi] - point)
+        idx = int(np.argmin(dists))
+        return dists[idx], lo + idx
+
+    def query(self, x: float, y: float) -> Tuple[float, int]:
+        """
+        Returns the distance to and the index of the nearest waypoint of the plan.
+        """
+        n = self._num_points
+        point = complex(x, y)
+        if self._last_idx is None:
+            best_dist, idx = self._search(point, 0, n)
+        else:
+            bound = abs(self._points[self._last_idx] - point)
+            best_dist, idx = np.inf, self._last_idx
+            blocks = np.flatnonzero(np.abs(self._centers - point) <= bound + self._radii).tolist()
+            # consecutive blocks are searched at once
+            while blocks:
+                first = last = blocks.pop(0)
+                while blocks and blocks[0] == last + 1:
+                    last = blocks.pop(0)
+                dist, match = self._search(point, first * self.block_size, min((last + 1) * self.block_size, n))
+                if dist < best_dist:
+                    best_dist, idx = dist, match
+        self._last_idx = idx
+        return float(best_dist), idx
 
 
 class RewardCalculator:
@@ -37,7 +116,7 @@ class RewardCalculator:
         self.safe_dist = safe_dist
         self._extended_eval = extended_eval
 
-        self.kdtree = None
+        self._plan_index = GlobalPlanDistanceIndex()
 
         self._cal_funcs = {
             "rule_00": RewardCalculator._cal_reward_rule_00,
@@ -57,7 +136,7 @@ class RewardCalculator:
         self.last_goal_dist = None
         self.last_dist_to_path = None
         self.last_action = None
-        self.kdtree = None
+        self._plan_index.reset()
         self._curr_dist_to_path = None
 
     def _reset(self):
@@ -94,7 +173,7 @@ class RewardCalculator:
     def _cal_reward_rule_02(self, laser_scan: np.ndarray, goal_in_robot_frame: Tuple[float, float], *args, **kwargs):
         self._set_current_dist_to_globalplan(kwargs["global_plan"], kwargs["robot_pose"])
         self._reward_distance_traveled(kwargs["action"], consumption_factor=0.0075)
-        self._reward_following_global_plan(reward_factor=0.2, penalty_factor=0.3)
+        self._reward_following_global_plan(kwargs["action"])
         self._reward_goal_reached(goal_in_robot_frame, reward=15)
         self._reward_safe_dist(laser_scan, punishment=0.25)
         self._reward_collision(laser_scan, punishment=10)
@@ -178,7 +257,7 @@ class RewardCalculator:
 
     def _set_current_dist_to_globalplan(self, global_plan: np.ndarray, robot_pose: Pose2D):
         if global_plan is not None and len(global_plan) != 0:
-            self._curr_dist_to_path, idx = self.get_min_dist2global_kdtree(global_plan, robot_pose)
+            self._curr_dist_to_path, idx = self.get_min_dist2global_plan(global_plan, robot_pose)
 
     def _reward_goal_reached(self, goal_in_robot_frame=Tuple[float, float], reward: float = 15):
         """
@@ -325,18 +404,16 @@ class RewardCalculator:
         if self._curr_dist_to_path and action is not None and self._curr_dist_to_path <= dist_to_path:
             self.curr_reward += 0.1 * action[0]
 
-    def get_min_dist2global_kdtree(self, global_plan: np.array, robot_pose: Pose2D):
+    def get_min_dist2global_plan(self, global_plan: np.array, robot_pose: Pose2D):
         """
-        Calculates minimal distance to global plan using kd tree search.
+        Calculates minimal distance to global plan using the incremental plan index,
+        which is rebuilt whenever a new global plan was received.
 
         :param global_plan: (np.ndarray): vector containing poses on global plan
         :param robot_pose (Pose2D): robot position
         """
-        if self.kdtree is None:
-            self.kdtree = scipy.spatial.cKDTree(global_plan)
-
-        dist, index = self.kdtree.query([robot_pose.x, robot_pose.y])
-        return dist, index
+        self._plan_index.update(global_plan)
+        return self._plan_index.query(robot_pose.x, robot_pose.y)
 
     def _reward_abrupt_direction_change(self, action: np.ndarray = None):
         """
@@ -373,3 +450,308 @@ class RewardCalculator:
 
             vel_diff = abs(curr_vel - last_vel)
             self.curr_reward -= ((vel_diff ** 4) / 100) * factor
+
+
+class BatchedRewardCalculator:
+    def __init__(
+        self,
+        num_envs: int,
+        holonomic: float,
+        robot_radius: float,
+        safe_dist: float,
+        goal_radius: float,
+        rule: str = "rule_00",
+        extended_eval: bool = False,
+    ):
+        """
+        Vectorized counterpart of RewardCalculator which scores the steps of num_envs environments at once.
+
+        The rules and their reward terms are the same as in RewardCalculator, but every term is evaluated
+        for all environments with one NumPy operation. The per episode state (last goal distance, last distance
+        to the global plan, last action) is kept in arrays, missing values are represented by NaN.
+
+        :param num_envs (int): number of environments scored per call
+        :param safe_dist (float): The minimum distance to obstacles or wall that robot is in safe status.
+                                  if the robot get too close to them it will be punished. Unit[ m ]
+        :param goal_radius (float): The minimum distance to goal that goal position is considered to be reached.
+        """
+        self.num_envs = num_envs
+        self.holonomic = holonomic
+        self.robot_radius = robot_radius
+        self.goal_radius = goal_radius
+        self.safe_dist = safe_dist
+        self._extended_eval = extended_eval
+
+        self.last_goal_dist = np.full(num_envs, np.nan)
+        self.last_dist_to_path = np.full(num_envs, np.nan)
+        self.last_action = None
+        self._has_last_action = np.zeros(num_envs, dtype=bool)
+        self._curr_dist_to_path = np.full(num_envs, np.nan)
+        self.plan_indices = [GlobalPlanDistanceIndex() for _ in range(num_envs)]
+
+        self._cal_funcs = {
+            "rule_00": BatchedRewardCalculator._cal_reward_rule_00,
+            "rule_01": BatchedRewardCalculator._cal_reward_rule_01,
+            "rule_02": BatchedRewardCalculator._cal_reward_rule_02,
+            "rule_03": BatchedRewardCalculator._cal_reward_rule_03,
+            "rule_04": BatchedRewardCalculator._cal_reward_rule_04,
+            "rule_05": BatchedRewardCalculator._cal_reward_rule_05,
+            "barn": BatchedRewardCalculator._cal_reward_rule_barn,
+        }
+        self.cal_func = self._cal_funcs[rule]
+
+    def reset(self, env_mask: np.ndarray = None):
+        """
+        reset variables related to the episode
+
+        :param env_mask (np.ndarray, optional): boolean mask of the environments to reset. defaults to all
+        """
+        mask = np.ones(self.num_envs, dtype=bool) if env_mask is None else np.asarray(env_mask, dtype=bool)
+        self.last_goal_dist[mask] = np.nan
+        self.last_dist_to_path[mask] = np.nan
+        self._has_last_action[mask] = False
+        self._curr_dist_to_path[mask] = np.nan
+        for i in np.flatnonzero(mask):
+            self.plan_indices[i].reset()
+
+    def _reset(self):
+        """
+        reset variables related to current step
+        """
+        self.curr_reward = np.zeros(self.num_envs)
+        self.info = {
+            "is_done": np.zeros(self.num_envs, dtype=bool),
+            "done_reason": np.full(self.num_envs, -1, dtype=np.int64),
+            "is_success": np.zeros(self.num_envs, dtype=np.int64),
+        }
+        if self._extended_eval:
+            self.info["crash"] = np.zeros(self.num_envs, dtype=bool)
+            self.info["safe_dist"] = np.zeros(self.num_envs, dtype=bool)
+
+    def get_reward(
+        self,
+        laser_scans: np.ndarray,
+        goals_in_robot_frame: np.ndarray,
+        actions: np.ndarray,
+        global_plans: List[Union[np.ndarray, None]] = None,
+        robot_poses: np.ndarray = None,
+    ):
+        """
+        Returns rewards and info of all environments.
+
+        :param laser_scans (np.ndarray (N, num_beams)): laser scan data
+        :param goals_in_robot_frame (np.ndarray (N, 2)): position (rho, theta) of the goals in robot frame
+        :param actions (np.ndarray (N, act_dim)): [:, 0] - linear velocity, [:, -1] - angular velocity
+        :param global_plans (List[np.ndarray], optional): global plan per environment, only used by rule_02 and upwards
+        :param robot_poses (np.ndarray (N, >=2), optional): robot positions, needed along with global_plans
+        :return: (N,) rewards and a dict of (N,) arrays "is_done", "done_reason" (-1 if not done), "is_success"
+                 (and "crash", "safe_dist" in extended evaluation)
+        """
+        self._reset()
+        self._scan_min = np.min(laser_scans, axis=1)
+        self._goal_dist = np.asarray(goals_in_robot_frame)[:, 0]
+        actions = np.asarray(actions, dtype=np.float64).reshape(self.num_envs, -1)
+        if self.last_action is None:
+            self.last_action = np.zeros_like(actions)
+        self.cal_func(self, actions, global_plans, robot_poses)
+        return self.curr_reward, self.info
+
+    def _cal_reward_rule_00(self, actions: np.ndarray, *args):
+        self._reward_goal_reached()
+        self._reward_safe_dist(punishment=0.25)
+        self._reward_collision()
+        self._reward_goal_approached(reward_factor=0.3, penalty_factor=0.4)
+
+    def _cal_reward_rule_01(self, actions: np.ndarray, *args):
+        self._reward_distance_traveled(actions, consumption_factor=0.0075)
+        self._reward_goal_reached(reward=15)
+        self._reward_safe_dist(punishment=0.25)
+        self._reward_collision(punishment=10)
+        self._reward_goal_approached(reward_factor=0.3, penalty_factor=0.4)
+
+    def _cal_reward_rule_02(self, actions: np.ndarray, global_plans, robot_poses):
+        self._set_current_dist_to_globalplan(global_plans, robot_poses)
+        self._reward_distance_traveled(actions, consumption_factor=0.0075)
+        self._reward_following_global_plan(actions)
+        self._reward_goal_reached(reward=15)
+        self._reward_safe_dist(punishment=0.25)
+        self._reward_collision(punishment=10)
+        self._reward_goal_approached(reward_factor=0.3, penalty_factor=0.4)
+
+    def _cal_reward_rule_03(self, actions: np.ndarray, global_plans, robot_poses):
+        self._set_current_dist_to_globalplan(global_plans, robot_poses)
+        self._reward_following_global_plan(actions)
+        safe = self._scan_min > self.safe_dist
+        self._reward_distance_global_plan(safe, reward_factor=0.2, penalty_factor=0.3)
+        self.last_dist_to_path[~safe] = np.nan
+        self._reward_goal_reached(reward=15)
+        self._reward_safe_dist(punishment=0.25)
+        self._reward_collision(punishment=10)
+        self._reward_goal_approached(reward_factor=0.3, penalty_factor=0.4)
+
+    def _cal_reward_rule_04(self, actions: np.ndarray, global_plans, robot_poses):
+        self._set_current_dist_to_globalplan(global_plans, robot_poses)
+        self._reward_following_global_plan(actions)
+        safe = self._scan_min > self.safe_dist + 0.35
+        self._reward_distance_global_plan(safe, reward_factor=0.2, penalty_factor=0.3)
+        self._reward_abrupt_direction_change(safe, actions)
+        self._reward_reverse_drive(safe, actions)
+        self.last_dist_to_path[~safe] = np.nan
+        self._reward_goal_reached(reward=15)
+        self._reward_safe_dist(punishment=0.25)
+        self._reward_collision(punishment=10)
+        self._reward_goal_approached(reward_factor=0.3, penalty_factor=0.4)
+
+    def _cal_reward_rule_05(self, actions: np.ndarray, global_plans, robot_poses):
+        self._set_current_dist_to_globalplan(global_plans, robot_poses)
+        safe = self._scan_min > self.safe_dist
+        self._reward_distance_global_plan(safe, reward_factor=0.2, penalty_factor=0.3)
+        self._reward_abrupt_vel_change(safe, actions, vel_idx=0, factor=1.0)
+        self._reward_abrupt_vel_change(safe, actions, vel_idx=-1, factor=0.5)
+        if self.holonomic:
+            self._reward_abrupt_vel_change(safe, actions, vel_idx=1, factor=0.5)
+        self._reward_reverse_drive(safe, actions, 0.0001)
+        self.last_dist_to_path[~safe] = np.nan
+        self._reward_goal_reached(reward=17.5)
+        self._reward_safe_dist(punishment=0.25)
+        self._reward_collision(punishment=10)
+        self._reward_goal_approached(reward_factor=0.4, penalty_factor=0.6)
+        self._set_last_action(actions)
+
+    def _cal_reward_rule_barn(self, actions: np.ndarray, global_plans, robot_poses):
+        self._set_current_dist_to_globalplan(global_plans, robot_poses)
+        every = np.ones(self.num_envs, dtype=bool)
+        self._reward_abrupt_vel_change(every, actions, vel_idx=0, factor=1.1)
+        self._reward_abrupt_vel_change(every, actions, vel_idx=-1, factor=0.55)
+        if self.holonomic:
+            self._reward_abrupt_vel_change(every, actions, vel_idx=1, factor=0.55)
+        self._reward_reverse_drive(every, actions, 0.0001)
+        self._reward_goal_reached(reward=15)
+        self._reward_safe_dist(punishment=0.005)
+        self._reward_collision(punishment=15)
+        self._reward_goal_approached(reward_factor=0.5, penalty_factor=0.7)
+        self._set_last_action(actions)
+
+    def _set_current_dist_to_globalplan(self, global_plans: List[Union[np.ndarray, None]], robot_poses: np.ndarray):
+        if global_plans is None:
+            return
+        for i, global_plan in enumerate(global_plans):
+            if global_plan is not None and len(global_plan) != 0:
+                self.plan_indices[i].update(global_plan)
+                self._curr_dist_to_path[i], _ = self.plan_indices[i].query(robot_poses[i, 0], robot_poses[i, 1])
+
+    def _set_last_action(self, actions: np.ndarray, mask: np.ndarray = None):
+        if mask is None:
+            self.last_action[:] = actions
+            self._has_last_action[:] = True
+        else:
+            self.last_action[mask] = actions[mask]
+            self._has_last_action |= mask
+
+    def _reward_goal_reached(self, reward: float = 15):
+        """
+        Reward for reaching the goal, overwrites the reward of the terms evaluated before.
+
+        :param reward (float, optional): reward amount for reaching. defaults to 15
+        """
+        reached = self._goal_dist < self.goal_radius
+        self.curr_reward[reached] = reward
+        self.info["is_done"] = reached.copy()
+        self.info["done_reason"][reached] = 2
+        self.info["is_success"][reached] = 1
+
+    def _reward_goal_approached(self, reward_factor: float = 0.3, penalty_factor: float = 0.5):
+        """
+        Reward for approaching the goal.
+
+        :param reward_factor (float, optional): positive factor for approaching goal. defaults to 0.3
+        :param penalty_factor (float, optional): negative factor for withdrawing from goal. defaults to 0.5
+        """
+        diff = self.last_goal_dist - self._goal_dist
+        w = np.where(diff > 0, reward_factor, penalty_factor)
+        valid = ~np.isnan(self.last_goal_dist)
+        self.curr_reward[valid] += (w * diff)[valid]
+        self.last_goal_dist[:] = self._goal_dist
+
+    def _reward_collision(self, punishment: float = 10):
+        """
+        Reward for colliding with an obstacle.
+
+        :param punishment (float, optional): punishment for collision. defaults to 10
+        """
+        collided = self._scan_min <= self.robot_radius
+        self.curr_reward[collided] -= punishment
+        if not self._extended_eval:
+            self.info["is_done"] |= collided
+            self.info["done_reason"][collided] = 1
+            self.info["is_success"][collided] = 0
+        else:
+            self.info["crash"] = collided
+
+    def _reward_safe_dist(self, punishment: float = 0.15):
+        """
+        Reward for undercutting safe distance.
+
+        :param punishment (float, optional): punishment for undercutting. defaults to 0.15
+        """
+        undercut = self._scan_min < self.safe_dist
+        self.curr_reward[undercut] -= punishment
+        if self._extended_eval:
+            self.info["safe_dist"] = undercut
+
+    def _reward_distance_traveled(self, actions: np.ndarray, consumption_factor: float = 0.005):
+        """
+        Reward for driving a certain distance. Supposed to represent "fuel consumption".
+
+        :param consumption_factor (float, optional): weighted velocity punishment. defaults to 0.01
+        """
+        self.curr_reward -= (actions[:, 0] + (actions[:, -1] * 0.001)) * consumption_factor
+
+    def _reward_distance_global_plan(self, mask: np.ndarray, reward_factor: float = 0.1, penalty_factor: float = 0.15):
+        """
+        Reward for approaching/veering away the global plan for the environments in mask.
+
+        :param reward_factor (float, optional): positive factor when approaching global plan. defaults to 0.1
+        :param penalty_factor (float, optional): negative factor when veering away from global plan. defaults to 0.15
+        """
+        # a distance of 0 counts as missing, like in RewardCalculator
+        mask = mask & ~np.isnan(self._curr_dist_to_path) & (self._curr_dist_to_path != 0)
+        diff = self.last_dist_to_path - self._curr_dist_to_path
+        w = np.where(self._curr_dist_to_path < self.last_dist_to_path, reward_factor, penalty_factor)
+        valid = mask & ~np.isnan(self.last_dist_to_path)
+        self.curr_reward[valid] += (w * diff)[valid]
+        self.last_dist_to_path[mask] = self._curr_dist_to_path[mask]
+
+    def _reward_following_global_plan(self, actions: np.ndarray, dist_to_path: float = 0.5):
+        """
+        Reward for travelling on the global plan.
+
+        :param dist_to_path (float, optional): applies reward within this distance
+        """
+        # comparisons with NaN are False
+        on_path = (self._curr_dist_to_path != 0) & (self._curr_dist_to_path <= dist_to_path)
+        self.curr_reward[on_path] += 0.1 * actions[on_path, 0]
+
+    def _reward_abrupt_direction_change(self, mask: np.ndarray, actions: np.ndarray):
+        """
+        Applies a penalty when an abrupt change of direction occured for the environments in mask.
+        """
+        valid = mask & self._has_last_action
+        vel_diff = np.abs(actions[:, -1] - self.last_action[:, -1])
+        self.curr_reward[valid] -= ((vel_diff ** 4) / 50)[valid]
+        self._set_last_action(actions, mask)
+
+    def _reward_reverse_drive(self, mask: np.ndarray, actions: np.ndarray, penalty: float = 0.01):
+        """
+        Applies a penalty for driving backwards for the environments in mask.
+        """
+        reverse = mask & (actions[:, 0] < 0)
+        self.curr_reward[reverse] -= penalty
+
+    def _reward_abrupt_vel_change(self, mask: np.ndarray, actions: np.ndarray, vel_idx: int, factor: float = 1):
+        """
+        Applies a penalty when an abrupt change of velocity occured for the environments in mask.
+        """
+        valid = mask & self._has_last_action
+        vel_diff = np.abs(actions[:, vel_idx] - self.last_action[:, vel_idx])
+        self.curr_reward[valid] -= (((vel_diff ** 4) / 100) * factor)[valid]
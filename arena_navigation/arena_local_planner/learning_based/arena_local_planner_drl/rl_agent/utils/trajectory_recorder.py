@@ -0,0 +1,271 @@
+"""
+Recording of FlatlandEnv transitions.
+
+Storage layout of a recording directory:
+
+    meta.json               dtype, row shape and number of rows of every column
+    <column>.bin            raw, append-only rows of a column, readable with np.memmap
+
+Step columns (one row per transition, the first row of an episode holds the observation after the reset):
+    scan (num_beams,) float32, goal_in_robot_frame (2,) float32, robot_pose (3,) float64,
+    action (3,) float32 - applied [linear x, linear y, angular z], agent_action (act_dim,) float32 - as chosen
+    by the agent, reward float32, done bool, plan_id int64 - row of the plans table, -1 if no plan
+
+Tables:
+    episodes (4,) int64     first step row, number of step rows, done_reason (-1 if not finished), is_success
+    plans (2,) int64        first row in plan_points and number of waypoints of a global plan
+    plan_points (2,) float64
+"""
+
+import json
+import os
+from typing import Dict, Union
+
+import gym
+import numpy as np
+
+
+def _make_recording_dir(path: str) -> str:
+    """
+    Creates the directory of a new recording. An existing directory is only used if it is empty, otherwise
+    <path>_1, <path>_2, ... is taken, so that a restarted run never appends to the column files of a former one.
+    """
+    candidate, counter = path, 0
+    while True:
+        try:
+            os.makedirs(candidate)
+            return candidate
+        except FileExistsError:
+            if os.path.isdir(candidate) and not os.listdir(candidate):
+                return candidate
+        counter += 1
+        candidate = f"{path}_{counter}"
+
+
+class _Column:
+    """append-only column file with a fixed size chunk buffer in RAM"""
+
+    def __init__(self, path: str, dtype: np.dtype, shape: tuple, chunk_size: int):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.shape = tuple(shape)
+        self.rows = 0
+        self._buffer = np.zeros((chunk_size,) + self.shape, dtype=self.dtype)
+        self._fill = 0
+        self._file = open(path, "ab")
+
+    def append(self, row):
+        self._buffer[self._fill] = row
+        self._fill += 1
+        self.rows += 1
+        if self._fill == len(self._buffer):
+            self.flush()
+
+    def extend(self, rows: np.ndarray):
+        rows = np.asarray(rows, dtype=self.dtype).reshape((-1,) + self.shape)
+        if self._fill + len(rows) <= len(self._buffer):
+            self._buffer[self._fill : self._fill + len(rows)] = rows
+            self._fill += len(rows)
+            self.rows += len(rows)
+            return
+        # larger than the free part of the buffer, written straight to the file
+        self.flush()
+        self._file.write(np.ascontiguousarray(rows).tobytes())
+        self.rows += len(rows)
+
+    def flush(self):
+        if self._fill:
+            self._file.write(self._buffer[: self._fill].tobytes())
+            self._fill = 0
+        self._file.flush()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+    def describe(self) -> dict:
+        return {"dtype": self.dtype.str, "shape": list(self.shape), "rows": self.rows - self._fill}
+
+
+class TrajectoryWriter:
+    def __init__(self, path: str, chunk_size: int = 1024):
+        """
+        Streams transitions column-wise into append-only binary files, see the layout at the top of the module.
+
+        Every column keeps at most chunk_size rows in RAM. Every chunk_size steps the chunks are appended to the
+        files and meta.json is rewritten, so a recording can be read up to the last flush while it is still written.
+
+        Args:
+            path (str): directory of the recording, created if necessary. If it is not empty, the recording is
+                written to the first free <path>_<n> instead, see self.path.
+            chunk_size (int, optional): rows per column kept in RAM. Defaults to 1024.
+        """
+        self.path = _make_recording_dir(path)
+        self.chunk_size = chunk_size
+        self._columns: Dict[str, _Column] = {}
+        self._episode_start = None
+        # an empty recording claims the directory right away
+        self.flush()
+
+    def _column(self, name: str, dtype: np.dtype, shape: tuple) -> _Column:
+        if name not in self._columns:
+            self._columns[name] = _Column(os.path.join(self.path, f"{name}.bin"), dtype, shape, self.chunk_size)
+        return self._columns[name]
+
+    @property
+    def num_steps(self) -> int:
+        return self._columns["reward"].rows if "reward" in self._columns else 0
+
+    def add_plan(self, plan: np.ndarray) -> int:
+        """appends a global plan to the plans table and returns its id"""
+        points = self._column("plan_points", np.float64, (2,))
+        plans = self._column("plans", np.int64, (2,))
+        plans.append((points.rows, len(plan)))
+        points.extend(np.asarray(plan)[:, :2])
+        return plans.rows - 1
+
+    def add_step(self, **fields: Union[np.ndarray, float]):
+        """appends one row to every step column, the columns are created with dtype and shape of the first row"""
+        if self._episode_start is None:
+            self.begin_episode()
+        for name, value in fields.items():
+            value = np.asarray(value)
+            self._column(name, value.dtype, value.shape).append(value)
+        if self.num_steps % self.chunk_size == 0:
+            self.flush()
+
+    def begin_episode(self):
+        self._episode_start = self.num_steps
+
+    def end_episode(self, done_reason: int = -1, is_success: int = 0):
+        if self._episode_start is None:
+            return
+        num_steps = self.num_steps - self._episode_start
+        if num_steps:
+            row = (self._episode_start, num_steps, done_reason, is_success)
+            self._column("episodes", np.int64, (4,)).append(row)
+        self._episode_start = None
+
+    def flush(self):
+        for column in self._columns.values():
+            column.flush()
+        meta = {
+            "chunk_size": self.chunk_size,
+            "columns": {name: column.describe() for name, column in self._columns.items()},
+        }
+        tmp_path = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp_path, "w") as fd:
+            json.dump(meta, fd, indent=2)
+        os.replace(tmp_path, os.path.join(self.path, "meta.json"))
+
+    def close(self):
+        self.end_episode()
+        self.flush()
+        for column in self._columns.values():
+            column.close()
+
+
+class TrajectoryDataset:
+    def __init__(self, path: str):
+        """
+        Read-only access to a recording of TrajectoryWriter, every column is memory-mapped.
+
+        Args:
+            path (str): directory of the recording
+        """
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r") as fd:
+            self.meta = json.load(fd)
+        self.columns = {}
+        for name, desc in self.meta["columns"].items():
+            shape = (desc["rows"],) + tuple(desc["shape"])
+            if desc["rows"] == 0:
+                self.columns[name] = np.zeros(shape, dtype=np.dtype(desc["dtype"]))
+            else:
+                self.columns[name] = np.memmap(
+                    os.path.join(path, f"{name}.bin"), dtype=np.dtype(desc["dtype"]), mode="r", shape=shape
+                )
+        self.episodes = self.columns.get("episodes", np.zeros((0, 4), dtype=np.int64))
+
+    def __len__(self) -> int:
+        return len(self.columns["reward"]) if "reward" in self.columns else 0
+
+    @property
+    def num_episodes(self) -> int:
+        return len(self.episodes)
+
+    def get_episode(self, idx: int) -> Dict[str, np.ndarray]:
+        """memory-mapped views of the step columns of an episode"""
+        start, length = self.episodes[idx, :2]
+        return {
+            name: column[start : start + length]
+            for name, column in self.columns.items()
+            if name not in ("episodes", "plans", "plan_points")
+        }
+
+    def get_plan(self, plan_id: int) -> np.ndarray:
+        if plan_id < 0:
+            return np.zeros((0, 2))
+        start, length = self.columns["plans"][plan_id]
+        return self.columns["plan_points"][start : start + length]
+
+
+class TrajectoryRecorder(gym.Wrapper):
+    def __init__(self, env: gym.Env, path: str, chunk_size: int = 1024):
+        """
+        Records the transitions of a FlatlandEnv: the obs_dict of every step (scan, goal, robot pose and global plan),
+        the actions, rewards and dones, see TrajectoryWriter. A global plan is only stored when it changed.
+
+        Args:
+            env (gym.Env): FlatlandEnv to record
+            path (str): directory of the recording, see TrajectoryWriter
+            chunk_size (int, optional): rows per column kept in RAM. Defaults to 1024.
+        """
+        super(TrajectoryRecorder, self).__init__(env)
+        self.writer = TrajectoryWriter(path, chunk_size)
+        self._last_plan = None
+        self._plan_id = -1
+
+    def _record(self, agent_action: np.ndarray, reward: float, done: bool):
+        flatland_env = self.env.unwrapped
+        obs_dict = flatland_env._last_obs_dict
+
+        plan = obs_dict["global_plan"]
+        if plan is not self._last_plan:
+            self._last_plan = plan
+            self._plan_id = self.writer.add_plan(plan) if plan is not None and len(plan) else -1
+
+        robot_pose = obs_dict["robot_pose"]
+        self.writer.add_step(
+            scan=np.asarray(obs_dict["laser_scan"], dtype=np.float32),
+            goal_in_robot_frame=np.asarray(obs_dict["goal_in_robot_frame"], dtype=np.float32),
+            robot_pose=np.array([robot_pose.x, robot_pose.y, robot_pose.theta]),
+            action=np.asarray(flatland_env._last_action, dtype=np.float32),
+            agent_action=np.asarray(agent_action, dtype=np.float32).reshape(-1),
+            reward=np.float32(reward),
+            done=np.bool_(done),
+            plan_id=np.int64(self._plan_id),
+        )
+
+    def reset(self, **kwargs):
+        obs = self.env.reset(**kwargs)
+        # an episode which was not done yet is closed with done_reason -1
+        self.writer.end_episode()
+        self.writer.begin_episode()
+        self._record(np.zeros(self._agent_action_dim), 0.0, False)
+        return obs
+
+    def step(self, action):
+        obs, reward, done, info = self.env.step(action)
+        self._record(action, reward, done)
+        if done:
+            self.writer.end_episode(info.get("done_reason", -1), info.get("is_success", 0))
+        return obs, reward, done, info
+
+    @property
+    def _agent_action_dim(self) -> int:
+        return 1 if isinstance(self.action_space, gym.spaces.Discrete) else self.action_space.shape[0]
+
+    def close(self):
+        self.writer.close()
+        return self.env.close()
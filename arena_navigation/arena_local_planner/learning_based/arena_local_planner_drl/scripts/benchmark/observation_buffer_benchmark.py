@@ -0,0 +1,141 @@
+#! /usr/bin/env python3
+"""
+Micro-benchmark of the observation assembly of ObservationCollector.
+
+Compares the former path (np.array of the ranges, NaN mask, astype, np.hstack and a list of Pose2D per
+global plan message) with the preallocated ObservationRingBuffer / GlobalPlanBuffer, the global plan both
+deserialized and serialized as the ObservationCollector receives it. For every path the
+mean time per step and the peak of the memory allocated on top of the persistent buffers (tracemalloc) is printed.
+
+usage: python scripts/benchmark/observation_buffer_benchmark.py [--num_beams 360] [--plan_length 200]
+"""
+import argparse
+import os
+import struct
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from geometry_msgs.msg import Pose2D, PoseStamped
+from nav_msgs.msg import Path
+from tf.transformations import euler_from_quaternion
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from rl_agent.utils.observation_buffer import GlobalPlanBuffer, ObservationRingBuffer
+
+
+def legacy_scan_step(ranges: tuple, range_max: float, rho: float, theta: float, last_action: np.ndarray):
+    scan = np.array(ranges)
+    scan[np.isnan(scan)] = range_max
+    scan = scan.astype(np.float32)
+    merged_obs = np.hstack([scan, np.array([rho, theta]), last_action])
+    obs_dict = {"laser_scan": scan, "goal_in_robot_frame": [rho, theta], "last_action": last_action}
+    return merged_obs, obs_dict
+
+
+def legacy_global_plan(msg: Path) -> np.ndarray:
+    def pose3D_to_pose2D(pose3d):
+        pose2d = Pose2D()
+        pose2d.x = pose3d.position.x
+        pose2d.y = pose3d.position.y
+        q = pose3d.orientation
+        pose2d.theta = euler_from_quaternion((q.x, q.y, q.z, q.w))[2]
+        return pose2d
+
+    global_plan_2d = list(map(lambda p: pose3D_to_pose2D(p.pose), msg.poses))
+    return np.array(list(map(lambda p2d: [p2d.x, p2d.y], global_plan_2d)))
+
+
+def measure(fnc, num_steps: int):
+    """mean time per step and peak memory allocated by fnc on top of the memory in use before"""
+    fnc()  # warm up, e.g. growing of the buffers
+    start = time.perf_counter()
+    for _ in range(num_steps):
+        fnc()
+    duration = (time.perf_counter() - start) / num_steps
+
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    for _ in range(num_steps):
+        fnc()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return duration, peak - baseline
+
+
+def make_plan_msg(plan_length: int) -> Path:
+    msg = Path()
+    for i, yaw in enumerate(np.linspace(-np.pi, np.pi, plan_length)):
+        pose = PoseStamped()
+        pose.pose.position.x, pose.pose.position.y = 0.05 * i, np.sin(0.05 * i)
+        pose.pose.orientation.z, pose.pose.orientation.w = np.sin(yaw / 2), np.cos(yaw / 2)
+        msg.poses.append(pose)
+    return msg
+
+
+def serialize_plan_msg(msg: Path, frame_id: bytes = b"map") -> bytes:
+    """wire format of nav_msgs/Path, as rospy.AnyMsg receives it"""
+    header = struct.pack(f"<4I{len(frame_id)}s", 0, 0, 0, len(frame_id), frame_id)
+    parts = [header, struct.pack("<I", len(msg.poses))]
+    for pose_stamped in msg.poses:
+        position, orientation = pose_stamped.pose.position, pose_stamped.pose.orientation
+        parts.append(header)
+        parts.append(struct.pack("<7d", position.x, position.y, position.z,
+                                 orientation.x, orientation.y, orientation.z, orientation.w))
+    return b"".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="micro-benchmark of the observation assembly")
+    parser.add_argument("--num_beams", type=int, default=360)
+    parser.add_argument("--plan_length", type=int, default=200)
+    parser.add_argument("--num_steps", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    ranges = rng.uniform(0.1, 8.0, args.num_beams).astype(np.float32)
+    ranges[rng.integers(0, args.num_beams, args.num_beams // 20)] = np.nan
+    # rospy decodes float32[] into a tuple, numpy_msg into a np.frombuffer view of the serialized bytes
+    ranges_tuple = tuple(float(r) for r in ranges)
+    ranges_bytes = struct.pack(f"<{args.num_beams}f", *ranges)
+    range_max, rho, theta, last_action = 8.0, 3.0, 0.5, np.zeros(3)
+
+    obs_buffer = ObservationRingBuffer(args.num_beams, args.num_beams + 5)
+
+    def buffered_scan_step():
+        obs = obs_buffer.next_slot()
+        scan = obs_buffer.write_scan(obs, np.frombuffer(ranges_bytes, dtype=np.float32), range_max)
+        obs_buffer.write_goal(obs, rho, theta)
+        obs_buffer.write_action(obs, last_action)
+        return obs, scan
+
+    legacy_obs, _ = legacy_scan_step(ranges_tuple, range_max, rho, theta, last_action)
+    assert np.allclose(legacy_obs, buffered_scan_step()[0])
+
+    plan_msg = make_plan_msg(args.plan_length)
+    plan_buffer = GlobalPlanBuffer()
+    assert np.allclose(legacy_global_plan(plan_msg), plan_buffer.parse(plan_msg))
+    legacy_yaw = [euler_from_quaternion((0, 0, p.pose.orientation.z, p.pose.orientation.w))[2] for p in plan_msg.poses]
+    assert np.allclose(legacy_yaw, plan_buffer.yaw)
+    plan_bytes = serialize_plan_msg(plan_msg)
+    assert np.allclose(legacy_global_plan(plan_msg), plan_buffer.parse_serialized(plan_bytes))
+    assert np.allclose(legacy_yaw, plan_buffer.yaw)
+
+    def legacy_scan():
+        return legacy_scan_step(ranges_tuple, range_max, rho, theta, last_action)
+
+    results = {
+        "scan legacy": measure(legacy_scan, args.num_steps),
+        "scan buffered": measure(buffered_scan_step, args.num_steps),
+        "global plan legacy": measure(lambda: legacy_global_plan(plan_msg), args.num_steps // 10),
+        "global plan buffered": measure(lambda: plan_buffer.parse(plan_msg), args.num_steps // 10),
+        "global plan serialized": measure(lambda: plan_buffer.parse_serialized(plan_bytes), args.num_steps),
+    }
+    print(f"{'':<22}{'time/step [us]':>16}{'peak allocated [B]':>20}")
+    for name, (duration, allocated) in results.items():
+        print(f"{name:<22}{duration * 1e6:>16.1f}{allocated:>20d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#! /usr/bin/env python3
+"""
+Benchmark of reward rules and feature extractors on a recording of TrajectoryRecorder (--record_trajectories).
+
+The recorded episodes are replayed with ReplayFlatlandEnv and random actions. For every reward rule the steps per
+second of the replay including the reward calculation are printed. With --extractors the observations of the
+replay are batched and fed through the given feature extractors, the samples per second of the forward passes
+are printed. The feature extractors read the ros parameters "model" and "actions_in_obs" on import, therefore
+a roscore with these parameters is needed for them.
+
+usage: python scripts/benchmark/replay_benchmark.py --recording <dir> [--rules rule_00 rule_03]
+                                                    [--extractors EXTRACTOR_1 EXTRACTOR_6]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(DIR, "..", ".."))
+from rl_agent.envs.replay_flatland_env import ReplayFlatlandEnv
+
+SIMULATOR_SETUP_DIR = os.path.join(DIR, "..", "..", "..", "..", "..", "..", "simulator_setup")
+
+
+def replay(env: ReplayFlatlandEnv, num_steps: int, observations: np.ndarray = None) -> float:
+    """steps the env with random actions, optionally stores the observations. returns the steps per second"""
+    actions = [env.action_space.sample() for _ in range(1000)]
+    env.reset()
+    start = time.perf_counter()
+    for i in range(num_steps):
+        obs, _, done, _ = env.step(actions[i % len(actions)])
+        if done:
+            obs = env.reset()
+        if observations is not None:
+            observations[i] = obs
+    return num_steps / (time.perf_counter() - start)
+
+
+def benchmark_extractor(name: str, observation_space, observations: np.ndarray, batch_size: int) -> float:
+    """returns the samples per second of the forward passes of the feature extractor"""
+    import torch as th
+
+    from rl_agent.model import feature_extractors
+
+    extractor = getattr(feature_extractors, name)(observation_space)
+    extractor.eval()
+    batches = th.split(th.as_tensor(observations), batch_size)
+    with th.no_grad():
+        extractor(batches[0])  # warm up
+        start = time.perf_counter()
+        for batch in batches:
+            extractor(batch)
+    return len(observations) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark of reward rules and feature extractors on a recording")
+    parser.add_argument("--recording", type=str, required=True, help="directory of the recording")
+    parser.add_argument("--robot", type=str, default="burger", help="robot model of the recording")
+    parser.add_argument("--discrete", action="store_true", help="discrete action space")
+    parser.add_argument("--actions_in_obs", action="store_true", help="last action is part of the observation")
+    parser.add_argument("--rules", type=str, nargs="+", default=["rule_00", "rule_01", "rule_02", "rule_03", "rule_04"])
+    parser.add_argument("--extractors", type=str, nargs="*", default=[], help="e.g. EXTRACTOR_1 EXTRACTOR_6")
+    parser.add_argument("--num_steps", type=int, default=20000)
+    parser.add_argument("--batch_size", type=int, default=256)
+    args = parser.parse_args()
+
+    PATHS = {
+        "robot_setting": os.path.join(SIMULATOR_SETUP_DIR, "robot", f"{args.robot}.model.yaml"),
+        "robot_as": os.path.join(DIR, "..", "..", "configs", f"default_settings_{args.robot}.yaml"),
+    }
+
+    def make_env(rule: str) -> ReplayFlatlandEnv:
+        return ReplayFlatlandEnv(
+            args.recording,
+            rule,
+            args.discrete,
+            PATHS=PATHS,
+            actions_in_obs=args.actions_in_obs,
+            max_steps_per_episode=np.inf,
+        )
+
+    env = make_env(args.rules[0])
+    print(f"{env.dataset.num_episodes} episodes, {len(env.dataset)} steps")
+    print(f"{'':<16}{'steps/s':>12}")
+    for rule in args.rules:
+        print(f"{rule:<16}{replay(make_env(rule), args.num_steps):>12.0f}")
+
+    if args.extractors:
+        observations = np.zeros((args.num_steps,) + env.observation_space.shape, dtype=np.float32)
+        replay(env, args.num_steps, observations)
+        print(f"{'':<16}{'samples/s':>12}")
+        for name in args.extractors:
+            samples_per_sec = benchmark_extractor(name, env.observation_space, observations, args.batch_size)
+            print(f"{name:<16}{samples_per_sec:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
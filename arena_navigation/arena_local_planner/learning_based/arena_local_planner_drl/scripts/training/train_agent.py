@@ -11,6 +11,8 @@ from stable_baselines3.common.callbacks import (
 )
 from stable_baselines3.common.policies import ActorCriticPolicy, BasePolicy
 
+from rl_agent.envs.batched_flatland_env import BatchedFlatlandVecEnv
+from rl_agent.envs.headless_flatland_env import HeadlessFlatlandEnv
 from rl_agent.model.agent_factory import AgentFactory
 from rl_agent.model.base_agent import BaseAgent
 from tools.argsparser import parse_training_args
@@ -19,6 +21,22 @@ from tools.train_agent_utils import *
 from tools.staged_train_callback import InitiateNewTrainStage
 
 
+def make_headless_env(args, params: dict, PATHS: dict, n_envs: int, train: bool = True) -> HeadlessFlatlandEnv:
+    """HeadlessFlatlandEnv on the map of --headless_map with the hyperparameters of the agent"""
+    return HeadlessFlatlandEnv(
+        n_envs,
+        params["reward_fnc"],
+        params["discrete_action_space"],
+        args.headless_map,
+        goal_radius=params["goal_radius"],
+        max_steps_per_episode=params["train_max_steps_per_episode" if train else "eval_max_steps_per_episode"],
+        PATHS=PATHS,
+        actions_in_obs=params.get("actions_in_observationspace", False),
+        num_obstacles=args.headless_obstacles,
+        seed=None if train else 0,
+    )
+
+
 def main():
     args, _ = parse_training_args()
 
@@ -26,6 +44,9 @@ def main():
     # in order to be better able to locate bugs
     if args.debug:
         rospy.init_node("debug_node", disable_signals=False)
+    # in batched mode all environments share the node of the training process
+    elif args.batched_env:
+        rospy.init_node("train_env_batched", disable_signals=False)
 
     # generate agent name and model specific paths
     AGENT_NAME = get_agent_name(args)
@@ -36,8 +57,9 @@ def main():
     # for training with start_arena_flatland.launch
     ns_for_nodes = "/single_env" not in rospy.get_param_names()
 
-    # check if simulations are booted
-    wait_for_nodes(with_ns=ns_for_nodes, n_envs=args.n_envs, timeout=5)
+    # check if simulations are booted, the headless environments simulate in this process
+    if args.headless_map is None:
+        wait_for_nodes(with_ns=ns_for_nodes, n_envs=args.n_envs, timeout=5)
 
     # initialize hyperparameters (save to/ load from json)
     params = initialize_hyperparameters(
@@ -49,7 +71,25 @@ def main():
 
     # instantiate train environment
     # when debug run on one process only
-    if not args.debug and ns_for_nodes:
+    assert not (args.batched_env and args.record_trajectories), "--record_trajectories is not supported with --batched_env"
+    # only BatchedFlatlandVecEnv overlaps the steps, with the other vec envs step waits for the I/O thread right away
+    assert not args.pipelined_step or (args.batched_env and ns_for_nodes and args.headless_map is None), \
+        "--pipelined_step requires --batched_env with the namespaced simulations of start_arena_flatland.launch"
+    assert args.headless_map is None or not (
+        args.batched_env or args.shared_memory_env or args.record_trajectories
+    ), "--headless_map can't be combined with --batched_env, --shared_memory_env or --record_trajectories"
+    if args.headless_map is not None:
+        env = make_headless_env(args, params, PATHS, args.n_envs)
+    elif args.batched_env and ns_for_nodes:
+        env = BatchedFlatlandVecEnv(
+            [make_envs(args, ns_for_nodes, i, params=params, PATHS=PATHS) for i in range(args.n_envs)]
+        )
+    elif args.shared_memory_env and not args.debug and ns_for_nodes:
+        env = SharedMemoryVecEnv(
+            [make_envs(args, ns_for_nodes, i, params=params, PATHS=PATHS) for i in range(args.n_envs)],
+            start_method="fork",
+        )
+    elif not args.debug and ns_for_nodes:
         env = SubprocVecEnv(
             [make_envs(args, ns_for_nodes, i, params=params, PATHS=PATHS) for i in range(args.n_envs)],
             start_method="fork",
@@ -64,7 +104,8 @@ def main():
         treshhold_type="succ",
         upper_threshold=0.9,
         lower_threshold=0.7,
-        task_mode=params["task_mode"],
+        # the headless environments have no curriculum stages
+        task_mode=params["task_mode"] if args.headless_map is None else "random",
         verbose=1,
     )
 
@@ -73,7 +114,9 @@ def main():
 
     # instantiate eval environment
     # take task_manager from first sim (currently evaluation only provided for single process)
-    if ns_for_nodes:
+    if args.headless_map is not None:
+        eval_env = make_headless_env(args, params, PATHS, 1, train=False)
+    elif ns_for_nodes:
         eval_env = DummyVecEnv(
             [
                 make_envs(
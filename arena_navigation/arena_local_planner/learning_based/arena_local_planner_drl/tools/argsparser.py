@@ -18,6 +18,43 @@ def training_args(parser):
         action="store_true",
         help="disables multiprocessing in order to debug",
     )
+    parser.add_argument(
+        "--batched_env",
+        action="store_true",
+        help="steps all environments from the training process with one "
+        "fan-out per step instead of one subprocess per environment",
+    )
+    parser.add_argument(
+        "--shared_memory_env",
+        action="store_true",
+        help="exchanges observations, rewards and dones with the environment "
+        "subprocesses through shared memory instead of pickling them",
+    )
+    parser.add_argument(
+        "--pipelined_step",
+        action="store_true",
+        help="advances the simulation of every training environment on a dedicated I/O thread, the results of an "
+        "environment are gathered while the others still simulate, requires --batched_env",
+    )
+    parser.add_argument(
+        "--record_trajectories",
+        action="store_true",
+        help="records the transitions of the training environments into memory-mapped column files "
+        "in the agent directory (not available with --batched_env)",
+    )
+    parser.add_argument(
+        "--headless_map",
+        type=str,
+        metavar="[map yaml]",
+        help="trains on the NumPy simulator of HeadlessFlatlandEnv with this map_server yaml instead of flatland, "
+        "only a roscore is needed (no curriculum stages and no global plan)",
+    )
+    parser.add_argument(
+        "--headless_obstacles",
+        type=int,
+        default=10,
+        help="number of obstacles per environment with --headless_map",
+    )
     group = parser.add_mutually_exclusive_group(required=True)
 
     import rl_agent.model.custom_policy
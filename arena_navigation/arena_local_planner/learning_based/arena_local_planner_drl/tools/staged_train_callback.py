@@ -4,8 +4,9 @@ import numpy as np
 import time
 
 from typing import List
-from std_msgs.msg import Bool
+from std_msgs.msg import Int16
 from stable_baselines3.common.callbacks import BaseCallback, EvalCallback
+from task_generator.task_generator.curriculum import CURRICULUM_NUM_STAGES_PARAM, CURRICULUM_STAGE_TOPIC
 from task_generator.task_generator.tasks import StagedRandomTask
 
 
@@ -14,6 +15,9 @@ class InitiateNewTrainStage(BaseCallback):
     Introduces new training stage when threshhold reached.
     It must be used with "EvalCallback".
 
+    The stage is broadcast to all namespaces with one latched message on CURRICULUM_STAGE_TOPIC, the callback
+    keeps track of the current stage itself and logs how long the agent dwelled in the previous stage.
+
     :param treshhold_type (str): checks threshhold for either percentage of successful episodes (succ) or mean reward (rew)
     :param rew_threshold (int): mean reward threshold to trigger new stage
     :param succ_rate_threshold (float): threshold percentage of succesful episodes to trigger new stage
@@ -67,29 +71,14 @@ class InitiateNewTrainStage(BaseCallback):
 
         if self.activated:
             rospy.set_param("/last_stage_reached", False)
-            self._instantiate_publishers()
-
-            self._trigger = Bool()
-            self._trigger.data = True
-
-    def _instantiate_publishers(self):
-        self._publishers_next = []
-        self._publishers_previous = []
-
-        self._publishers_next.append(
-            rospy.Publisher(f"/eval_sim/next_stage", Bool, queue_size=1)
-        )
-        self._publishers_previous.append(
-            rospy.Publisher(f"/eval_sim/previous_stage", Bool, queue_size=1)
-        )
-
-        for env_num in range(self.n_envs):
-            self._publishers_next.append(
-                rospy.Publisher(f"/sim_{env_num+1}/next_stage", Bool, queue_size=1)
-            )
-            self._publishers_previous.append(
-                rospy.Publisher(f"/sim_{env_num+1}/previous_stage", Bool, queue_size=1)
+            self._publisher_stage = rospy.Publisher(
+                CURRICULUM_STAGE_TOPIC, Int16, queue_size=1, latch=True
             )
+            # the stage is read once the staged tasks are initialized
+            self._curr_stage = None
+            self._num_stages = None
+            self._stage_start_time = time.monotonic()
+            self._stage_start_timesteps = 0
 
     def _on_step(self, EvalObject: EvalCallback) -> bool:
         assert isinstance(
@@ -104,6 +93,10 @@ class InitiateNewTrainStage(BaseCallback):
                     % EvalObject.n_eval_episodes
                 )
 
+            if self._curr_stage is None:
+                self._curr_stage = rospy.get_param("/curr_stage", 1)
+                self._num_stages = rospy.get_param(CURRICULUM_NUM_STAGES_PARAM)
+
             if (
                 self.threshhold_type == "rew"
                 and EvalObject.best_mean_reward <= self.lower_threshold
@@ -111,10 +104,8 @@ class InitiateNewTrainStage(BaseCallback):
                 self.threshhold_type == "succ"
                 and EvalObject.last_success_rate <= self.lower_threshold
             ):
-                for i, pub in enumerate(self._publishers_previous):
-                    pub.publish(self._trigger)
-                    if i == 0:
-                        self.log_curr_stage(EvalObject.logger)
+                if self._curr_stage > 1:
+                    self._broadcast_stage(self._curr_stage - 1, EvalObject)
 
             if (
                 self.threshhold_type == "rew"
@@ -123,16 +114,27 @@ class InitiateNewTrainStage(BaseCallback):
                 self.threshhold_type == "succ"
                 and EvalObject.last_success_rate >= self.upper_threshold
             ):
-                if not rospy.get_param("/last_stage_reached"):
+                if self._curr_stage < self._num_stages:
                     EvalObject.best_mean_reward = -np.inf
                     EvalObject.last_success_rate = -np.inf
-
-                for i, pub in enumerate(self._publishers_next):
-                    pub.publish(self._trigger)
-                    if i == 0:
-                        self.log_curr_stage(EvalObject.logger)
+                    self._broadcast_stage(self._curr_stage + 1, EvalObject)
+
+    def _broadcast_stage(self, stage: int, EvalObject: EvalCallback):
+        now = time.monotonic()
+        num_timesteps = EvalObject.num_timesteps
+        self._publisher_stage.publish(Int16(stage))
+        rospy.set_param("/last_stage_reached", stage == self._num_stages)
+        if self.verbose > 0:
+            print(
+                f"Stage {self._curr_stage} -> {stage} after {now - self._stage_start_time:.0f}s and "
+                f"{num_timesteps - self._stage_start_timesteps} timesteps"
+            )
+        EvalObject.logger.record("train_stage/dwell_time", now - self._stage_start_time)
+        EvalObject.logger.record("train_stage/dwell_timesteps", num_timesteps - self._stage_start_timesteps)
+        self._curr_stage = stage
+        self._stage_start_time = now
+        self._stage_start_timesteps = num_timesteps
+        self.log_curr_stage(EvalObject.logger)
 
     def log_curr_stage(self, logger):
-        time.sleep(1)
-        curr_stage = rospy.get_param("/curr_stage", -1)
-        logger.record("train_stage/stage_idx", curr_stage)
+        logger.record("train_stage/stage_idx", self._curr_stage)
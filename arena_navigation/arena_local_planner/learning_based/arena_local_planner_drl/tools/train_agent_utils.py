@@ -4,6 +4,10 @@ import argparse
 from datetime import datetime as dt
 import gym
 import json
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from multiprocessing.connection import Connection
+import numpy as np
 import os, rospy
 import rosnode
 import rospkg
@@ -21,6 +25,9 @@ from arena_navigation.arena_local_planner.learning_based.arena_local_planner_drl
 from arena_navigation.arena_local_planner.learning_based.arena_local_planner_drl.rl_agent.envs.flatland_gym_env import (
     FlatlandEnv,
 )
+from arena_navigation.arena_local_planner.learning_based.arena_local_planner_drl.rl_agent.utils.trajectory_recorder import (
+    TrajectoryRecorder,
+)
 
 
 """ 
@@ -412,11 +419,21 @@ def make_envs(
                 params["discrete_action_space"],
                 goal_radius=params["goal_radius"],
                 max_steps_per_episode=params["train_max_steps_per_episode"],
-                debug=args.debug,
+                debug=args.debug or args.batched_env,
                 task_mode=params["task_mode"],
                 curr_stage=params["curr_stage"],
                 PATHS=PATHS,
+                pipelined=args.pipelined_step,
             )
+            if args.record_trajectories:
+                env = TrajectoryRecorder(
+                    env,
+                    os.path.join(
+                        PATHS["model"],
+                        "trajectories",
+                        f"{dt.now().strftime('%Y_%m_%d__%H_%M_%S')}_{train_ns or 'env'}",
+                    ),
+                )
         else:
             # eval env
             env = Monitor(
@@ -427,7 +444,7 @@ def make_envs(
                     goal_radius=params["goal_radius"],
                     max_steps_per_episode=params["eval_max_steps_per_episode"],
                     train_mode=False,
-                    debug=args.debug,
+                    debug=args.debug or args.batched_env,
                     task_mode=params["task_mode"],
                     curr_stage=params["curr_stage"],
                     PATHS=PATHS,
@@ -482,7 +499,7 @@ def wait_for_nodes(
 
 
 from stable_baselines3.common.vec_env import VecNormalize
-from stable_baselines3.common.vec_env.base_vec_env import VecEnv
+from stable_baselines3.common.vec_env.base_vec_env import CloudpickleWrapper, VecEnv
 
 
 def load_vec_normalize(
@@ -510,3 +527,201 @@ def load_vec_normalize(
                 clip_reward=15,
             )
     return env, eval_env
+
+
+def _shared_memory_worker(
+    remote: Connection,
+    parent_remote: Connection,
+    env_fn_wrapper: CloudpickleWrapper,
+    env_idx: int,
+) -> None:
+    """
+    Worker of SharedMemoryVecEnv. Reads its action from and writes observation, reward and done
+    to the shared memory arrays, only the step index and non-empty info dicts are sent over the pipe.
+    The arrays are attached with the "attach" command once the parent has sized them from the spaces.
+    """
+    parent_remote.close()
+    env = env_fn_wrapper.var()
+
+    shms, buffers = {}, {}
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == "step":
+                slot = data % 2
+                # copy the action, the env keeps it as last action while the parent writes the next one
+                obs, reward, done, info = env.step(buffers["actions"][env_idx].copy())
+                if done:
+                    # save final observation where user can get it, then reset
+                    info["terminal_observation"] = obs
+                    obs = env.reset()
+                buffers["obs"][slot, env_idx] = obs
+                buffers["rewards"][slot, env_idx] = reward
+                buffers["dones"][slot, env_idx] = done
+                remote.send(info if info else None)
+            elif cmd == "reset":
+                buffers["obs"][data % 2, env_idx] = env.reset()
+                remote.send(None)
+            elif cmd == "close":
+                env.close()
+                remote.close()
+                break
+            elif cmd == "get_spaces":
+                remote.send((env.observation_space, env.action_space))
+            elif cmd == "attach":
+                for key, (name, shape, dtype) in data.items():
+                    # the parent owns the shared memory and unlinks it in close()
+                    shms[key] = shared_memory.SharedMemory(name=name)
+                    buffers[key] = np.ndarray(shape, dtype=dtype, buffer=shms[key].buf)
+                remote.send(None)
+            elif cmd == "env_method":
+                method = getattr(env, data[0])
+                remote.send(method(*data[1], **data[2]))
+            elif cmd == "get_attr":
+                remote.send(getattr(env, data))
+            elif cmd == "set_attr":
+                remote.send(setattr(env, data[0], data[1]))
+            elif cmd == "is_wrapped":
+                remote.send(isinstance(env, data))
+            elif cmd == "seed":
+                remote.send(env.seed(data))
+            else:
+                raise NotImplementedError(f"`{cmd}` is not implemented in the worker")
+    except KeyboardInterrupt:
+        print("SharedMemoryVecEnv worker: got KeyboardInterrupt")
+    finally:
+        for shm in shms.values():
+            shm.close()
+
+
+class SharedMemoryVecEnv(VecEnv):
+    """
+    Drop-in replacement of SubprocVecEnv which exchanges actions, observations, rewards and dones through
+    preallocated shared memory arrays sized from the spaces of the env. Per step only the step index
+    (and the info dict of envs which are done) travels over the pipes, so no observation is pickled.
+
+    The arrays are double buffered by the parity of the step index: the arrays returned by step_wait and
+    reset stay valid until the next but one step, which is enough for the rollout collection of PPO.
+    Copy them if they have to be kept longer.
+
+    :param env_fns: functions creating the envs, e.g. make_envs(...)
+    :param start_method: method used to start the subprocesses, see SubprocVecEnv
+    """
+
+    def __init__(self, env_fns: list, start_method: str = "fork"):
+        self.waiting = False
+        self.closed = False
+        n_envs = len(env_fns)
+        ctx = mp.get_context(start_method)
+
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(n_envs)])
+        self.processes = []
+        for env_idx, (work_remote, remote, env_fn) in enumerate(zip(self.work_remotes, self.remotes, env_fns)):
+            args = (work_remote, remote, CloudpickleWrapper(env_fn), env_idx)
+            # daemon=True: if the main process crashes, we should not cause things to hang
+            process = ctx.Process(target=_shared_memory_worker, args=args, daemon=True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+        # the buffers are sized from the spaces of the first env and then attached by all workers
+        self.remotes[0].send(("get_spaces", None))
+        observation_space, action_space = self.remotes[0].recv()
+
+        action_shape = () if isinstance(action_space, gym.spaces.Discrete) else action_space.shape
+        buffer_layout = {
+            "obs": ((2, n_envs) + observation_space.shape, np.float32),
+            "rewards": ((2, n_envs), np.float32),
+            "dones": ((2, n_envs), np.bool_),
+            "actions": ((n_envs,) + action_shape, action_space.dtype),
+        }
+        self._shms, self._buffers, buffer_specs = {}, {}, {}
+        for key, (shape, dtype) in buffer_layout.items():
+            size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+            self._shms[key] = shared_memory.SharedMemory(create=True, size=size)
+            self._buffers[key] = np.ndarray(shape, dtype=dtype, buffer=self._shms[key].buf)
+            buffer_specs[key] = (self._shms[key].name, shape, dtype)
+        for remote in self.remotes:
+            remote.send(("attach", buffer_specs))
+        for remote in self.remotes:
+            remote.recv()
+
+        self._step_idx = 0
+        super().__init__(n_envs, observation_space, action_space)
+
+    def step_async(self, actions: np.ndarray) -> None:
+        self._buffers["actions"][:] = np.asarray(actions).reshape(self._buffers["actions"].shape)
+        self._step_idx += 1
+        for remote in self.remotes:
+            remote.send(("step", self._step_idx))
+        self.waiting = True
+
+    def step_wait(self):
+        infos = [remote.recv() or {} for remote in self.remotes]
+        self.waiting = False
+        slot = self._step_idx % 2
+        return self._buffers["obs"][slot], self._buffers["rewards"][slot], self._buffers["dones"][slot], infos
+
+    def reset(self) -> np.ndarray:
+        self._step_idx += 1
+        for remote in self.remotes:
+            remote.send(("reset", self._step_idx))
+        for remote in self.remotes:
+            remote.recv()
+        return self._buffers["obs"][self._step_idx % 2]
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        if self.waiting:
+            for remote in self.remotes:
+                remote.recv()
+        for remote in self.remotes:
+            remote.send(("close", None))
+        for process in self.processes:
+            process.join()
+        for shm in self._shms.values():
+            shm.close()
+            shm.unlink()
+        self.closed = True
+
+    def seed(self, seed: Union[int, None] = None) -> list:
+        for idx, remote in enumerate(self.remotes):
+            remote.send(("seed", seed + idx if seed is not None else None))
+        return [remote.recv() for remote in self.remotes]
+
+    def get_attr(self, attr_name: str, indices=None) -> list:
+        target_remotes = self._get_target_remotes(indices)
+        for remote in target_remotes:
+            remote.send(("get_attr", attr_name))
+        return [remote.recv() for remote in target_remotes]
+
+    def set_attr(self, attr_name: str, value, indices=None) -> None:
+        target_remotes = self._get_target_remotes(indices)
+        for remote in target_remotes:
+            remote.send(("set_attr", (attr_name, value)))
+        for remote in target_remotes:
+            remote.recv()
+
+    def env_method(self, method_name: str, *method_args, indices=None, **method_kwargs) -> list:
+        target_remotes = self._get_target_remotes(indices)
+        for remote in target_remotes:
+            remote.send(("env_method", (method_name, method_args, method_kwargs)))
+        return [remote.recv() for remote in target_remotes]
+
+    def env_is_wrapped(self, wrapper_class: type, indices=None) -> list:
+        target_remotes = self._get_target_remotes(indices)
+        for remote in target_remotes:
+            remote.send(("is_wrapped", wrapper_class))
+        return [remote.recv() for remote in target_remotes]
+
+    def get_images(self) -> list:
+        raise NotImplementedError("SharedMemoryVecEnv does not support rendering")
+
+    def _get_target_remotes(self, indices) -> list:
+        if indices is None:
+            indices = range(self.num_envs)
+        elif isinstance(indices, int):
+            indices = [indices]
+        return [self.remotes[i] for i in indices]
+
@@ -106,77 +106,26 @@ def create_path(node1,node2,corridor_radius,map):
             map[range(x1-corridor_radius,x2+1+corridor_radius,1),slice(y1-corridor_radius,y1+corridor_radius+1)] = 0 # vertical path
 
 def create_rooms(map,tree,room_number,room_width,room_height,no_overlap):
-    rooms_created = 0
     rooms_list = []
     room_vertical_radius = room_width//2
     room_horizontal_radius = room_height//2
     distance = 2*(room_vertical_radius**2+room_horizontal_radius**2)**0.5
     for room in range(1,room_number+1):
-        if rooms_created == room_number:
-            break
-        for i,node in enumerate(random.sample(tree,len(tree))):
+        for node in random.sample(tree,len(tree)):
             x1 = node[0]-room_horizontal_radius
             x2 = node[0]+room_horizontal_radius
             y1 = node[1]-room_vertical_radius
             y2 = node[1]+room_vertical_radius
-
-            if x1<0 or x2>map.shape[1] or y1<0 or y2>map.shape[0]: # if room is out of map
-                if (i == len(tree)-1) and (room > rooms_created):
-                    print("No valid position for room "+str(room)+" found.")
+            if x1<0 or x2>=map.shape[0] or y1<0 or y2>=map.shape[1]: # if room is out of map
                 continue
-
-            if rooms_created == room_number:
-                break
-            if no_overlap:
-                if len(rooms_list)==0:
-                    try:
-                        map[x1,y1]
-                        map[x1,y2]
-                        map[x2,y1]
-                        map[x2,y2]
-                        map[slice(x1,x2),slice(y1,y2)] = 0                     
-                        rooms_created += 1
-                        rooms_list.append(node)
-                        print("Room "+str(room)+" created at position "+str(node[0])+","+str(node[1]))
-                        break
-                    except:
-                        pass
-                else:
-                    for room_node in rooms_list:
-                        collision = False
-                        if np.linalg.norm(np.array(node)-np.array(room_node))<distance:
-                            if (i == len(tree)-1) and (room > rooms_created):
-                                print("No valid position for room "+str(room)+" found.")
-                            collision = True
-                            break
-                    if collision:
-                        continue
-                    try:
-                        map[x1,y1]
-                        map[x1,y2]
-                        map[x2,y1]
-                        map[x2,y2]
-                        map[slice(x1,x2),slice(y1,y2)] = 0                     
-                        rooms_created += 1
-                        rooms_list.append(node)
-                        print("Room "+str(room)+" created at position "+str(node[0])+","+str(node[1]))
-                        break
-                    except:
-                        pass
-                                   
-            else:
-                try:
-                    map[x1,y1]
-                    map[x1,y2]
-                    map[x2,y1]
-                    map[x2,y2]
-                    map[slice(x1,x2),slice(y1,y2)] = 0
-                    rooms_created += 1
-                    rooms_list.append(node)
-                    print("Room "+str(room)+" created at position "+str(node[0])+","+str(node[1]))
-                    break
-                except:
-                    pass
+            if no_overlap and any(np.linalg.norm(np.array(node)-np.array(room_node))<distance for room_node in rooms_list):
+                continue
+            map[slice(x1,x2),slice(y1,y2)] = 0
+            rooms_list.append(node)
+            print("Room "+str(room)+" created at position "+str(node[0])+","+str(node[1]))
+            break
+        else:
+            print("No valid position for room "+str(room)+" found.")
 
 def create_indoor_map(height,width,corridor_radius,iterations,room_number,room_width,room_height,no_overlap):
     tree = [] # initialize empty tree
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# map_engine.py generates the random maps of map_generator.py in batches, seeded and into a map library
+#
+# usage: python map_engine.py --num_maps 500 --library random_maps_library [--config config.yaml] [--seed 0]
+
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import scipy.ndimage
+import yaml
+
+
+def nearest_previous_nodes(nodes, chunk_size=1024): # index of the nearest node (L1 norm) among the nodes before each node
+    # the tree of the indoor maps grows by connecting every sampled node to its nearest node in the tree. The samples
+    # do not depend on the tree, therefore the tree is known up front and the nearest node of every sample is the
+    # nearest of the nodes before it. One masked distance matrix replaces the scan over the tree per iteration, ties go
+    # to the first node like in map_generator.find_nearest_node
+    nearest = np.zeros(len(nodes), dtype=np.int64)
+    for start in range(1, len(nodes), chunk_size):
+        rows = np.arange(start, min(start + chunk_size, len(nodes)))
+        dist = np.abs(nodes[rows, None, :] - nodes[None, :rows[-1], :]).sum(axis=2)
+        dist[np.arange(rows[-1])[None, :] >= rows[:, None]] = np.iinfo(dist.dtype).max
+        nearest[rows] = dist.argmin(axis=1)
+    return nearest
+
+
+def fill_rectangles(map, x1, x2, y1, y2, value): # set all rectangles [x1,x2) x [y1,y2) of the map to value at once
+    # the rectangles are accumulated in a difference array, two cumulative sums give the number of rectangles covering
+    # each cell, so the cost does not depend on the number or size of the rectangles
+    height, width = map.shape
+    x1, x2 = np.clip(x1, 0, height), np.clip(x2, 0, height)
+    y1, y2 = np.clip(y1, 0, width), np.clip(y2, 0, width)
+    valid = (x1 < x2) & (y1 < y2)
+    x1, x2, y1, y2 = x1[valid], x2[valid], y1[valid], y2[valid]
+    diff = np.zeros((height + 1, width + 1), dtype=np.int32)
+    np.add.at(diff, (x1, y1), 1)
+    np.add.at(diff, (x1, y2), -1)
+    np.add.at(diff, (x2, y1), -1)
+    np.add.at(diff, (x2, y2), 1)
+    covered = diff.cumsum(axis=0).cumsum(axis=1)[:height, :width] > 0
+    map[covered] = value
+
+
+class MapEngine:
+    """
+    Generates the indoor and outdoor maps of map_generator.py (1: occupied, 0: free, the first row is the top of the
+    image) with vectorized tree growth, corridor carving and room placement. Every map is determined by its seed.
+    """
+
+    def __init__(self, height=101, width=101, corridor_radius=5, iterations=100, obstacle_number=10,
+                 obstacle_extra_radius=1, room_number=0, room_width=0, room_height=0, no_overlap=True):
+        self.height = height
+        self.width = width
+        self.corridor_radius = corridor_radius
+        self.iterations = iterations
+        self.obstacle_number = obstacle_number
+        self.obstacle_extra_radius = obstacle_extra_radius
+        self.room_number = room_number
+        self.room_width = room_width
+        self.room_height = room_height
+        self.no_overlap = no_overlap
+
+    @classmethod
+    def from_config(cls, config): # parameters of config.yaml
+        keys = ["height", "width", "corridor_radius", "iterations", "obstacle_number", "obstacle_extra_radius",
+                "room_number", "room_width", "room_height", "no_overlap"]
+        return cls(**{key: config[key] for key in keys if key in config})
+
+    def _sample(self, rng, num, radius): # positions within the boundary with tolerance for the corridor width
+        x = rng.integers(radius + 2, self.height - radius - 1, num)
+        y = rng.integers(radius + 2, self.width - radius - 1, num)
+        return np.stack([x, y], axis=1)
+
+    def create_indoor_map(self, rng):
+        r = self.corridor_radius
+        map = np.ones((self.height, self.width), dtype=np.uint8)
+        root = np.array([[self.height // 2, self.width // 2]])
+        tree = np.concatenate([root, self._sample(rng, self.iterations, r)])
+        parents = tree[nearest_previous_nodes(tree)[1:]]
+        nodes = tree[1:]
+        map[tree[:, 0], tree[:, 1]] = 0
+
+        # every node is connected to its nearest node with a horizontal and a vertical corridor, which of the two
+        # corners of the bounding box the corridors meet at is random, see map_generator.create_path
+        x1, x2 = np.minimum(nodes[:, 0], parents[:, 0]), np.maximum(nodes[:, 0], parents[:, 0])
+        y1, y2 = np.minimum(nodes[:, 1], parents[:, 1]), np.maximum(nodes[:, 1], parents[:, 1])
+        constellation1 = ((nodes[:, 0] > parents[:, 0]) & (nodes[:, 1] < parents[:, 1])) | \
+                         ((nodes[:, 0] < parents[:, 0]) & (nodes[:, 1] > parents[:, 1]))
+        coin_flip = rng.random(len(nodes)) >= 0.5
+        row = np.where(coin_flip, x1, x2)
+        col = np.where(constellation1 == coin_flip, y1, y2)
+        fill_rectangles(
+            map,
+            np.concatenate([row - r, x1 - r]),
+            np.concatenate([row + r + 1, x2 + r + 1]),
+            np.concatenate([y1 - r, col - r]),
+            np.concatenate([y2 + r + 1, col + r + 1]),
+            0,
+        )
+        self._create_rooms(map, tree, rng)
+        return map
+
+    def _create_rooms(self, map, tree, rng): # rooms centered on random tree nodes, see map_creator.create_rooms
+        if self.room_number <= 0:
+            return
+        radius_v, radius_h = self.room_width // 2, self.room_height // 2
+        distance = 2 * (radius_v ** 2 + radius_h ** 2) ** 0.5
+        x1, x2 = tree[:, 0] - radius_h, tree[:, 0] + radius_h
+        y1, y2 = tree[:, 1] - radius_v, tree[:, 1] + radius_v
+        # the rooms have to lie within the map
+        candidates = np.flatnonzero((x1 >= 0) & (y1 >= 0) & (x2 < self.height) & (y2 < self.width))
+        candidates = candidates[rng.permutation(len(candidates))]
+        rooms = []
+        for node in candidates:
+            if len(rooms) == self.room_number:
+                break
+            if self.no_overlap and rooms and \
+                    np.min(np.linalg.norm(tree[rooms] - tree[node], axis=1)) < distance:
+                continue
+            rooms.append(node)
+        rooms = np.array(rooms, dtype=np.int64)
+        fill_rectangles(map, x1[rooms], x2[rooms], y1[rooms], y2[rooms], 0)
+
+    def create_outdoor_map(self, rng):
+        r = self.obstacle_extra_radius
+        map = np.ones((self.height, self.width), dtype=np.uint8)
+        map[1:-1, 1:-1] = 0
+        # obstacles of 1 pixel with the extra radius
+        positions = self._sample(rng, self.obstacle_number, r)
+        fill_rectangles(map, positions[:, 0] - r, positions[:, 0] + r + 1, positions[:, 1] - r,
+                        positions[:, 1] + r + 1, 1)
+        return map
+
+    def generate(self, seed, maptype=None): # maptype "indoor" or "outdoor", random like create_random_map if None
+        rng = np.random.default_rng(seed)
+        if maptype is None:
+            maptype = "indoor" if rng.random() >= 0.5 else "outdoor"
+        map = self.create_indoor_map(rng) if maptype == "indoor" else self.create_outdoor_map(rng)
+        return map, maptype
+
+
+def compute_squared_clearance(map): # squared distance in cells of every cell to the closest occupied cell or the border
+    # the squared distances are integers, so the clearance in meters is restored exactly, see MapLibrary.get_clearance
+    free = np.zeros((map.shape[0] + 2, map.shape[1] + 2), dtype=bool)
+    free[1:-1, 1:-1] = map == 0
+    return np.rint(scipy.ndimage.distance_transform_edt(free)[1:-1, 1:-1] ** 2).astype(np.uint32)
+
+
+def get_data_digest(data): # hash of OccupancyGrid.data, identifies a map of a library independent of its metadata
+    return hashlib.sha1(np.asarray(data, dtype=np.int8).tobytes()).hexdigest()[:16]
+
+
+class MapLibrary:
+    """
+    Directory of maps of the same size, the maps and their clearance maps are appended to raw files and read with
+    np.memmap:
+
+        meta.json       height, width, resolution, engine parameters, seed, maptype and data digest of every map
+        maps.bin        uint8 (num_maps, height, width), 1: occupied, 0: free, the first row is the top of the image
+        clearance.bin   uint32 (num_maps, height, width), see compute_squared_clearance
+
+    map_generator_node publishes the maps and sets the ros param /map_library, the task generators look the maps
+    they receive up by their data digest (find) and take the clearance from the library instead of computing it.
+    The memory maps are shared by all processes through the page cache.
+    """
+
+    FORMAT = 2
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r") as fd:
+            self.meta = json.load(fd)
+        if self.meta.get("format") != self.FORMAT:
+            raise ValueError(f"the map library {path} has an old format, generate it again with map_engine.py")
+        shape = (len(self.meta["seeds"]), self.meta["height"], self.meta["width"])
+        if shape[0] == 0:
+            self.maps = np.zeros(shape, dtype=np.uint8)
+            self.squared_clearance = np.zeros(shape, dtype=np.uint32)
+        else:
+            self.maps = np.memmap(os.path.join(path, "maps.bin"), dtype=np.uint8, mode="r", shape=shape)
+            self.squared_clearance = np.memmap(os.path.join(path, "clearance.bin"), dtype=np.uint32, mode="r",
+                                               shape=shape)
+        self._indices = {digest: idx for idx, digest in enumerate(self.meta["digests"])}
+
+    def __len__(self):
+        return len(self.maps)
+
+    @property
+    def resolution(self):
+        return self.meta["resolution"]
+
+    @property
+    def shape(self): # height and width of the maps
+        return self.meta["height"], self.meta["width"]
+
+    def find(self, data): # index of the map with the OccupancyGrid.data, None if it is not in the library
+        return self._indices.get(get_data_digest(data))
+
+    def get_occupancy_data(self, idx): # OccupancyGrid.data of a map, the first row of the grid is the bottom
+        return (np.flipud(self.maps[idx]) * 100).astype(np.int8).ravel()
+
+    def get_clearance(self, idx, resolution):
+        # clearance in meters in the order of get_occupancy_data, the same values as
+        # FreeSpaceSampler.compute_clearance, resolution is the one of the OccupancyGrid
+        return np.sqrt(np.flipud(self.squared_clearance[idx]).ravel().astype(np.float64)) * resolution
+
+    @staticmethod
+    def generate(path, engine, num_maps, resolution=0.2, seed=0, maptype=None):
+        # appends num_maps maps with the seeds seed, seed + 1, ... to the library, the library is created if necessary
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.isfile(meta_path):
+            with open(meta_path, "r") as fd:
+                meta = json.load(fd)
+            if meta.get("format") != MapLibrary.FORMAT:
+                raise ValueError(f"the map library {path} has an old format, generate it into a new directory")
+            assert (meta["height"], meta["width"], meta["resolution"]) == (engine.height, engine.width, resolution), \
+                "the maps of a library must have the same size and resolution"
+        else:
+            meta = {"format": MapLibrary.FORMAT, "height": engine.height, "width": engine.width,
+                    "resolution": resolution, "engine": vars(engine), "seeds": [], "maptypes": [], "digests": []}
+        with open(os.path.join(path, "maps.bin"), "ab") as maps_file, \
+                open(os.path.join(path, "clearance.bin"), "ab") as clearance_file:
+            for map_seed in range(seed, seed + num_maps):
+                map, map_maptype = engine.generate(map_seed, maptype)
+                maps_file.write(map.astype(np.uint8).tobytes())
+                clearance_file.write(compute_squared_clearance(map).tobytes())
+                meta["seeds"].append(map_seed)
+                meta["maptypes"].append(map_maptype)
+                meta["digests"].append(get_data_digest((np.flipud(map) * 100).astype(np.int8)))
+        tmp_path = meta_path + ".tmp"
+        with open(tmp_path, "w") as fd:
+            json.dump(meta, fd)
+        os.replace(tmp_path, meta_path)
+        return MapLibrary(path)
+
+
+if __name__ == '__main__':
+    dir_path = os.path.dirname(os.path.realpath(__file__))
+    parser = argparse.ArgumentParser(description="generate seeded random maps into a map library")
+    parser.add_argument("--num_maps", type=int, default=100)
+    parser.add_argument("--library", type=str, default=os.path.join(dir_path, "random_maps_library"))
+    parser.add_argument("--config", type=str, default=os.path.join(dir_path, "config.yaml"))
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first map, the following maps count up")
+    parser.add_argument("--maptype", type=str, default=None, choices=["indoor", "outdoor"],
+                        help="default: random like map_generator.create_random_map")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = yaml.safe_load(f)
+    engine = MapEngine.from_config(config)
+    start = time.perf_counter()
+    library = MapLibrary.generate(args.library, engine, args.num_maps, config.get("resolution", 0.2), args.seed,
+                                  args.maptype)
+    duration = time.perf_counter() - start
+    print(f"{args.num_maps} maps generated in {duration:.1f}s ({args.num_maps / duration * 60:.0f} maps/min), "
+          f"{len(library)} maps in {args.library}")
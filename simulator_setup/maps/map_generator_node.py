@@ -1,12 +1,18 @@
 #!/usr/bin/env python3
 
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import rospy
 from map_generator import *
+from map_engine import MapEngine, MapLibrary
 from nav_msgs.msg import OccupancyGrid
 from geometry_msgs.msg import PoseStamped
 from std_msgs.msg import String
+from std_srvs.srv import Empty
 import numpy as np
-import subprocess
 
 class MapGenerator():
     def __init__(self):
@@ -37,6 +43,30 @@ class MapGenerator():
         self.obsnum = 10
         self.obsrad = 1
 
+        # maps are generated ahead by a background worker, a new episode takes the next map from the ready buffer
+        self.engine = MapEngine(self.height, self.width, self.cr, self.iterations, self.obsnum, self.obsrad)
+        self.seed = rospy.get_param("~seed", None) # seed of the first map, the following maps count up
+        if self.seed is None:
+            self.seed = int(np.random.SeedSequence().generate_state(1)[0])
+        self.map_library = rospy.get_param("~map_library", "") # draw the maps from a library of map_engine.py
+        self.library = MapLibrary(self.map_library) if self.map_library else None
+        # the task generators take the clearance of the published maps from the library, see MapLibrary
+        if self.library is not None:
+            rospy.set_param("/map_library", os.path.abspath(self.map_library))
+        elif rospy.has_param("/map_library"):
+            rospy.delete_param("/map_library")
+        self.ready_maps = queue.Queue(maxsize=rospy.get_param("~buffer_size", 2))
+        threading.Thread(target=self.generate_maps_worker, daemon=True).start()
+
+        # the PNG of the published map is written in the background, only the latest pending map is written
+        self.write_image = rospy.get_param("~write_image", True)
+        self.image_executor = ThreadPoolExecutor(max_workers=1)
+        self.pending_image = None
+        self.pending_image_lock = threading.Lock()
+
+        # persistent connection instead of a rosservice process per episode
+        self.clear_costmaps_srv = None
+
         # initialize occupancy grid
         self.occupancy_grid = OccupancyGrid()
 
@@ -60,19 +90,43 @@ class MapGenerator():
         make_image(map)
         rospy.loginfo("Initial random map generated.")
 
-    def generate_mapdata(self): # generate random map data array for occupancy grid
-        map = create_random_map(
-            height = self.height,
-            width = self.width,
-            corridor_radius = self.cr,
-            iterations = self.iterations,
-            obstacle_number = self.obsnum,
-            obstacle_extra_radius = self.obsrad
-        )
-        make_image(map)
-        map = np.flip(map,axis=0)
-        map = (map*100).flatten() # map currently [0,1] 2D np array needs to be flattened for publishing OccupancyGrid.data
-        return map
+    def generate_mapdata(self, seed): # generate random map and its data array for occupancy grid
+        if self.library is not None:
+            idx = seed % len(self.library)
+            return np.array(self.library.maps[idx]), self.library.get_occupancy_data(idx)
+        map, _ = self.engine.generate(seed)
+        data = (np.flip(map,axis=0)*100).astype(np.int8).flatten() # map currently [0,1] 2D np array needs to be flattened for publishing OccupancyGrid.data
+        return map, data
+
+    def generate_maps_worker(self): # keeps the ready buffer filled, blocks while it is full
+        seed = self.seed
+        while not rospy.is_shutdown():
+            self.ready_maps.put(self.generate_mapdata(seed))
+            seed += 1
+
+    def write_image_worker(self):
+        with self.pending_image_lock:
+            map, self.pending_image = self.pending_image, None
+        if map is not None:
+            make_image(map)
+
+    def schedule_image(self, map):
+        with self.pending_image_lock:
+            scheduled = self.pending_image is not None
+            self.pending_image = map
+        if not scheduled: # a pending write picks up the newer map
+            self.image_executor.submit(self.write_image_worker)
+
+    def clear_costmaps(self):
+        try:
+            if self.clear_costmaps_srv is None:
+                self.clear_costmaps_srv = rospy.ServiceProxy("/move_base/clear_costmaps", Empty, persistent=True)
+            self.clear_costmaps_srv()
+        except rospy.ServiceException as e:
+            # the connection is lost if move_base restarts, it is reopened on the next episode
+            rospy.logwarn("Clearing the costmaps failed: {}".format(e))
+            self.clear_costmaps_srv.close()
+            self.clear_costmaps_srv = None
 
     # def new_episode_callback(self,goal_msg: PoseStamped):
     #     current_episode = goal_msg.header.seq
@@ -84,12 +138,26 @@ class MapGenerator():
     #         self.mappub.publish(self.occupancy_grid)
     #         rospy.loginfo("New random map published.")
     
+    def check_library_metadata(self): # the library maps are published with the meta data of the map_server map
+        info = self.occupancy_grid.info
+        height, width = self.library.shape
+        if (info.height, info.width) == (height, width) and abs(info.resolution - self.library.resolution) < 1e-6:
+            return True
+        rospy.logerr(f"the map library {self.map_library} has maps of {height}x{width} cells with a resolution of "
+                     f"{self.library.resolution}, but the map of map_server has {info.height}x{info.width} cells "
+                     f"with a resolution of {info.resolution}")
+        rospy.signal_shutdown("map library does not match the map of map_server")
+        return False
+
     def new_episode_callback(self, msg: String):
-        self.occupancy_grid.data = self.generate_mapdata()
+        if self.library is not None and not self.check_library_metadata():
+            return
+        map, self.occupancy_grid.data = self.ready_maps.get()
         # rospy.loginfo("New random map generated for episode {}.".format(self.nr))
         self.mappub.publish(self.occupancy_grid)
-        bashCommand = "rosservice call /move_base/clear_costmaps"
-        subprocess.Popen(bashCommand.split(), stdout=subprocess.PIPE)
+        self.clear_costmaps()
+        if self.write_image:
+            self.schedule_image(map)
         rospy.loginfo("New random map published and costmap cleared.")
 
 
@@ -0,0 +1,89 @@
+#! /usr/bin/env python3
+"""
+Builds the start goal banks of maps offline, so that the RobotManagers only load them, see StartGoalBank.
+
+The banks are stored in simulator_setup/tmp_start_goal_banks under the hash of the map and the robot radius,
+which is where RobotManager looks for them. Without arguments the banks of all maps in simulator_setup/maps
+are built.
+
+The bank is only found if the map of /static_map has the digest of the map loaded here, which is checked for
+every map against the OccupancyGrid message map_server would send. With --check_static_map the digest of the
+map served by a running map_server is compared as well.
+
+usage: python build_start_goal_banks.py --radius 0.113 [--maps <map.yaml> ...] [--num_sources 64]
+"""
+import argparse
+import glob
+import os
+import struct
+import time
+
+import numpy as np
+import rospkg
+import yaml
+from nav_msgs.msg import OccupancyGrid
+
+from task_generator.start_goal_bank import StartGoalBank, get_map_digest, get_start_goal_bank_path
+from task_generator.utils import load_map_yaml
+
+
+def check_map_digest(map_path: str, map_: OccupancyGrid):
+    """the digest of the loaded map has to match the OccupancyGrid message of map_server for the same file, whose
+    resolution went through a float32 and whose data is a tuple"""
+    with open(map_path, "r") as fd:
+        map_data = yaml.safe_load(fd)
+    message = OccupancyGrid()
+    message.info.width, message.info.height = map_.info.width, map_.info.height
+    message.info.resolution = struct.unpack("<f", struct.pack("<f", map_data["resolution"]))[0]
+    message.info.origin.position.x, message.info.origin.position.y = map_data["origin"][0], map_data["origin"][1]
+    message.data = tuple(map_.data)
+    assert get_map_digest(message) == get_map_digest(map_), f"{map_path}: the digest differs from the map_server map"
+
+
+def check_static_map(map_path: str, map_: OccupancyGrid):
+    """compares the digest with the map of a running map_server, which has to serve map_path"""
+    import rospy
+    from nav_msgs.srv import GetMap
+
+    rospy.wait_for_service("/static_map", timeout=10)
+    static_map = rospy.ServiceProxy("/static_map", GetMap)().map
+    if get_map_digest(static_map) != get_map_digest(map_):
+        raise RuntimeError(f"{map_path}: the map of /static_map has another digest, the bank would not be found")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="build the start goal banks of maps")
+    parser.add_argument("--radius", type=float, nargs="+", required=True, help="robot radii, ros param 'radius'")
+    parser.add_argument("--maps", type=str, nargs="*", default=None, help="map.yaml files")
+    parser.add_argument("--num_sources", type=int, default=64)
+    parser.add_argument("--goals_per_bin", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--folder", type=str, default=None, help="defaults to simulator_setup/tmp_start_goal_banks")
+    parser.add_argument("--check_static_map", action="store_true",
+                        help="compare the digest with the map of a running map_server, needs a single map")
+    args = parser.parse_args()
+
+    map_paths = args.maps
+    if not map_paths:
+        maps_dir = os.path.join(rospkg.RosPack().get_path("simulator_setup"), "maps")
+        map_paths = sorted(glob.glob(os.path.join(maps_dir, "*", "map.yaml")))
+
+    if args.check_static_map and len(map_paths) != 1:
+        parser.error("--check_static_map needs the one map the map_server serves in --maps")
+
+    for map_path in map_paths:
+        map_ = load_map_yaml(map_path)
+        check_map_digest(map_path, map_)
+        if args.check_static_map:
+            check_static_map(map_path, map_)
+        for radius in args.radius:
+            start = time.perf_counter()
+            bank = StartGoalBank.build(
+                map_, radius, num_sources=args.num_sources, goals_per_bin=args.goals_per_bin, seed=args.seed)
+            path = get_start_goal_bank_path(map_, radius, args.folder)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            bank.save(path)
+            print(
+                f"{map_path} r={radius}: {len(bank)} pairs {np.array2string(bank.bin_counts)} in "
+                f"{bank.meta['num_components']} components, {os.path.getsize(path) / 1024:.0f} KiB, "
+                f"{time.perf_counter() - start:.1f}s"
+            )
@@ -0,0 +1,58 @@
+import hashlib
+import os
+import threading
+from typing import Dict, NamedTuple
+
+import yaml
+
+# the training callback publishes the absolute index of the stage all namespaces have to be in (std_msgs/Int16),
+# the topic is latched so that namespaces which start later join the current stage
+CURRICULUM_STAGE_TOPIC = "/curriculum/stage"
+# number of stages of the curriculum, set by the staged tasks for the training callback
+CURRICULUM_NUM_STAGES_PARAM = "/curriculum/num_stages"
+
+
+class StageConfig(NamedTuple):
+    """obstacles of a stage and the arguments of their ObstaclesManager.register_random_*_obstacles calls"""
+    index: int
+    static: int
+    dynamic: int
+    static_kwargs: dict
+    dynamic_kwargs: dict
+
+
+STATIC_OBSTACLE_KWARGS = dict(num_vertices_min=3, num_vertices_max=4, min_obstacle_radius=0.25, max_obstacle_radius=1.5)
+DYNAMIC_OBSTACLE_KWARGS = dict(min_obstacle_radius=0.1, max_obstacle_radius=0.3)
+
+
+def compile_curriculum(stages: dict) -> Dict[int, StageConfig]:
+    """validates the stages of a training curriculum yaml and converts them to their compiled form"""
+    if not isinstance(stages, dict):
+        raise ValueError("'training_curriculum.yaml' has wrong fromat! Has to encode dictionary!")
+    if sorted(stages) != list(range(1, len(stages) + 1)):
+        raise ValueError(f"The stages of the training curriculum have to be numbered 1 to {len(stages)}!")
+    compiled = {}
+    for index, stage in stages.items():
+        if not isinstance(stage, dict) or not {"static", "dynamic"} <= stage.keys():
+            raise ValueError(f"Stage {index} of the training curriculum needs 'static' and 'dynamic'!")
+        compiled[index] = StageConfig(
+            index, int(stage["static"]), int(stage["dynamic"]), STATIC_OBSTACLE_KWARGS, DYNAMIC_OBSTACLE_KWARGS
+        )
+    return compiled
+
+
+_curricula = {}
+_curricula_lock = threading.Lock()
+
+
+def load_curriculum(path: str) -> Dict[int, StageConfig]:
+    """stages of a training curriculum yaml, loaded once per process and content of the file"""
+    if not os.path.isfile(path):
+        raise FileNotFoundError("Couldn't find 'training_curriculum.yaml' in %s " % path)
+    with open(path, "rb") as fd:
+        content = fd.read()
+    key = (path, hashlib.sha1(content).hexdigest())
+    with _curricula_lock:
+        if key not in _curricula:
+            _curricula[key] = compile_curriculum(yaml.load(content, Loader=yaml.FullLoader))
+        return _curricula[key]
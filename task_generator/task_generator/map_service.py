@@ -0,0 +1,283 @@
+import _posixshmem
+import atexit
+import mmap
+import os
+import sys
+import threading
+import time
+import warnings
+from collections import OrderedDict
+from multiprocessing import resource_tracker, shared_memory
+from typing import Union
+
+import numpy as np
+import rospkg
+import rospy
+from nav_msgs.msg import OccupancyGrid
+from nav_msgs.srv import GetMap
+
+from .start_goal_bank import StartGoalBank, get_map_digest, get_start_goal_bank
+from .utils import FreeSpaceSampler
+
+# segments created by this process which are still in use, removed when their map is evicted or at exit
+_created_segments = {}
+_created_segments_lock = threading.Lock()
+
+
+@atexit.register
+def _unlink_created_segments():
+    with _created_segments_lock:
+        for shm in _created_segments.values():
+            _unlink(shm)
+        _created_segments.clear()
+
+
+def _unlink(shm: shared_memory.SharedMemory):
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        # a process which waited in vain for the segment removed it already
+        resource_tracker.unregister(shm._name, "shared_memory")
+
+
+class SharedClearance:
+    """
+    Clearance map of a map in a shared memory segment named after the map digest.
+
+    The first process which needs the map creates the segment, computes the clearance into it and sets the ready
+    flag in its header. The other processes attach to the segment and wait for the flag instead of computing the
+    distance transform again. The creator removes the segment in release, when the map is evicted from its
+    TaskGenerationService, or when it exits. The processes which attached keep their mapping, a process which needs
+    the map after that computes it again.
+
+    Creating a segment opens and sizes it in two steps, a process which attaches in between finds an empty segment
+    and retries until it is sized. A process which waits longer than the timeout, e.g. because the creator died,
+    removes the segment, so that the later processes create it again instead of waiting as well. The processes
+    which attach map the segment without a SharedMemory, which would register it with the resource tracker the
+    forked environments share with the creator.
+    """
+
+    HEADER_SIZE = 8
+
+    def __init__(self, map_: OccupancyGrid, digest: str, timeout: float = 60):
+        """
+        Args:
+            map_ (OccupancyGrid): map proviced by the ros map service
+            digest (str): digest of the map, see get_map_digest
+            timeout (float, optional): seconds to wait for the process which computes the clearance
+        """
+        num_cells = map_.info.width * map_.info.height
+        size = self.HEADER_SIZE + num_cells * np.dtype(np.float64).itemsize
+        self.name = f"arena_map_{digest}"
+        self.created = False
+        self._shm = None
+        self._mmap = None
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self._shm = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+                self.created = True
+                buf = self._shm.buf
+                break
+            except FileExistsError:
+                self._mmap = self._attach(self.name, size)
+            if self._mmap is not None:
+                buf = self._mmap
+                break
+            if time.monotonic() > deadline:
+                # the segment stayed empty, the creator died between opening and sizing it
+                self._compute_locally(map_, f"is not sized after {timeout}s")
+                return
+            time.sleep(0.01)
+        self._ready = np.ndarray((1,), dtype=np.int64, buffer=buf)
+        self.clearance = np.ndarray((num_cells,), dtype=np.float64, buffer=buf, offset=self.HEADER_SIZE)
+
+        if self.created:
+            self.clearance[:] = FreeSpaceSampler.compute_clearance(map_)
+            self._ready[0] = 1
+            with _created_segments_lock:
+                _created_segments[self.name] = self._shm
+            return
+        while self._ready[0] != 1:
+            if time.monotonic() > deadline:
+                # the creator died before it was done
+                self._compute_locally(map_, f"is not ready after {timeout}s")
+                return
+            time.sleep(0.01)
+
+    @staticmethod
+    def _attach(name: str, size: int) -> Union[mmap.mmap, None]:
+        """mapping of the segment of another process, None if it is not sized yet or was removed in the meantime"""
+        try:
+            fd = _posixshmem.shm_open("/" + name, os.O_RDWR, mode=0o600)
+        except FileNotFoundError:
+            return None
+        try:
+            if os.fstat(fd).st_size < size:
+                return None
+            return mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    def _compute_locally(self, map_: OccupancyGrid, reason: str):
+        """removes the segment of a creator which did not finish, so that the next process creates it again"""
+        warnings.warn(f"shared memory {self.name} {reason}, computing the clearance locally")
+        try:
+            _posixshmem.shm_unlink("/" + self.name)
+        except FileNotFoundError:
+            pass
+        self._ready = None
+        self.clearance = FreeSpaceSampler.compute_clearance(map_)
+
+    def release(self):
+        """removes the segment if this process created it, the mapping is kept until the object is closed"""
+        if self.created:
+            with _created_segments_lock:
+                shm = _created_segments.pop(self.name, None)
+            if shm is not None:
+                _unlink(shm)
+
+    def close(self):
+        # the views have to be released before the segment can be closed
+        self._ready = None
+        self.clearance = None
+        try:
+            if self._shm is not None:
+                self._shm.close()
+            if self._mmap is not None:
+                self._mmap.close()
+        except BufferError:
+            # a sampler of the map still holds a view, the mapping is released with it
+            pass
+
+    def __del__(self):
+        self.close()
+
+
+def _load_map_library(path: str):
+    """MapLibrary of simulator_setup/maps/map_engine.py"""
+    maps_path = os.path.join(rospkg.RosPack().get_path("simulator_setup"), "maps")
+    if maps_path not in sys.path:
+        sys.path.append(maps_path)
+    from map_engine import MapLibrary
+
+    return MapLibrary(path)
+
+
+def _find_library_map(library, map_: OccupancyGrid) -> Union[int, None]:
+    """index of the map in the library, None if it is not one of its maps"""
+    if library is None or (map_.info.height, map_.info.width) != library.shape:
+        return None
+    return library.find(map_.data)
+
+
+class MapContext:
+    """
+    Everything the task generators derive from a map, computed once per map and process and shared by all
+    namespaces: the clearance map (shared between the processes as well), the free cells per clearance and the
+    start goal banks per robot radius.
+    """
+
+    def __init__(self, map_: OccupancyGrid, digest: str, library=None):
+        self.map = map_
+        self.digest = digest
+        # a map of the map library of map_generator_node comes with its clearance, the library is memory mapped
+        # and therefore shared between the processes as well
+        idx = _find_library_map(library, map_)
+        if idx is None:
+            self._library_clearance = None
+            self._shared_clearance = SharedClearance(map_, digest)
+        else:
+            self._library_clearance = library.get_clearance(idx, map_.info.resolution)
+            self._shared_clearance = None
+        self._free_cells = {}
+        self._start_goal_banks = {}
+        self._lock = threading.Lock()
+
+    @property
+    def clearance(self) -> np.ndarray:
+        if self._shared_clearance is None:
+            return self._library_clearance
+        return self._shared_clearance.clearance
+
+    def release(self):
+        """called when the map is evicted, the managers which still use it keep their samplers and banks"""
+        if self._shared_clearance is not None:
+            self._shared_clearance.release()
+
+    def get_free_space_sampler(self, seed: Union[int, None] = None) -> FreeSpaceSampler:
+        """sampler with its own random generator on the shared clearance map and free cells"""
+        return FreeSpaceSampler(self.map, seed, clearance=self.clearance, free_cells=self._free_cells)
+
+    def get_start_goal_bank(self, robot_radius: float) -> Union[StartGoalBank, None]:
+        """the bank built offline for the map, loaded once per process, None if the map has none"""
+        with self._lock:
+            if robot_radius not in self._start_goal_banks:
+                self._start_goal_banks[robot_radius] = get_start_goal_bank(self.map, robot_radius)
+            return self._start_goal_banks[robot_radius]
+
+
+class TaskGenerationService:
+    """
+    Serves the map dependent data to all RobotManagers and ObstaclesManagers of a process.
+
+    Without it every namespace fetches the map and preprocesses it on its own. The service fetches the static map
+    once and keeps a MapContext per map digest, the last max_maps maps are kept, so that namespaces which switch
+    maps at different times still share them.
+    """
+
+    def __init__(self, max_maps: int = 4):
+        self.max_maps = max_maps
+        self._map = None
+        self._map_digest = None
+        self._contexts = OrderedDict()
+        self._library = None
+        self._lock = threading.Lock()
+
+    def get_static_map(self) -> OccupancyGrid:
+        """the latest map of the service, the static map is only fetched if there is none yet"""
+        with self._lock:
+            if self._map is None:
+                self._map = rospy.ServiceProxy("/static_map", GetMap)().map
+            return self._map
+
+    def get_map_library(self):
+        """the map library map_generator_node draws the maps from, None if it generates them"""
+        path = rospy.get_param("/map_library", "")
+        if not path:
+            return None
+        if self._library is None or self._library.path != path:
+            self._library = _load_map_library(path)
+        return self._library
+
+    def get_map_context(self, map_: OccupancyGrid) -> MapContext:
+        with self._lock:
+            # the managers of a namespace get the same map message, it is only hashed once
+            if map_ is not self._map or self._map_digest is None:
+                self._map_digest = get_map_digest(map_)
+            digest = self._map_digest
+            self._map = map_
+            context = self._contexts.get(digest)
+            if context is not None:
+                self._contexts.move_to_end(digest)
+                return context
+            context = MapContext(map_, digest, self.get_map_library())
+            self._contexts[digest] = context
+            if len(self._contexts) > self.max_maps:
+                # the managers which still use the evicted map keep their views of it alive
+                _, evicted = self._contexts.popitem(last=False)
+                evicted.release()
+            return context
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_task_generation_service() -> TaskGenerationService:
+    """service shared by all task generators of the process"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = TaskGenerationService()
+        return _service
@@ -0,0 +1,134 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, NamedTuple, Union
+
+import numpy as np
+import rospkg
+import yaml
+
+
+class ObstacleModel(NamedTuple):
+    path: str
+    radius: float
+    is_static: bool
+
+
+def get_model_info(model: dict) -> tuple:
+    """
+    Returns:
+        radius of the circle around the model origin which encloses all footprints of the model,
+        whether all bodies of the model are static
+    """
+    radius = 0.0
+    is_static = all(body.get("type") == "static" for body in model.get("bodies", []))
+    for body in model.get("bodies", []):
+        offset = np.linalg.norm(body.get("pose", [0, 0, 0])[:2])
+        for footprint in body.get("footprints", []):
+            if footprint["type"] == "circle":
+                extent = np.linalg.norm(footprint.get("center", [0, 0])) + footprint["radius"]
+            else:
+                extent = np.linalg.norm(footprint["points"], axis=1).max()
+            radius = max(radius, offset + extent)
+    return float(radius), is_static
+
+
+class ObstacleModelRegistry:
+    """
+    Cache of the obstacle model files spawned by the ObstaclesManagers.
+
+    flatland only spawns models from yaml files. The registry builds the model of a shape (kind and shape
+    parameters) once and writes it into a file named after the hash of its content. Every later spawn of the
+    same shape, in any namespace, reuses that file. Since equal models map to the same file name and the files
+    are replaced atomically, environments in parallel processes can share the folder without colliding.
+
+    The models are kept in an LRU cache of max_size entries. Evicted files stay on disk, so that a
+    process which still holds their path can spawn them. Their number is bounded by the distinct shapes, which
+    is why the callers quantize the shape parameters.
+    """
+
+    def __init__(self, folder: str, max_size: int = 256):
+        """
+        Args:
+            folder (str): folder of the model files, created if necessary
+            max_size (int, optional): number of models kept in memory. Defaults to 256.
+        """
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # (kind, *params) -> ObstacleModel and path -> ObstacleModel of the model files spawned by path
+        self._models = OrderedDict()
+        self._files = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _lookup(cache: OrderedDict, key) -> Union[ObstacleModel, None]:
+        model = cache.get(key)
+        if model is not None:
+            cache.move_to_end(key)
+        return model
+
+    def _insert(self, cache: OrderedDict, key, model: ObstacleModel):
+        cache[key] = model
+        if len(cache) > self.max_size:
+            cache.popitem(last=False)
+
+    def get(self, kind: str, params: tuple, build: Callable[[], dict]) -> ObstacleModel:
+        """
+        Args:
+            kind (str): kind of the model, prefix of the file name
+            params (tuple): hashable shape parameters which determine the model
+            build (Callable[[], dict]): builds the model dict, only called on a cache miss
+        """
+        key = (kind,) + tuple(params)
+        with self._lock:
+            model = self._lookup(self._models, key)
+            if model is not None:
+                self.hits += 1
+                return model
+            self.misses += 1
+
+        model_dict = build()
+        text = yaml.dump(model_dict)
+        digest = hashlib.sha1(text.encode()).hexdigest()[:16]
+        path = os.path.join(self.folder, f"{kind}_{digest}.model.yaml")
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{os.getpid()}_{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as fd:
+                fd.write(text)
+            os.replace(tmp_path, path)
+        model = ObstacleModel(path, *get_model_info(model_dict))
+
+        with self._lock:
+            self._insert(self._models, key, model)
+            self._insert(self._files, path, model)
+        return model
+
+    def get_file(self, path: str) -> ObstacleModel:
+        """model of an existing model file, the file is only parsed the first time"""
+        with self._lock:
+            model = self._lookup(self._files, path)
+            if model is not None:
+                return model
+        with open(path, "r") as fd:
+            model = ObstacleModel(path, *get_model_info(yaml.safe_load(fd)))
+        with self._lock:
+            self._insert(self._files, path, model)
+        return model
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ObstacleModelRegistry:
+    """registry shared by all ObstaclesManagers of the process, the files are stored in simulator_setup"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            folder = os.path.join(rospkg.RosPack().get_path("simulator_setup"), "tmp_random_obstacles")
+            _registry = ObstacleModelRegistry(folder)
+        return _registry
@@ -1,5 +1,8 @@
 import math
 import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Union
 import re
 import yaml
@@ -17,7 +20,8 @@ from std_msgs.msg import Empty
 import rospy
 import rospkg
 import shutil
-from .utils import generate_freespace_indices, get_random_pos_on_map
+from .model_registry import get_model_registry
+from .map_service import get_task_generation_service
 
 
 class ObstaclesManager:
@@ -25,18 +29,25 @@ class ObstaclesManager:
     A manager class using flatland provided services to spawn, move and delete obstacles.
     """
 
-    def __init__(self, ns: str, map_: OccupancyGrid):
+    # default number of different polygons per number of vertices of the random static obstacles. Every variant is a
+    # model file which is generated once and then served by the model registry, fewer variants save generating model
+    # files but the agent sees fewer shapes, so the default is large enough not to limit the variety of the training.
+    NUM_RANDOM_POLYGON_VARIANTS = 1024
+
+    def __init__(self, ns: str, map_: OccupancyGrid, max_concurrent_requests: int = 8):
         """
         Args:
             map_ (OccupancyGrid):
+            max_concurrent_requests (int): number of move_model or spawn_model requests which are in flight at the
+                same time
             plugin_name: The name of the plugin which is used to control the movement of the obstacles, Currently we use "RandomMove" for training and Tween2 for evaluation.
                 The Plugin Tween2 can move the the obstacle along a trajectory which can be assigned by multiple waypoints with a constant velocity.Defaults to "RandomMove".
         """
         self.ns = ns
         self.ns_prefix = "" if ns == '' else "/"+ns+"/"
 
-        # a list of publisher to move the obstacle to the start pos.
-        self._move_all_obstacles_start_pos_pubs = []
+        # the publishers to move the obstacles to the start pos, by obstacle name.
+        self._move_all_obstacles_start_pos_pubs = {}
 
         # setup proxy to handle  services provided by flatland
         rospy.wait_for_service(f'{self.ns_prefix}move_model', timeout=20)
@@ -50,25 +61,57 @@ class ObstaclesManager:
         self._srv_spawn_model = rospy.ServiceProxy(
             f'{self.ns_prefix}spawn_model', SpawnModel, persistent=True)
 
+        # flatland has no bulk move or spawn service, the requests of a reset or a scenario are pipelined over
+        # several persistent connections instead, every worker thread owns one per service
+        self._service_executor = ThreadPoolExecutor(max_workers=max_concurrent_requests)
+        self._service_proxies = threading.local()
+        # latency of the last reset_pos_obstacles_random call in seconds
+        self.last_reset_latency = {"sample": 0.0, "move": 0.0, "num_moves": 0}
+
+        # obstacle models shared by all namespaces of the process
+        self._model_registry = get_model_registry()
+
         self.update_map(map_)
         self.obstacle_name_list = []
+        # bounding radius of every obstacle, the static obstacles and the obstacles which are outside of the map
+        self._obstacle_radius = {}
+        self._static_obstacles = set()
+        self._parked_obstacles = set()
+        # obstacles which are spawned but not in use. They are parked outside of the map and reused by the next
+        # register call asking for the same model (or a random obstacle of the same kind), see release_obstacles
+        self._pool = []
+        self._poolable_obstacles = set()
+        # model file of every obstacle and kind and shape parameters of the random obstacles
+        self._obstacle_models = {}
+        self._obstacle_shapes = {}
+        # number of flatland service calls and of obstacles taken from the pool instead of being spawned
+        self.counters = {"spawns": 0, "deletes": 0, "moves": 0, "reused": 0}
         self._obstacle_name_prefix = 'obstacle'
         # remove all existing obstacles generated before create an instance of this class
         self.remove_obstacles()
 
     def update_map(self, new_map: OccupancyGrid):
         self.map = new_map
-        # a tuple stores the indices of the non-occupied spaces. format ((y,....),(x,...)
-        self._free_space_indices = generate_freespace_indices(self.map)
+        # clearance map of the non-occupied spaces, computed once per map for all namespaces
+        self._map_context = get_task_generation_service().get_map_context(self.map)
+        self._free_space_sampler = self._map_context.get_free_space_sampler()
 
-    def register_obstacles(self, num_obstacles: int, model_yaml_file_path: str, start_pos: list = []):
+    def register_obstacles(self, num_obstacles: int, model_yaml_file_path: str, start_pos: list = [],
+                           model_name: Union[str, None] = None, poolable: Union[bool, None] = None,
+                           shape: Union[tuple, None] = None):
         """register the obstacles defined by a yaml file and request flatland to respawn the them.
+        Released obstacles of the same model file are taken from the pool first, only the rest is spawned.
 
         Args:
             num_obstacles (string): the number of the obstacle instance to be created.
             model_yaml_file_path (string or None): model file path. it must be absolute path!
             start_pos (list)  a three-elementary list of empty list, if it is empty, the obstacle will be moved to the
                 outside of the map.
+            model_name (str, optional): part of the obstacle names, defaults to the name of the model file.
+            poolable (bool, optional): whether release_obstacles parks the obstacles instead of deleting them.
+                Defaults to the static models, the plugins of dynamic models might move them back into the map.
+            shape (tuple, optional): (kind, shape parameters) of a random obstacle, used to reuse it for a random
+                obstacle with other but matching parameters.
 
         Raises:
             Exception:  Rospy.ServiceException(
@@ -77,57 +120,186 @@ class ObstaclesManager:
         Returns:
             self.
         """
-        assert os.path.isabs(
-            model_yaml_file_path), "The yaml file path must be absolute path, otherwise flatland can't find it"
-
-        # the name of the model yaml file have the format {model_name}.model.yaml
-        # we added environments's namespace as the prefix in the model_name to make sure the every environment has it's own temporary model file
-        model_name = os.path.basename(model_yaml_file_path).split('.')[0]
-        # But we don't want to keep it in the name of the topic otherwise it won't be easy to visualize them in riviz
-        model_name = model_name.replace(self.ns,'')
-        name_prefix = self._obstacle_name_prefix + '_' + model_name
-        count_same_type = sum(
-            1 if obstacle_name.startswith(name_prefix) else 0
-            for obstacle_name in self.obstacle_name_list)
-
-        for instance_idx in range(count_same_type, count_same_type + num_obstacles):
-            max_num_try = 2
-            i_curr_try = 0
-            while i_curr_try < max_num_try:
-                spawn_request = SpawnModelRequest()
-                spawn_request.yaml_path = model_yaml_file_path
-                spawn_request.name = f'{name_prefix}_{instance_idx:02d}'
-                spawn_request.ns = rospy.get_namespace()
-                # x, y, theta = get_random_pos_on_map(self._free_space_indices, self.map,)
-                # set the postion of the obstacle out of the map to hidden them
-                if len(start_pos) == 0:
-                    x = self.map.info.origin.position.x - 3 * \
-                        self.map.info.resolution * self.map.info.height
-                    y = self.map.info.origin.position.y - 3 * \
-                        self.map.info.resolution * self.map.info.width
-                    theta = theta = random.uniform(-math.pi, math.pi)
-                else:
-                    assert len(start_pos) == 3
-                    x = start_pos[0]
-                    y = start_pos[1]
-                    theta = start_pos[2]
-                spawn_request.pose.x = x
-                spawn_request.pose.y = y
-                spawn_request.pose.theta = theta
-                # try to call service
-                response = self._srv_spawn_model.call(spawn_request)
+        self.register_obstacle_batch(
+            [(model_yaml_file_path, start_pos, model_name)] * num_obstacles, poolable=poolable, shape=shape)
+        return self
+
+    def register_obstacle_batch(self, obstacles: list, poolable: Union[bool, None] = None,
+                                shape: Union[tuple, None] = None) -> list:
+        """register obstacles of possibly different models at once. The spawn requests of all obstacles which are
+        not taken from the pool are sent concurrently, a failed request is tried once more.
+
+        Args:
+            obstacles (list): (model_yaml_file_path, start_pos, model_name) of every obstacle, see register_obstacles
+            poolable (bool, optional): see register_obstacles
+            shape (tuple, optional): see register_obstacles
+
+        Returns:
+            names (list): name of every obstacle, None if it could not be spawned
+        """
+        names = [None] * len(obstacles)
+        reused, reused_start_pos = [], []
+        spawn_requests, spawn_indices, spawn_infos = [], [], []
+        # the pooled obstacles keep their names, so the indices of the new ones start after them
+        all_names = set(self.obstacle_name_list) | set(self._pool)
+        pool = list(self._pool)
+        for i, (model_yaml_file_path, start_pos, model_name) in enumerate(obstacles):
+            assert os.path.isabs(
+                model_yaml_file_path), "The yaml file path must be absolute path, otherwise flatland can't find it"
+            assert len(start_pos) in (0, 3)
+            radius, is_static = self._model_registry.get_file(model_yaml_file_path)[1:]
+
+            pooled = next((name for name in pool if self._obstacle_models[name] == model_yaml_file_path), None)
+            if pooled is not None:
+                pool.remove(pooled)
+                names[i] = pooled
+                reused.append(pooled)
+                reused_start_pos.append(start_pos)
+                continue
+
+            # the name of the model yaml file have the format {model_name}.model.yaml
+            if model_name is None:
+                model_name = os.path.basename(model_yaml_file_path).split('.')[0]
+                # But we don't want to keep it in the name of the topic otherwise it won't be easy to visualize them in riviz
+                model_name = model_name.replace(self.ns, '')
+            name_prefix = self._obstacle_name_prefix + '_' + model_name
+            instance_idx = sum(1 if obstacle_name.startswith(name_prefix) else 0 for obstacle_name in all_names)
+            while f'{name_prefix}_{instance_idx:02d}' in all_names:
+                instance_idx += 1
+            spawn_request = SpawnModelRequest()
+            spawn_request.yaml_path = model_yaml_file_path
+            spawn_request.name = f'{name_prefix}_{instance_idx:02d}'
+            spawn_request.ns = rospy.get_namespace()
+            # set the postion of the obstacle out of the map to hidden them
+            if len(start_pos) == 0:
+                spawn_request.pose.x = self.map.info.origin.position.x - 3 * \
+                    self.map.info.resolution * self.map.info.height
+                spawn_request.pose.y = self.map.info.origin.position.y - 3 * \
+                    self.map.info.resolution * self.map.info.width
+                spawn_request.pose.theta = random.uniform(-math.pi, math.pi)
+            else:
+                spawn_request.pose.x, spawn_request.pose.y, spawn_request.pose.theta = start_pos
+            all_names.add(spawn_request.name)
+            spawn_requests.append(spawn_request)
+            spawn_indices.append(i)
+            spawn_infos.append((radius, is_static if poolable is None else poolable, is_static, len(start_pos) == 0))
+
+        self._activate_pooled(reused, reused_start_pos)
+
+        max_num_try = 2
+        pending = list(range(len(spawn_requests)))
+        for i_curr_try in range(max_num_try):
+            responses = self._spawn_models([spawn_requests[j] for j in pending])
+            failed = []
+            for j, response in zip(pending, responses):
+                spawn_request = spawn_requests[j]
                 if not response.success:  # if service not succeeds, do something and redo service
                     rospy.logwarn(
                         f"({self.ns}) spawn object {spawn_request.name} failed! trying again... [{i_curr_try+1}/{max_num_try} tried]")
                     rospy.logwarn(response.message)
-                    i_curr_try += 1
-                else:
-                    self.obstacle_name_list.append(spawn_request.name)
-                    break
-            if i_curr_try == max_num_try:
-                # raise rospy.ServiceException(f"({self.ns}) failed to register obstacles")
-                rospy.logwarn(f"({self.ns}) failed to register obstacles")
-        return self
+                    failed.append(j)
+                    continue
+                radius, is_poolable, is_static, is_parked = spawn_infos[j]
+                names[spawn_indices[j]] = spawn_request.name
+                self.obstacle_name_list.append(spawn_request.name)
+                self._obstacle_radius[spawn_request.name] = radius
+                if is_static:
+                    self._static_obstacles.add(spawn_request.name)
+                if is_parked:
+                    self._parked_obstacles.add(spawn_request.name)
+                self._obstacle_models[spawn_request.name] = spawn_request.yaml_path
+                if is_poolable:
+                    self._poolable_obstacles.add(spawn_request.name)
+                if shape is not None:
+                    self._obstacle_shapes[spawn_request.name] = shape
+            pending = failed
+            if not pending:
+                break
+        if pending:
+            # raise rospy.ServiceException(f"({self.ns}) failed to register obstacles")
+            rospy.logwarn(f"({self.ns}) failed to register obstacles")
+        return names
+
+    def _activate_pooled(self, names: list, start_positions: Union[list, None] = None):
+        """takes the obstacles out of the pool and moves them to their start positions. Without start_positions or
+        if a start position is empty the obstacle stays outside of the map"""
+        if not names:
+            return
+        for name in names:
+            self._pool.remove(name)
+            self.obstacle_name_list.append(name)
+        self.counters["reused"] += len(names)
+        requests = []
+        for name, start_pos in zip(names, start_positions or []):
+            if len(start_pos) != 0:
+                move_model_request = MoveModelRequest()
+                move_model_request.name = name
+                move_model_request.pose.x, move_model_request.pose.y, move_model_request.pose.theta = start_pos
+                requests.append(move_model_request)
+                self._parked_obstacles.discard(name)
+        self._move_models(requests)
+
+    def _take_random_from_pool(self, kind: str, match, num_obstacles: int) -> list:
+        """activates up to num_obstacles pooled random obstacles of the kind whose shape parameters match"""
+        candidates = [
+            name for name in self._pool
+            if name in self._obstacle_shapes and self._obstacle_shapes[name][0] == kind
+            and match(self._obstacle_shapes[name][1])]
+        names = random.sample(candidates, min(num_obstacles, len(candidates)))
+        self._activate_pooled(names)
+        return names
+
+    def release_obstacles(self, prefix_names: Union[list, None] = None):
+        """release the obstacles belonging to specific groups. The poolable obstacles are parked outside of the map
+        and kept for the next register calls, the others are deleted. Other than remove_obstacles it never needs to
+        query the published topics.
+
+        Args:
+            prefix_names (Union[list,None], optional): a list of group names. if it is None then all obstacles will
+                be released. Defaults to None.
+        """
+        names = self._match_names(self.obstacle_name_list, prefix_names)
+        to_be_parked = [name for name in names if name in self._poolable_obstacles]
+        for name in set(names) - set(to_be_parked):
+            self.remove_obstacle(name)
+            self._forget_obstacle(name)
+        self.obstacle_name_list = [name for name in self.obstacle_name_list if name not in set(names)]
+
+        parking_pose = self._get_parking_pose()
+        requests = []
+        for name in to_be_parked:
+            if name in self._parked_obstacles and name in self._static_obstacles:
+                continue
+            move_model_request = MoveModelRequest()
+            move_model_request.name = name
+            move_model_request.pose = parking_pose
+            requests.append(move_model_request)
+        self._move_models(requests)
+        self._parked_obstacles.update(to_be_parked)
+        self._pool.extend(to_be_parked)
+
+    @staticmethod
+    def _match_names(names: list, prefix_names: Union[list, None] = None) -> list:
+        """the names which start with one of the prefixes, all names if prefix_names is None"""
+        if prefix_names is None:
+            return list(names)
+        r = re.compile("^(?:" + '|'.join(prefix_names) + r')\w*')
+        return list(filter(r.match, names))
+
+    def _get_parking_pose(self) -> Pose2D:
+        resolution = self.map.info.resolution
+        pose = Pose2D()
+        pose.x = self.map.info.origin.position.x - resolution * self.map.info.width
+        pose.y = self.map.info.origin.position.y - resolution * self.map.info.width
+        return pose
+
+    def _forget_obstacle(self, name: str):
+        """drops the bookkeeping of a deleted obstacle"""
+        for d in (self._obstacle_radius, self._obstacle_models, self._obstacle_shapes,
+                  self._move_all_obstacles_start_pos_pubs):
+            d.pop(name, None)
+        for s in (self._static_obstacles, self._parked_obstacles, self._poolable_obstacles):
+            s.discard(name)
 
     def register_random_obstacles(self, num_obstacles: int, p_dynamic=0.5):
         """register static or dynamic obstacles.
@@ -158,14 +330,25 @@ class ObstaclesManager:
             min_obstacle_radius (float, optional): the minimum radius of the obstacle. Defaults to 0.5.
             max_obstacle_radius (float, optional): the maximum radius of the obstacle. Defaults to 0.5.
         """
-        for _ in range(num_obstacles):
-            model_path = self._generate_random_obstacle_yaml(
-                True, linear_velocity=linear_velocity, angular_velocity_max=angular_velocity_max,
-                min_obstacle_radius=min_obstacle_radius, max_obstacle_radius=max_obstacle_radius)
-            self.register_obstacles(1, model_path)
-            os.remove(model_path)
-
-    def register_random_static_obstacles(self, num_obstacles: int, num_vertices_min=3, num_vertices_max=5, min_obstacle_radius=0.5, max_obstacle_radius=2):
+        # pooled obstacles with a radius within the range and the same velocities are reused
+        reused = self._take_random_from_pool(
+            "random_dynamic",
+            lambda params: min_obstacle_radius <= params[0] <= max_obstacle_radius
+            and params[1:] == (linear_velocity, angular_velocity_max),
+            num_obstacles)
+        for _ in range(num_obstacles - len(reused)):
+            # quantized to centimeters, so that the registry holds a bounded number of models
+            radius = round(random.uniform(min_obstacle_radius, max_obstacle_radius), 2)
+            params = (radius, linear_velocity, angular_velocity_max)
+            model = self._model_registry.get(
+                "random_dynamic", params,
+                lambda: self._generate_random_obstacle_model(
+                    True, linear_velocity=linear_velocity, angular_velocity_max=angular_velocity_max,
+                    obstacle_radius=radius))
+            self.register_obstacles(
+                1, model.path, model_name="_random_dynamic", poolable=True, shape=("random_dynamic", params))
+
+    def register_random_static_obstacles(self, num_obstacles: int, num_vertices_min=3, num_vertices_max=5, min_obstacle_radius=0.5, max_obstacle_radius=2, num_variants=None):
         """register static obstacles with polygon shape.
 
         Args:
@@ -174,13 +357,23 @@ class ObstaclesManager:
             num_vertices_max (int, optional): the maximum number of the vertices. Defaults to 6.
             min_obstacle_radius (float, optional): the minimum radius of the obstacle. Defaults to 0.5.
             max_obstacle_radius (float, optional): the maximum radius of the obstacle. Defaults to 2.
+            num_variants (int, optional): number of different polygons per number of vertices, the polygons are
+                drawn from these variants. Defaults to NUM_RANDOM_POLYGON_VARIANTS.
         """
-        for _ in range(num_obstacles):
+        if num_variants is None:
+            num_variants = self.NUM_RANDOM_POLYGON_VARIANTS
+        # pooled obstacles with a number of vertices within the range are reused
+        reused = self._take_random_from_pool(
+            "random_static", lambda params: num_vertices_min <= params[0] <= num_vertices_max, num_obstacles)
+        for _ in range(num_obstacles - len(reused)):
             num_vertices = random.randint(num_vertices_min, num_vertices_max)
-            model_path = self._generate_random_obstacle_yaml(
-                False, num_vertices=num_vertices, min_obstacle_radius=min_obstacle_radius, max_obstacle_radius=max_obstacle_radius)
-            self.register_obstacles(1, model_path)
-            os.remove(model_path)
+            # the polygons are drawn from a fixed set of variants per number of vertices, which the registry caches
+            variant = random.randrange(num_variants)
+            model = self._model_registry.get(
+                "random_static", (num_vertices, variant),
+                lambda: self._generate_random_obstacle_model(False, num_vertices=num_vertices, variant=variant))
+            self.register_obstacles(
+                1, model.path, model_name="_random_static", shape=("random_static", (num_vertices, variant)))
 
     def register_static_obstacle_polygon(self, vertices: np.ndarray):
         """register static obstacle with polygon shape
@@ -188,16 +381,26 @@ class ObstaclesManager:
         Args:
             verticies (np.ndarray): a two-dimensional numpy array, each row has two elements
         """
+        self.register_obstacle_batch([self._get_static_obstacle_polygon(vertices)])
+
+    def _get_static_obstacle_polygon(self, vertices: np.ndarray) -> tuple:
+        """model file, start pos and model name of a polygon obstacle for register_obstacle_batch"""
         assert vertices.ndim == 2 and vertices.shape[0] >= 3 and vertices.shape[1] == 2
-        model_path, start_pos = self._generate_static_obstacle_polygon_yaml(
-            vertices)
-        self.register_obstacles(1, model_path, start_pos)
-        os.remove(model_path)
+        # calculate center of the obstacle and convert the vertices to the local coordinate system
+        obstacle_center = vertices.mean(axis=0)
+        vertices = np.round(vertices - obstacle_center, 6)
+        model = self._model_registry.get(
+            "polygon_static", tuple(vertices.ravel().tolist()),
+            lambda: self._generate_static_obstacle_polygon_model(vertices))
+        return model.path, obstacle_center.tolist() + [0.0], "_polygon_static"
 
     def register_static_obstacle_circle(self, x, y, circle):
-        model_path = self._generate_static_obstacle_circle_yaml(circle)
-        self.register_obstacles(1, model_path, [x, y, 0])
-        os.remove(model_path)
+        self.register_obstacle_batch([self._get_static_obstacle_circle(x, y, circle)])
+
+    def _get_static_obstacle_circle(self, x, y, circle) -> tuple:
+        model = self._model_registry.get(
+            "circle_static", (circle,), lambda: self._generate_static_obstacle_circle_model(circle))
+        return model.path, [x, y, 0], "_circle_static"
 
     def register_dynamic_obstacle_circle_tween2(self, obstacle_name: str, obstacle_radius: float, linear_velocity: float, start_pos: Pose2D, waypoints: list, is_waypoint_relative: bool = True,  mode: str = "yoyo", trigger_zones: list = []):
         """register dynamic obstacle with circle shape. The trajectory of the obstacle is defined with the help of the plugin "tween2"
@@ -213,14 +416,41 @@ class ObstaclesManager:
             trigger_zones (list): a list of 3-elementary, every element (x,y,r) represent a circle zone with the center (x,y) and radius r. if its empty,
                 then the dynamic obstacle will keeping moving once it is spawned. Defaults to True.
         """
-        model_path, move_to_start_pub = self._generate_dynamic_obstacle_yaml_tween2(
-            obstacle_name, obstacle_radius, linear_velocity, waypoints, is_waypoint_relative,  mode, trigger_zones)
-        self._move_all_obstacles_start_pos_pubs.append(move_to_start_pub)
-        self.register_obstacles(1, model_path, start_pos)
-        os.remove(model_path)
+        self.register_scenerio_obstacles(tween2_obstacles=[(
+            obstacle_name, obstacle_radius, linear_velocity, start_pos, waypoints, is_waypoint_relative, mode,
+            trigger_zones)])
+
+    def register_scenerio_obstacles(self, static_circles: list = [], static_polygons: list = [],
+                                    tween2_obstacles: list = []):
+        """register the obstacles of a scenerio with one batch of concurrent spawn requests
+
+        Args:
+            static_circles (list): (x, y, radius) of the circle obstacles
+            static_polygons (list): vertices of the polygon obstacles, see register_static_obstacle_polygon
+            tween2_obstacles (list): arguments of register_dynamic_obstacle_circle_tween2 of the dynamic obstacles
+        """
+        obstacles = [self._get_static_obstacle_circle(*circle) for circle in static_circles]
+        obstacles += [self._get_static_obstacle_polygon(np.asarray(vertices)) for vertices in static_polygons]
+        for (obstacle_name, obstacle_radius, linear_velocity, start_pos, waypoints, is_waypoint_relative, mode,
+             trigger_zones) in tween2_obstacles:
+            # the model contains the namespace and the name of the obstacle, so it is only reused by the same scenario
+            model = self._model_registry.get(
+                "dynamic_with_traj",
+                (self.ns, obstacle_name, obstacle_radius, linear_velocity, repr(waypoints), is_waypoint_relative,
+                 mode, repr(trigger_zones)),
+                lambda: self._generate_dynamic_obstacle_model_tween2(
+                    obstacle_name, obstacle_radius, linear_velocity, waypoints, is_waypoint_relative, mode,
+                    trigger_zones))
+            obstacles.append((model.path, list(start_pos), "dynamic_with_traj"))
+        names = self.register_obstacle_batch(obstacles)
+
+        for obstacle, name in zip(tween2_obstacles, names[len(names) - len(tween2_obstacles):]):
+            if name is not None:
+                self._move_all_obstacles_start_pos_pubs[name] = rospy.Publisher(
+                    self.ns_prefix + obstacle[0] + '/move_to_start_pos', Empty, queue_size=1)
 
     def move_all_obstacles_to_start_pos_tween2(self):
-        for move_obstacle_start_pos_pub in self._move_all_obstacles_start_pos_pubs:
+        for move_obstacle_start_pos_pub in self._move_all_obstacles_start_pos_pubs.values():
             move_obstacle_start_pos_pub.publish(Empty())
 
     def move_obstacle(self, obstacle_name: str, x: float, y: float, theta: float):
@@ -243,46 +473,93 @@ class ObstaclesManager:
         srv_request.pose.theta = theta
 
         self._srv_move_model(srv_request)
+        self.counters["moves"] += 1
+        self._parked_obstacles.discard(obstacle_name)
 
     def reset_pos_obstacles_random(self, active_obstacle_rate: float = 1, forbidden_zones: Union[list, None] = None):
         """randomly set the position of all the obstacles. In order to dynamically control the number of the obstacles within the
         map while keep the efficiency. we can set the parameter active_obstacle_rate so that the obstacles non-active will moved to the
         outside of the map
 
+        The positions of all active obstacles are sampled jointly, so that they neither overlap each other nor the
+        forbidden zones. Static obstacles which are outside of the map already are not moved again, dynamic ones
+        are, since they keep moving. The move_model requests are sent concurrently, the latencies are stored in
+        last_reset_latency.
+
         Args:
             active_obstacle_rate (float): a parameter change the number of the obstacles within the map
             forbidden_zones (list): a list of tuples with the format (x,y,r),where the the obstacles should not be reset.
         """
+        start = time.perf_counter()
         active_obstacle_names = random.sample(self.obstacle_name_list, int(
             len(self.obstacle_name_list) * active_obstacle_rate))
         non_active_obstacle_names = set(
-            self.obstacle_name_list) - set(active_obstacle_names)
+            self.obstacle_name_list) - set(active_obstacle_names) - (self._parked_obstacles & self._static_obstacles)
 
         # non_active obstacles will be moved to outside of the map
-        resolution = self.map.info.resolution
-        pos_non_active_obstacle = Pose2D()
-        pos_non_active_obstacle.x = self.map.info.origin.position.x - \
-            resolution * self.map.info.width
-        pos_non_active_obstacle.y = self.map.info.origin.position.y - \
-            resolution * self.map.info.width
+        pos_non_active_obstacle = self._get_parking_pose()
 
-        for obstacle_name in active_obstacle_names:
+        radii = [self._obstacle_radius.get(name, 0.2) for name in active_obstacle_names]
+        poses = self._free_space_sampler.sample_separated(radii, forbidden_zones)
+        requests = []
+        for obstacle_name, (x, y, theta) in zip(active_obstacle_names, poses):
             move_model_request = MoveModelRequest()
             move_model_request.name = obstacle_name
-            # TODO 0.2 is the obstacle radius. it should be set automatically in future.
-            move_model_request.pose.x, move_model_request.pose.y, move_model_request.pose.theta = get_random_pos_on_map(
-                self._free_space_indices, self.map, 0.2, forbidden_zones)
-
-            self._srv_move_model(move_model_request)
+            move_model_request.pose.x, move_model_request.pose.y, move_model_request.pose.theta = x, y, theta
+            requests.append(move_model_request)
 
         for non_active_obstacle_name in non_active_obstacle_names:
             move_model_request = MoveModelRequest()
             move_model_request.name = non_active_obstacle_name
             move_model_request.pose = pos_non_active_obstacle
-            self._srv_move_model(move_model_request)
-
-    def _generate_dynamic_obstacle_yaml_tween2(self, obstacle_name: str, obstacle_radius: float, linear_velocity: float, waypoints: list, is_waypoint_relative: bool,  mode: str, trigger_zones: list):
-        """generate a yaml file in which the movement of the obstacle is controller by the plugin tween2
+            requests.append(move_model_request)
+        sampled = time.perf_counter()
+
+        self._move_models(requests)
+        self._parked_obstacles.difference_update(active_obstacle_names)
+        self._parked_obstacles.update(non_active_obstacle_names)
+
+        self.last_reset_latency = {
+            "sample": sampled - start,
+            "move": time.perf_counter() - sampled,
+            "num_moves": len(requests),
+        }
+        rospy.logdebug(f"({self.ns}) obstacles reset: {self.last_reset_latency}")
+
+    def _move_model_worker(self, request: MoveModelRequest):
+        if not hasattr(self._service_proxies, "move_model"):
+            self._service_proxies.move_model = rospy.ServiceProxy(
+                f'{self.ns_prefix}move_model', MoveModel, persistent=True)
+        return self._service_proxies.move_model(request)
+
+    def _spawn_model_worker(self, request: SpawnModelRequest):
+        if not hasattr(self._service_proxies, "spawn_model"):
+            self._service_proxies.spawn_model = rospy.ServiceProxy(
+                f'{self.ns_prefix}spawn_model', SpawnModel, persistent=True)
+        return self._service_proxies.spawn_model(request)
+
+    def _move_models(self, requests: list):
+        """sends the move_model requests concurrently and waits for all responses"""
+        self.counters["moves"] += len(requests)
+        if len(requests) == 0:
+            return
+        if len(requests) == 1:
+            self._srv_move_model(requests[0])
+            return
+        # result() re-raises a rospy.ServiceException of a request
+        for future in [self._service_executor.submit(self._move_model_worker, request) for request in requests]:
+            future.result()
+
+    def _spawn_models(self, requests: list) -> list:
+        """sends the spawn_model requests concurrently and returns the responses in the order of the requests"""
+        self.counters["spawns"] += len(requests)
+        if len(requests) <= 1:
+            return [self._srv_spawn_model.call(request) for request in requests]
+        return [future.result() for future in
+                [self._service_executor.submit(self._spawn_model_worker, request) for request in requests]]
+
+    def _generate_dynamic_obstacle_model_tween2(self, obstacle_name: str, obstacle_radius: float, linear_velocity: float, waypoints: list, is_waypoint_relative: bool,  mode: str, trigger_zones: list):
+        """generate a model in which the movement of the obstacle is controller by the plugin tween2
 
         Args:
             obstacle_name (str): [description]
@@ -294,18 +571,12 @@ class ObstaclesManager:
             trigger_zones (list): a list of 3-elementary, every element (x,y,r) represent a circle zone with the center (x,y) and radius r. if its empty,
                 then the dynamic obstacle will keeping moving once it is spawned. Defaults to True.
         Returns:
-            [type]: [description]
+            dict: the model
         """
         for i, way_point in enumerate(waypoints):
             if len(way_point) != 3:
                 raise ValueError(
                     f"ways points must a list of 3-elementary list, However the {i}th way_point is {way_point}")
-        tmp_folder_path = os.path.join(rospkg.RosPack().get_path(
-            'simulator_setup'), 'tmp_random_obstacles')
-        os.makedirs(tmp_folder_path, exist_ok=True)
-        tmp_model_name = self.ns+"dynamic_with_traj.model.yaml" #_dynamic_with_traj
-        
-        yaml_path = os.path.join(tmp_folder_path, tmp_model_name)
         # define body
         body = {}
         body["name"] = "object_with_traj"
@@ -336,8 +607,6 @@ class ObstaclesManager:
         # we can not use the flatland provided service to move the object, othewise the Tween2 will not work properly.
         move_with_traj['move_to_start_pos_topic'] = self.ns_prefix + obstacle_name + \
             '/move_to_start_pos'
-        move_to_start_pos_pub = rospy.Publisher(
-            move_with_traj['move_to_start_pos_topic'], Empty, queue_size=1)
         move_with_traj['waypoints'] = waypoints
         move_with_traj['is_waypoint_relative'] = is_waypoint_relative
         move_with_traj['mode'] = mode
@@ -345,29 +614,14 @@ class ObstaclesManager:
         move_with_traj['trigger_zones'] = trigger_zones
         move_with_traj['robot_odom_topic'] = self.ns_prefix + 'odom'
         dict_file['plugins'].append(move_with_traj)
+        return dict_file
 
-        with open(yaml_path, 'w') as fd:
-            yaml.dump(dict_file, fd)
-        return yaml_path, move_to_start_pos_pub
-
-    def _generate_static_obstacle_polygon_yaml(self, vertices):
-        # since flatland  can only config the model by parsing the yaml file, we need to create a file for every random obstacle
-        tmp_folder_path = os.path.join(rospkg.RosPack().get_path(
-            'simulator_setup'), 'tmp_random_obstacles')
-        os.makedirs(tmp_folder_path, exist_ok=True)
-        tmp_model_name = self.ns+"_polygon_static.model.yaml"
-        yaml_path = os.path.join(tmp_folder_path, tmp_model_name)
+    @staticmethod
+    def _generate_static_obstacle_polygon_model(vertices: np.ndarray):
+        """vertices in the local coordinate system of the obstacle"""
         # define body
         body = {}
         body["name"] = "static_object"
-        # calculate center of the obstacle
-        obstacle_center = vertices.mean(axis=0)
-        # convert to local coordinate system
-        vertices = vertices - obstacle_center
-        # convert to x,y,theta
-        obstacle_center = obstacle_center.tolist()
-        obstacle_center.append(0.0)
-
         body["type"] = "static"
         body["color"] = [0.2, 0.8, 0.2, 0.75]
         body["footprints"] = []
@@ -385,17 +639,10 @@ class ObstaclesManager:
         body["footprints"].append(f)
         # define dict_file
         dict_file = {'bodies': [body]}
-        with open(yaml_path, 'w') as fd:
-            yaml.dump(dict_file, fd)
-        return yaml_path, obstacle_center
-
-    def _generate_static_obstacle_circle_yaml(self, radius):
-        # since flatland  can only config the model by parsing the yaml file, we need to create a file for every random obstacle
-        tmp_folder_path = os.path.join(rospkg.RosPack().get_path(
-            'simulator_setup'), 'tmp_random_obstacles')
-        os.makedirs(tmp_folder_path, exist_ok=True)
-        tmp_model_name = self.ns+"_circle_static.model.yaml"
-        yaml_path = os.path.join(tmp_folder_path, tmp_model_name)
+        return dict_file
+
+    @staticmethod
+    def _generate_static_obstacle_circle_model(radius):
         # define body
         body = {}
         body["name"] = "static_object"
@@ -416,18 +663,16 @@ class ObstaclesManager:
         body["footprints"].append(f)
         # define dict_file
         dict_file = {'bodies': [body]}
-        with open(yaml_path, 'w') as fd:
-            yaml.dump(dict_file, fd)
-        return yaml_path
-
-    def _generate_random_obstacle_yaml(self,
-                                       is_dynamic=False,
-                                       linear_velocity=0.3,
-                                       angular_velocity_max=math.pi/4,
-                                       num_vertices=3,
-                                       min_obstacle_radius=0.5,
-                                       max_obstacle_radius=1.5):
-        """generate a yaml file describing the properties of the obstacle.
+        return dict_file
+
+    @staticmethod
+    def _generate_random_obstacle_model(is_dynamic=False,
+                                        linear_velocity=0.3,
+                                        angular_velocity_max=math.pi/4,
+                                        num_vertices=3,
+                                        obstacle_radius=0.5,
+                                        variant=0):
+        """generate a model describing the properties of the obstacle.
         The dynamic obstacles have the shape of circle,which moves with a constant linear velocity and angular_velocity_max
 
         and the static obstacles have the shape of polygon.
@@ -437,19 +682,10 @@ class ObstaclesManager:
             linear_velocity (float): the constant linear velocity of the dynamic obstacle. Defaults to 1.5.
             angular_velocity_max (float): the maximum angular velocity of the dynamic obstacle. Defaults to math.pi/4.
             num_vertices (int, optional): the number of vetices, only used when generate static obstacle . Defaults to 3.
-            min_obstacle_radius (float, optional): Defaults to 0.5.
-            max_obstacle_radius (float, optional): Defaults to 1.5.
+            obstacle_radius (float, optional): radius of the dynamic obstacle. Defaults to 0.5.
+            variant (int, optional): seed of the vertices of the static obstacle, the same variant always
+                results in the same polygon. Defaults to 0.
         """
-
-        # since flatland  can only config the model by parsing the yaml file, we need to create a file for every random obstacle
-        tmp_folder_path = os.path.join(rospkg.RosPack().get_path(
-            'simulator_setup'), 'tmp_random_obstacles')
-        os.makedirs(tmp_folder_path, exist_ok=True)
-        if is_dynamic:
-            tmp_model_name = self.ns+"_random_dynamic.model.yaml"
-        else:
-            tmp_model_name = self.ns+"_random_static.model.yaml"
-        yaml_path = os.path.join(tmp_folder_path, tmp_model_name)
         # define body
         body = {}
         body["name"] = "random"
@@ -471,15 +707,10 @@ class ObstaclesManager:
         # dynamic obstacles have the shape of circle
         if is_dynamic:
             f["type"] = "circle"
-            f["radius"] = random.uniform(
-                min_obstacle_radius, max_obstacle_radius)
+            f["radius"] = obstacle_radius
         else:
             f["type"] = "polygon"
             f["points"] = []
-            # random_num_vert = random.randint(
-            #     min_obstacle_vert, max_obstacle_vert)
-            radius = random.uniform(
-                min_obstacle_radius, max_obstacle_radius)
             # When we send the request to ask flatland server to respawn the object with polygon, it will do some checks
             # one important assert is that the minimum distance should be above this value
             # https://github.com/erincatto/box2d/blob/75496a0a1649f8ee6d2de6a6ab82ee2b2a909f42/include/box2d/b2_common.h#L65
@@ -493,9 +724,10 @@ class ObstaclesManager:
                 np.fill_diagonal(points_dist, 1)
                 min_dist = points_dist.min()
                 return min_dist > POINTS_MIN_DIST
+            rng = np.random.default_rng([num_vertices, variant])
             points = None
             while points is None:
-                angles = 2*np.pi*np.random.random(num_vertices)
+                angles = 2*np.pi*rng.random(num_vertices)
                 points = np.array([np.cos(angles), np.sin(angles)]).T
                 if not min_dist_check_passed(points):
                     points = None
@@ -513,17 +745,15 @@ class ObstaclesManager:
             random_move['angular_velocity_max'] = angular_velocity_max
             random_move['body'] = 'random'
             dict_file['plugins'].append(random_move)
-
-        with open(yaml_path, 'w') as fd:
-            yaml.dump(dict_file, fd)
-        return yaml_path
+        return dict_file
 
     def remove_obstacle(self, name: str):
-        if len(self.obstacle_name_list) != 0:
-            assert name in self.obstacle_name_list
+        if len(self.obstacle_name_list) != 0 or len(self._pool) != 0:
+            assert name in self.obstacle_name_list or name in self._pool
         srv_request = DeleteModelRequest()
         srv_request.name = name
         response = self._srv_delete_model(srv_request)
+        self.counters["deletes"] += 1
 
         if not response.success:
             """
@@ -541,19 +771,15 @@ class ObstaclesManager:
             prefix_names (Union[list,None], optional): a list of group names. if it is None then all obstacles will
                 be deleted. Defaults to None.
         """
-        if len(self.obstacle_name_list) != 0:
-            if prefix_names is None:
-                group_names = '.'
-                re_pattern = "^(?:" + '|'.join(group_names) + r')\w*'
-            else:
-                re_pattern = "^(?:" + '|'.join(prefix_names) + r')\w*'
-            r = re.compile(re_pattern)
-            to_be_removed_obstacles_names = list(
-                filter(r.match, self.obstacle_name_list))
+        if len(self.obstacle_name_list) != 0 or len(self._pool) != 0:
+            to_be_removed_obstacles_names = self._match_names(self.obstacle_name_list + self._pool, prefix_names)
             for n in to_be_removed_obstacles_names:
                 self.remove_obstacle(n)
             self.obstacle_name_list = list(
                 set(self.obstacle_name_list)-set(to_be_removed_obstacles_names))
+            self._pool = [n for n in self._pool if n not in set(to_be_removed_obstacles_names)]
+            for n in to_be_removed_obstacles_names:
+                self._forget_obstacle(n)
         else:
             # # it possible that in flatland there are still obstacles remaining when we create an instance of
             # # this class.
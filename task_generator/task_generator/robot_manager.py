@@ -17,7 +17,7 @@ from geometry_msgs.msg import Pose2D, PoseWithCovarianceStamped, PoseStamped
 
 from nav_msgs.msg import OccupancyGrid, Path
 
-from .utils import generate_freespace_indices, get_random_pos_on_map
+from .map_service import get_task_generation_service
 
 
 class RobotManager:
@@ -43,6 +43,9 @@ class RobotManager:
         self.is_training_mode = rospy.get_param("/train_mode")
         self.step_size = rospy.get_param("step_size")
         self._get_robot_configration(robot_yaml_path)
+        # random start and goal positions are drawn from the start goal bank of the map if it was built offline by
+        # scripts/build_start_goal_banks.py, see StartGoalBank, otherwise they are sampled from the free space
+        self._use_start_goal_bank = rospy.get_param("start_goal_bank", True)
         # setup proxy to handle  services provided by flatland
         rospy.wait_for_service(f"{self.ns_prefix}move_model", timeout=timeout)
         rospy.wait_for_service(f"{self.ns_prefix}spawn_model", timeout=timeout)
@@ -110,8 +113,12 @@ class RobotManager:
 
     def update_map(self, new_map: OccupancyGrid):
         self.map = new_map
-        # a tuple stores the indices of the non-occupied spaces. format ((y,....),(x,...)
-        self._free_space_indices = generate_freespace_indices(self.map)
+        # clearance map of the non-occupied spaces, computed once per map for all namespaces
+        self._map_context = get_task_generation_service().get_map_context(self.map)
+        self._free_space_sampler = self._map_context.get_free_space_sampler()
+        # loaded at the first random reset on the map, None if the map has no bank
+        self._start_goal_bank = None
+        self._start_goal_bank_loaded = False
 
     def move_robot(self, pose: Pose2D):
         """move the robot to a given position
@@ -141,8 +148,8 @@ class RobotManager:
 
     def set_start_pos_random(self):
         start_pos = Pose2D()
-        start_pos.x, start_pos, start_pos.theta = get_random_pos_on_map(
-            self._free_space_indices, self.map, self.ROBOT_RADIUS
+        start_pos.x, start_pos.y, start_pos.theta = self._free_space_sampler.sample_pos(
+            self.ROBOT_RADIUS
         )
         self.move_robot(start_pos)
 
@@ -166,6 +173,11 @@ class RobotManager:
         def dist(x1, y1, x2, y2):
             return math.sqrt((x1 - x2) ** 2 + (y1 - y2) ** 2)
 
+        if start_pos is None and goal_pos is None and self._use_start_goal_bank:
+            start_pos_goal_pos = self._set_start_pos_goal_pos_from_bank(min_dist)
+            if start_pos_goal_pos is not None:
+                return start_pos_goal_pos
+
         if start_pos is None or goal_pos is None:
             # if any of them need to be random generated, we set a higher threshold,otherwise only try once
             max_try_times = 20
@@ -183,9 +195,7 @@ class RobotManager:
                     start_pos_.x,
                     start_pos_.y,
                     start_pos_.theta,
-                ) = get_random_pos_on_map(
-                    self._free_space_indices, self.map, self.ROBOT_RADIUS * 2
-                )
+                ) = self._free_space_sampler.sample_pos(self.ROBOT_RADIUS * 2)
             else:
                 start_pos_ = start_pos
             if goal_pos is None:
@@ -194,9 +204,7 @@ class RobotManager:
                     goal_pos_.x,
                     goal_pos_.y,
                     goal_pos_.theta,
-                ) = get_random_pos_on_map(
-                    self._free_space_indices, self.map, self.ROBOT_RADIUS * 2
-                )
+                ) = self._free_space_sampler.sample_pos(self.ROBOT_RADIUS * 2)
             else:
                 goal_pos_ = goal_pos
 
@@ -222,6 +230,27 @@ class RobotManager:
         else:
             return start_pos_, goal_pos_
 
+    def _set_start_pos_goal_pos_from_bank(self, min_dist: float):
+        """
+        draws a connected pair from the start goal bank, returns None if the map has no bank built by
+        scripts/build_start_goal_banks.py or the bank has no pair for min_dist
+        """
+        if not self._start_goal_bank_loaded:
+            self._start_goal_bank = self._map_context.get_start_goal_bank(self.ROBOT_RADIUS)
+            self._start_goal_bank_loaded = True
+        if self._start_goal_bank is None:
+            return None
+        pair = self._start_goal_bank.draw(min_dist)
+        if pair is None:
+            return None
+        start_pos, goal_pos = Pose2D(*pair[0]), Pose2D(*pair[1])
+        self.move_robot(start_pos)
+        try:
+            self.publish_goal(goal_pos.x, goal_pos.y, goal_pos.theta)
+        except rospy.ServiceException:
+            return None
+        return start_pos, goal_pos
+
     def _validate_path(self):
         """after publish the goal, the global planner should publish path. If it's not published within 0.1s, an exception will
         be raised.
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+from typing import Callable, List, NamedTuple, Tuple
+
+import numpy as np
+import rospkg
+
+# part of the cache key, increase it when the compiled forms or the compile functions change
+CACHE_VERSION = 1
+
+
+class Tween2Obstacle(NamedTuple):
+    """arguments of ObstaclesManager.register_dynamic_obstacle_circle_tween2"""
+    obstacle_name: str
+    obstacle_radius: float
+    linear_velocity: float
+    start_pos: Tuple[float, float, float]
+    waypoints: Tuple[Tuple[float, float, float], ...]
+    is_waypoint_relative: bool
+    mode: str
+    trigger_zones: Tuple[Tuple[float, float, float], ...]
+
+
+class CompiledScenerio(NamedTuple):
+    name: str
+    repeats: int
+    # (x, y, radius) of the static circles and global vertices of the static polygons
+    static_circles: Tuple[Tuple[float, float, float], ...]
+    static_polygons: Tuple[np.ndarray, ...]
+    dynamic_obstacles: Tuple[Tween2Obstacle, ...]
+    robot_start_pos: Tuple[float, float, float]
+    robot_goal_pos: Tuple[float, float, float]
+
+
+class CompiledArenaScenario(NamedTuple):
+    peds: list
+    # (model path, name, (x, y, theta)) of the static flatland obstacles
+    static_obstacles: Tuple[Tuple[str, str, Tuple[float, float, float]], ...]
+    robot_start_pos: Tuple[float, float, float]
+    robot_goal_pos: Tuple[float, float, float]
+
+
+def _pose(scene_name: str, what: str, pose) -> Tuple[float, float, float]:
+    if len(pose) != 3:
+        raise ValueError(f"Scene {scene_name}: {what} must be a 3-elementary list, got {pose}")
+    return tuple(float(v) for v in pose)
+
+
+def compile_scenerio(scenerio_data: dict) -> CompiledScenerio:
+    """validates a scenerio of the scenerios json file of ScenerioTask and converts it to its compiled form"""
+    scenerio_name = scenerio_data["scene_name"]
+    watchers_dict = scenerio_data.get("watchers", {})
+
+    static_circles, static_polygons = [], []
+    for obstacle_name, obstacle_data in scenerio_data.get("static_obstacles", {}).items():
+        if obstacle_data["shape"] == "circle":
+            static_circles.append((float(obstacle_data["x"]), float(obstacle_data["y"]), float(obstacle_data["radius"])))
+        # vertices uses global coordinate system, the order of the vertices is doesn't matter
+        elif obstacle_data["shape"] == "polygon":
+            vertices = np.array(obstacle_data["vertices"], dtype=np.float64)
+            if vertices.ndim != 2 or vertices.shape[0] < 3 or vertices.shape[1] != 2:
+                raise ValueError(f"Scene {scenerio_name}: polygon [{obstacle_name}] needs at least 3 2D vertices")
+            static_polygons.append(vertices)
+        else:
+            raise ValueError(
+                f"Shape {obstacle_data['shape']} is not supported, supported shape 'circle' OR 'polygon'"
+            )
+
+    dynamic_obstacles = []
+    for obstacle_name, obstacle_data in scenerio_data.get("dynamic_obstacles", {}).items():
+        trigger_zones = []
+        for trigger in obstacle_data.get("triggers", []):
+            if trigger not in watchers_dict:
+                raise ValueError(
+                    f"For dynamic obstacle [{obstacle_name}] the trigger: {trigger} not found in the corresponding 'watchers' dict for scene {scenerio_name} "
+                )
+            trigger_zones.append(tuple(watchers_dict[trigger]["pos"]) + (watchers_dict[trigger]["range"],))
+        # currently dynamic obstacle only has circle shape
+        dynamic_obstacles.append(Tween2Obstacle(
+            obstacle_name,
+            float(obstacle_data["obstacle_radius"]),
+            float(obstacle_data["linear_velocity"]),
+            _pose(scenerio_name, f"start_pos of [{obstacle_name}]", obstacle_data["start_pos"]),
+            tuple(_pose(scenerio_name, f"waypoint of [{obstacle_name}]", waypoint)
+                  for waypoint in obstacle_data["waypoints"]),
+            bool(obstacle_data["is_waypoint_relative"]),
+            obstacle_data["mode"],
+            tuple(trigger_zones),
+        ))
+
+    robot_data = scenerio_data["robot"]
+    return CompiledScenerio(
+        scenerio_name,
+        int(scenerio_data["repeats"]),
+        tuple(static_circles),
+        tuple(static_polygons),
+        tuple(dynamic_obstacles),
+        _pose(scenerio_name, "robot start_pos", robot_data["start_pos"]),
+        _pose(scenerio_name, "robot goal_pos", robot_data["goal_pos"]),
+    )
+
+
+def compile_scenerios(path: str) -> List[CompiledScenerio]:
+    with open(path, "r") as fd:
+        json_data = json.load(fd)
+    return [compile_scenerio(scenerio_data) for scenerio_data in json_data["scenarios"]]
+
+
+def compile_arena_scenario(path: str) -> CompiledArenaScenario:
+    """loads a scenario file of the arena-tools format, see ScenarioTask"""
+    # arena-tools is added to the path by the tasks module
+    from ArenaScenario import ArenaScenario
+
+    scenario = ArenaScenario()
+    scenario.loadFromFile(path)
+    return CompiledArenaScenario(
+        [agent.getPedMsg() for agent in scenario.pedsimAgents],
+        tuple(
+            (obstacle.flatlandModel.path, obstacle.name, (obstacle.pos[0], obstacle.pos[1], obstacle.angle))
+            for obstacle in scenario.staticObstacles
+        ),
+        (scenario.robotPosition[0], scenario.robotPosition[1], 0.0),
+        (scenario.robotGoal[0], scenario.robotGoal[1], 0.0),
+    )
+
+
+class CompiledScenarioCache:
+    """
+    Compiled scenario files by the hash of their content.
+
+    The compiled forms are kept in memory, so that all tasks of a process share them, and pickled into the cache
+    folder, so that later runs skip parsing and validating an unchanged file. The pickles are replaced atomically,
+    parallel processes can share the folder.
+    """
+
+    def __init__(self, folder: str):
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self._compiled = {}
+        self._lock = threading.Lock()
+
+    def get(self, path: str, compile_fn: Callable[[str], object]):
+        with open(path, "rb") as fd:
+            digest = hashlib.sha1(fd.read()).hexdigest()[:16]
+        key = f"{compile_fn.__name__}_v{CACHE_VERSION}_{digest}"
+        with self._lock:
+            if key in self._compiled:
+                return self._compiled[key]
+
+        cache_path = os.path.join(self.folder, f"{key}.pkl")
+        compiled = None
+        if os.path.isfile(cache_path):
+            try:
+                with open(cache_path, "rb") as fd:
+                    compiled = pickle.load(fd)
+            except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+                compiled = None
+        if compiled is None:
+            compiled = compile_fn(path)
+            tmp_path = f"{cache_path}.{os.getpid()}_{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as fd:
+                pickle.dump(compiled, fd)
+            os.replace(tmp_path, cache_path)
+
+        with self._lock:
+            self._compiled[key] = compiled
+        return compiled
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_compiled_scenario_cache() -> CompiledScenarioCache:
+    """cache shared by all tasks of the process, the files are stored in simulator_setup"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            folder = os.path.join(rospkg.RosPack().get_path("simulator_setup"), "tmp_compiled_scenarios")
+            _cache = CompiledScenarioCache(folder)
+        return _cache
@@ -0,0 +1,225 @@
+import hashlib
+import json
+import math
+import os
+from typing import Tuple, Union
+
+import numpy as np
+import rospkg
+import scipy.ndimage
+import scipy.sparse
+import scipy.sparse.csgraph
+from nav_msgs.msg import OccupancyGrid
+
+from .utils import FreeSpaceSampler
+
+# geodesic distance bins in meters, the pairs closer than the first edge are not stored
+DEFAULT_BIN_EDGES = (1.0, 2.0, 4.0, 8.0, 16.0, math.inf)
+
+
+def get_map_digest(map_: OccupancyGrid) -> str:
+    """
+    hash of the grid and its geometry, identifies the map of a bank independent of its file or topic.
+
+    The resolution of an OccupancyGrid message is a float32 (0.05 arrives as 0.05000000074505806) while a map loaded
+    from its yaml holds the float64 value, so resolution and origin are rounded to float32 before hashing and the
+    /static_map map and the load_map_yaml map of the same file have the same digest.
+    """
+    info = map_.info
+    digest = hashlib.sha1()
+    digest.update(np.array([info.width, info.height], dtype=np.int64).tobytes())
+    digest.update(np.array([info.resolution, info.origin.position.x, info.origin.position.y],
+                           dtype=np.float32).tobytes())
+    digest.update(np.asarray(map_.data, dtype=np.int8).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def _grid_graph(traversable: np.ndarray) -> scipy.sparse.csr_matrix:
+    """8-connected graph of the traversable cells, the edges are weighted with their length in cells"""
+    height, width = traversable.shape
+    nodes = np.full(traversable.shape, -1, dtype=np.int64)
+    nodes[traversable] = np.arange(np.count_nonzero(traversable))
+    rows, cols, weights = [], [], []
+    for dy, dx in ((0, 1), (1, 0), (1, 1), (1, -1)):
+        src = nodes[:height - dy, max(0, -dx):width - max(0, dx)]
+        dst = nodes[dy:, max(0, dx):width - max(0, -dx)]
+        edge = (src >= 0) & (dst >= 0)
+        rows.append(src[edge])
+        cols.append(dst[edge])
+        weights.append(np.full(np.count_nonzero(edge), math.hypot(dy, dx)))
+    n = np.count_nonzero(traversable)
+    return scipy.sparse.csr_matrix(
+        (np.concatenate(weights), (np.concatenate(rows), np.concatenate(cols))), shape=(n, n))
+
+
+class StartGoalBank:
+    """
+    Start and goal positions of the robot which are connected on the map, grouped by their geodesic distance.
+
+    The bank is built offline from the map inflated by the robot radius: cells with a clearance below the radius are
+    blocked, the remaining cells are split into 8-connected components and the shortest paths from a set of random
+    start cells are searched on the grid graph. For every start and distance bin, goals within the bin are drawn
+    from the reachable cells. Therefore every pair is connected for a robot of the given radius (as far as the static
+    map goes) and a reset is a single random draw, whose distance distribution is controlled by the bin weights.
+
+    The pairs are stored as flat cell indices sorted by bin, the file is a few bytes per pair.
+    """
+
+    def __init__(self, starts: np.ndarray, goals: np.ndarray, dists: np.ndarray, bin_offsets: np.ndarray,
+                 bin_edges: np.ndarray, meta: dict, seed: Union[int, None] = None):
+        self.starts = starts
+        self.goals = goals
+        self.dists = dists
+        self.bin_offsets = bin_offsets
+        self.bin_edges = bin_edges
+        self.meta = meta
+        self._rng = np.random.default_rng(seed)
+        self._resolution = meta["resolution"]
+        self._origin = np.array(meta["origin"])
+        self._width = int(meta["width"])
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @property
+    def bin_counts(self) -> np.ndarray:
+        return np.diff(self.bin_offsets)
+
+    @classmethod
+    def build(cls, map_: OccupancyGrid, robot_radius: float, endpoint_clearance: Union[float, None] = None,
+              bin_edges: tuple = DEFAULT_BIN_EDGES, num_sources: int = 64, goals_per_bin: int = 32,
+              seed: Union[int, None] = None, clearance: Union[np.ndarray, None] = None) -> "StartGoalBank":
+        """
+        Args:
+            map_ (OccupancyGrid): map proviced by the ros map service
+            robot_radius (float): radius the map is inflated by
+            endpoint_clearance (float, optional): minimum clearance of the start and goal positions.
+                Defaults to 2 * robot_radius like RobotManager.set_start_pos_goal_pos.
+            bin_edges (tuple, optional): edges of the geodesic distance bins in meters
+            num_sources (int, optional): number of start cells
+            goals_per_bin (int, optional): maximum number of goals per start cell and bin
+            seed (int, optional): seed of the random generator
+            clearance (np.ndarray, optional): precomputed clearance map, see FreeSpaceSampler.compute_clearance
+        """
+        if endpoint_clearance is None:
+            endpoint_clearance = 2 * robot_radius
+        rng = np.random.default_rng(seed)
+        bin_edges = np.asarray(bin_edges, dtype=np.float64)
+        num_bins = len(bin_edges) - 1
+        info = map_.info
+        if clearance is None:
+            clearance = FreeSpaceSampler.compute_clearance(map_)
+        clearance = clearance.reshape(info.height, info.width)
+
+        traversable = clearance >= robot_radius
+        _, num_components = scipy.ndimage.label(traversable, structure=np.ones((3, 3)))
+        # flat map cell of every graph node and the nodes which can be a start or a goal
+        node_cells = np.flatnonzero(traversable)
+        endpoint_nodes = np.flatnonzero(clearance.ravel()[node_cells] >= endpoint_clearance)
+        endpoint_xy = np.stack([node_cells[endpoint_nodes] % info.width, node_cells[endpoint_nodes] // info.width],
+                               axis=1) * info.resolution
+        graph = _grid_graph(traversable)
+
+        pairs = [[] for _ in range(num_bins)]
+        if len(endpoint_nodes):
+            sources = rng.choice(endpoint_nodes, min(num_sources, len(endpoint_nodes)), replace=False)
+            limit = bin_edges[-1] / info.resolution
+            # a few sources at a time, the distances of a source cover the whole map
+            for chunk in np.array_split(sources, math.ceil(len(sources) / 8)):
+                dists = scipy.sparse.csgraph.dijkstra(graph, directed=False, indices=chunk, limit=limit)
+                dists = dists[:, endpoint_nodes] * info.resolution
+                bins = np.digitize(dists, bin_edges) - 1
+                for source, source_dists, source_bins in zip(chunk, dists, bins):
+                    # the grid paths are a bit longer than the straight line, the pairs whose straight line is
+                    # shorter than the lower edge of their bin are dropped, so that min_dist holds for both
+                    source_xy = endpoint_xy[np.searchsorted(endpoint_nodes, source)]
+                    straight = np.hypot(*(endpoint_xy - source_xy).T)
+                    source_bins = np.where(straight >= bin_edges[np.clip(source_bins, 0, num_bins)], source_bins, -1)
+                    # the unreachable cells have an infinite distance and fall behind the last bin
+                    for b in range(num_bins):
+                        candidates = np.flatnonzero(source_bins == b)
+                        if len(candidates) == 0:
+                            continue
+                        goals = rng.choice(candidates, min(goals_per_bin, len(candidates)), replace=False)
+                        pairs[b].append(np.stack([
+                            np.full(len(goals), node_cells[source]),
+                            node_cells[endpoint_nodes[goals]],
+                            source_dists[goals]]))
+
+        columns = [np.concatenate(bin_pairs, axis=1) if bin_pairs else np.zeros((3, 0)) for bin_pairs in pairs]
+        bin_offsets = np.concatenate([[0], np.cumsum([c.shape[1] for c in columns])]).astype(np.int64)
+        columns = np.concatenate(columns, axis=1)
+        meta = {
+            "map_digest": get_map_digest(map_),
+            "robot_radius": robot_radius,
+            "endpoint_clearance": endpoint_clearance,
+            "resolution": info.resolution,
+            "origin": [info.origin.position.x, info.origin.position.y],
+            "width": info.width,
+            "num_components": int(num_components),
+        }
+        return cls(columns[0].astype(np.uint32), columns[1].astype(np.uint32), columns[2].astype(np.float32),
+                   bin_offsets, bin_edges, meta, seed)
+
+    def save(self, path: str):
+        """writes the bank atomically, so that parallel environments can share the file"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as fd:
+            np.savez(fd, starts=self.starts, goals=self.goals, dists=self.dists, bin_offsets=self.bin_offsets,
+                     bin_edges=self.bin_edges, meta=np.array(json.dumps(self.meta)))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, seed: Union[int, None] = None) -> "StartGoalBank":
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            return cls(data["starts"], data["goals"], data["dists"], data["bin_offsets"], data["bin_edges"], meta,
+                       seed)
+
+    def _cell_to_position(self, cell: int) -> np.ndarray:
+        return (np.array([cell % self._width, cell // self._width]) + 0.5) * self._resolution + self._origin
+
+    def draw(self, min_dist: float = 0.0, bin_weights: Union[list, None] = None) \
+            -> Union[Tuple[np.ndarray, np.ndarray, float], None]:
+        """
+        Draws a bin and a pair within the bin.
+
+        Args:
+            min_dist (float, optional): only the bins whose pairs are at least min_dist apart are drawn
+            bin_weights (list, optional): relative frequency of the bins, defaults to equal weights
+        Returns:
+            start and goal pose (x, y, theta) and their geodesic distance,
+            None if no bin with pairs satisfies min_dist
+        """
+        weights = np.ones(len(self.bin_counts)) if bin_weights is None else np.array(bin_weights, dtype=np.float64)
+        weights[(self.bin_counts == 0) | (self.bin_edges[:-1] < min_dist)] = 0
+        cum_weights = np.cumsum(weights)
+        if cum_weights[-1] <= 0:
+            return None
+        u = self._rng.random(4)
+        b = np.searchsorted(cum_weights, u[0] * cum_weights[-1], side="right")
+        i = self.bin_offsets[b] + int(u[1] * self.bin_counts[b])
+        start, goal = self._cell_to_position(self.starts[i]), self._cell_to_position(self.goals[i])
+        # the paths are symmetric, serving the pairs in both directions doubles the start positions
+        if u[2] < 0.5:
+            start, goal = goal, start
+        theta = (u[3] * 2 - 1) * math.pi
+        return np.append(start, theta), np.append(goal, self._rng.uniform(-math.pi, math.pi)), float(self.dists[i])
+
+
+def get_start_goal_bank_path(map_: OccupancyGrid, robot_radius: float, folder: Union[str, None] = None) -> str:
+    if folder is None:
+        folder = os.path.join(rospkg.RosPack().get_path("simulator_setup"), "tmp_start_goal_banks")
+    return os.path.join(folder, f"{get_map_digest(map_)}_r{robot_radius:.3f}.bank.npz")
+
+
+def get_start_goal_bank(map_: OccupancyGrid, robot_radius: float,
+                        folder: Union[str, None] = None) -> Union[StartGoalBank, None]:
+    """
+    loads the bank of the map and robot radius built offline by scripts/build_start_goal_banks.py, None if there is
+    none. The banks are never built on the fly, e.g. the random maps of every episode have no bank.
+    """
+    path = get_start_goal_bank_path(map_, robot_radius, folder)
+    if os.path.isfile(path):
+        return StartGoalBank.load(path)
+    return None
@@ -1,22 +1,27 @@
 import os
+import time
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from threading import Condition, Lock
 from filelock import FileLock
 
 import rospy
 import rospkg
 import json
-import yaml
 import numpy as np
 from nav_msgs.msg import OccupancyGrid
 from nav_msgs.srv import GetMap
 from geometry_msgs.msg import Pose2D
 from rospy.exceptions import ROSException
 
-from std_msgs.msg import Bool
+from std_msgs.msg import Bool, Int16
+from flatland_msgs.srv import SpawnModelRequest
 
+from .curriculum import CURRICULUM_NUM_STAGES_PARAM, CURRICULUM_STAGE_TOPIC, load_curriculum
+from .map_service import get_task_generation_service
 from .obstacles_manager import ObstaclesManager
 from .robot_manager import RobotManager
+from .scenario_loader import compile_arena_scenario, compile_scenerios, get_compiled_scenario_cache
 from pathlib import Path
 
 
@@ -160,9 +165,9 @@ class StagedRandomTask(RandomTask):
         self.ns_prefix = "" if ns == "" else "/" + ns + "/"
 
         self._curr_stage = start_stage
-        self._stages = {}
         self._PATHS = PATHS
-        self._read_stages_from_yaml()
+        # all stages are loaded and validated once per process, see load_curriculum
+        self._stages = load_curriculum(self._PATHS.get("curriculum"))
 
         # check start stage format
         if not isinstance(start_stage, int):
@@ -173,81 +178,77 @@ class StagedRandomTask(RandomTask):
                 % len(self._stages)
             )
         rospy.set_param("/curr_stage", self._curr_stage)
+        rospy.set_param(CURRICULUM_NUM_STAGES_PARAM, len(self._stages))
 
         # hyperparamters.json location
         self.json_file = os.path.join(self._PATHS.get("model"), "hyperparameters.json")
         assert os.path.isfile(self.json_file), "Found no 'hyperparameters.json' at %s" % self.json_file
         self._lock_json = FileLock(self.json_file + ".lock")
 
-        # subs for triggers
+        self._initiate_stage()
+        self._stage_start = time.monotonic()
+
+        # all namespaces follow the stage broadcast by the training callback, the namespace triggers are kept for
+        # switching a single namespace by hand
+        self._sub_stage = rospy.Subscriber(CURRICULUM_STAGE_TOPIC, Int16, self._stage_callback)
         self._sub_next = rospy.Subscriber(f"{self.ns_prefix}next_stage", Bool, self.next_stage)
         self._sub_previous = rospy.Subscriber(f"{self.ns_prefix}previous_stage", Bool, self.previous_stage)
 
-        self._initiate_stage()
+    def _stage_callback(self, msg: Int16):
+        if not 1 <= msg.data <= len(self._stages):
+            rospy.logwarn(f"({self.ns}) Stage {msg.data} of the curriculum broadcast does not exist!")
+            return
+        self._switch_stage(msg.data)
 
     def next_stage(self, msg: Bool):
         if self._curr_stage < len(self._stages):
-            self._curr_stage = self._curr_stage + 1
-            self._initiate_stage()
-
-            if self.ns == "eval_sim":
-                rospy.set_param("/curr_stage", self._curr_stage)
-                with self._lock_json:
-                    self._update_curr_stage_json()
-
-                if self._curr_stage == len(self._stages):
-                    rospy.set_param("/last_stage_reached", True)
+            self._switch_stage(self._curr_stage + 1)
         else:
             print(f"({self.ns}) INFO: Tried to trigger next stage but already reached last one")
 
     def previous_stage(self, msg: Bool):
         if self._curr_stage > 1:
-            rospy.set_param("/last_stage_reached", False)
+            self._switch_stage(self._curr_stage - 1)
+        else:
+            print(f"({self.ns}) INFO: Tried to trigger previous stage but already reached first one")
 
-            self._curr_stage = self._curr_stage - 1
+    def _switch_stage(self, stage: int):
+        received = time.monotonic()
+        # the switch waits for a running reset, an episode never sees the obstacles of two stages
+        with self._map_lock:
+            if stage == self._curr_stage:
+                return
+            previous_stage, self._curr_stage = self._curr_stage, stage
             self._initiate_stage()
+        switched = time.monotonic()
+        rospy.loginfo(
+            f"({self.ns}) Stage {previous_stage} -> {stage} after a dwell time of {received - self._stage_start:.1f}s, "
+            f"switched in {switched - received:.2f}s"
+        )
+        self._stage_start = switched
 
-            if self.ns == "eval_sim":
-                rospy.set_param("/curr_stage", self._curr_stage)
-                with self._lock_json:
-                    self._update_curr_stage_json()
-        else:
-            print(f"({self.ns}) INFO: Tried to trigger previous stage but already reached first one")
+        if self.ns == "eval_sim":
+            rospy.set_param("/curr_stage", self._curr_stage)
+            rospy.set_param("/last_stage_reached", self._curr_stage == len(self._stages))
+            with self._lock_json:
+                self._update_curr_stage_json()
 
     def _initiate_stage(self):
+        start = time.perf_counter()
+        counters = dict(self.obstacles_manager.counters)
         self._remove_obstacles()
 
-        static_obstacles = self._stages[self._curr_stage]["static"]
-        dynamic_obstacles = self._stages[self._curr_stage]["dynamic"]
-
-        self.obstacles_manager.register_random_static_obstacles(
-            self._stages[self._curr_stage]["static"],
-            num_vertices_min=3,
-            num_vertices_max=4,
-            min_obstacle_radius=0.25,
-            max_obstacle_radius=1.5,
-        )
-        self.obstacles_manager.register_random_dynamic_obstacles(
-            self._stages[self._curr_stage]["dynamic"],
-            min_obstacle_radius=0.1,
-            max_obstacle_radius=0.3,
-        )
+        stage = self._stages[self._curr_stage]
+        self.obstacles_manager.register_random_static_obstacles(stage.static, **stage.static_kwargs)
+        self.obstacles_manager.register_random_dynamic_obstacles(stage.dynamic, **stage.dynamic_kwargs)
 
+        counters = {key: value - counters[key] for key, value in self.obstacles_manager.counters.items()}
         print(
-            f"({self.ns}) Stage {self._curr_stage}: Spawning {static_obstacles} static and {dynamic_obstacles} dynamic obstacles!"
+            f"({self.ns}) Stage {self._curr_stage}: Spawning {stage.static} static and {stage.dynamic} dynamic obstacles! "
+            f"({counters['spawns']} spawned, {counters['reused']} reused, {counters['deletes']} deleted, "
+            f"{counters['moves']} moved in {time.perf_counter() - start:.2f}s)"
         )
 
-    def _read_stages_from_yaml(self):
-        file_location = self._PATHS.get("curriculum")
-        if os.path.isfile(file_location):
-            with open(file_location, "r") as file:
-                self._stages = yaml.load(file, Loader=yaml.FullLoader)
-            assert isinstance(
-                self._stages, dict
-            ), "'training_curriculum.yaml' has wrong fromat! Has to encode dictionary!"
-        else:
-            raise FileNotFoundError("Couldn't find 'training_curriculum.yaml' in %s " % self._PATHS.get("curriculum"))
-
     def _update_curr_stage_json(self):
         with open(self.json_file, "r") as file:
             hyperparams = json.load(file)
@@ -260,7 +261,8 @@ class StagedRandomTask(RandomTask):
                 json.dump(hyperparams, target, ensure_ascii=False, indent=4)
 
     def _remove_obstacles(self):
-        self.obstacles_manager.remove_obstacles()
+        # the obstacles are parked and reused by the next stage instead of being deleted
+        self.obstacles_manager.release_obstacles()
 
 
 class ScenerioTask(ABSTask):
@@ -279,9 +281,8 @@ class ScenerioTask(ABSTask):
         json_path = Path(scenerios_json_path)
 
         assert json_path.is_file() and json_path.suffix == ".json"
-        json_data = json.load(json_path.open())
-
-        self._scenerios_data = json_data["scenarios"]
+        # all scenerios are parsed and validated up front, see compile_scenerio
+        self._scenerios_data = get_compiled_scenario_cache().get(str(json_path), compile_scenerios)
         # current index of the scenerio
         self._idx_curr_scene = -1
         # The times of current scenerio repeated
@@ -299,10 +300,10 @@ class ScenerioTask(ABSTask):
                 info["new_scenerio_loaded"] = False
                 self.obstacles_manager.move_all_obstacles_to_start_pos_tween2()
             # reset robot
-            robot_data = self._scenerios_data[self._idx_curr_scene]["robot"]
-            robot_start_pos = robot_data["start_pos"]
-            robot_goal_pos = robot_data["goal_pos"]
-            info["robot_goal_pos"] = robot_goal_pos
+            scenerio = self._scenerios_data[self._idx_curr_scene]
+            robot_start_pos = scenerio.robot_start_pos
+            robot_goal_pos = scenerio.robot_goal_pos
+            info["robot_goal_pos"] = list(robot_goal_pos)
             self.robot_manager.set_start_pos_goal_pos(Pose2D(*robot_start_pos), Pose2D(*robot_goal_pos))
             self._num_repeats_curr_scene += 1
             info["num_repeats_curr_scene"] = self._num_repeats_curr_scene
@@ -313,67 +314,20 @@ class ScenerioTask(ABSTask):
         try:
             while True:
                 self._idx_curr_scene += 1
-                scenerio_data = self._scenerios_data[self._idx_curr_scene]
-                scenerio_name = scenerio_data["scene_name"]
-                print(f"======================================================")
-                print(f"Scenario '{scenerio_name}' loaded")
-                print(f"======================================================")
+                scenerio = self._scenerios_data[self._idx_curr_scene]
                 # use can set "repeats" to a non-positive value to disable the scenerio
-                if scenerio_data["repeats"] > 0:
-                    # set obstacles
-                    self.obstacles_manager.remove_obstacles()
-                    watchers_dict = scenerio_data.setdefault("watchers", [])
-                    for obstacle_name, obstacle_data in scenerio_data["static_obstacles"].items():
-                        if obstacle_data["shape"] == "circle":
-                            self.obstacles_manager.register_static_obstacle_circle(
-                                obstacle_data["x"],
-                                obstacle_data["y"],
-                                obstacle_data["radius"],
-                            )
-                        # vertices uses global coordinate system, the order of the vertices is doesn't matter
-                        elif obstacle_data["shape"] == "polygon":
-                            obstacle_vertices = np.array(obstacle_data["vertices"], dtype=np.float)
-                            self.obstacles_manager.register_static_obstacle_polygon(obstacle_vertices)
-                        else:
-                            raise ValueError(
-                                f"Shape {obstacle_data['shape']} is not supported, supported shape 'circle' OR 'polygon'"
-                            )
-
-                    for obstacle_name, obstacle_data in scenerio_data["dynamic_obstacles"].items():
-                        # currently dynamic obstacle only has circle shape
-                        obstacle_radius = obstacle_data["obstacle_radius"]
-                        linear_velocity = obstacle_data["linear_velocity"]
-                        # 3-elementary list
-                        start_pos = obstacle_data["start_pos"]
-                        waypoints = obstacle_data["waypoints"]
-                        is_waypoint_relative = obstacle_data["is_waypoint_relative"]
-                        mode = obstacle_data["mode"]
-                        trigger_zones = []
-                        if "triggers" in obstacle_data:
-                            for trigger in obstacle_data["triggers"]:
-                                if trigger not in watchers_dict:
-                                    raise ValueError(
-                                        f"For dynamic obstacle [{obstacle_name}] the trigger: {trigger} not found in the corresponding 'watchers' dict for scene {scenerio_name} "
-                                    )
-                                trigger_zones.append(watchers_dict[trigger]["pos"] + [watchers_dict[trigger]["range"]])
-                        self.obstacles_manager.register_dynamic_obstacle_circle_tween2(
-                            obstacle_name,
-                            obstacle_radius,
-                            linear_velocity,
-                            start_pos,
-                            waypoints,
-                            is_waypoint_relative,
-                            mode,
-                            trigger_zones,
-                        )
-                    # self.robot_
-                    robot_data = scenerio_data["robot"]
-                    robot_start_pos = robot_data["start_pos"]
-                    robot_goal_pos = robot_data["goal_pos"]
-                    self.robot_manager.set_start_pos_goal_pos(Pose2D(*robot_start_pos), Pose2D(*robot_goal_pos))
+                if scenerio.repeats > 0:
+                    start = time.perf_counter()
+                    # set obstacles, the static ones of the last scenerio are reused if their shapes are equal
+                    self.obstacles_manager.release_obstacles()
+                    self.obstacles_manager.register_scenerio_obstacles(
+                        scenerio.static_circles, scenerio.static_polygons, scenerio.dynamic_obstacles)
+                    self.robot_manager.set_start_pos_goal_pos(
+                        Pose2D(*scenerio.robot_start_pos), Pose2D(*scenerio.robot_goal_pos))
 
                     self._num_repeats_curr_scene = 0
-                    self._max_repeats_curr_scene = scenerio_data["repeats"]
+                    self._max_repeats_curr_scene = scenerio.repeats
+                    rospy.loginfo(f"Scenario '{scenerio.name}' loaded in {time.perf_counter() - start:.3f}s")
                     break
 
         except IndexError as e:
@@ -499,23 +453,23 @@ class PedsimManager:
 
     def spawnPeds(self, peds: List[Ped]):
         res = self.spawn_peds_client.call(peds)
-        print(res)
+        rospy.logdebug(res)
 
     def respawnPeds(self, peds: List[Ped]):
         res = self.respawn_peds_client.call(peds)
-        print(res)
+        rospy.logdebug(res)
 
     def spawnInteractiveObstacles(self, obstacles: List[InteractiveObstacle]):
         res = self.spawn_interactive_obstacles_client.call(obstacles)
-        print(res)
+        rospy.logdebug(res)
 
     def respawnInteractiveObstacles(self, obstacles: List[InteractiveObstacle]):
         res = self.respawn_interactive_obstacles_client.call(obstacles)
-        print(res)
+        rospy.logdebug(res)
 
     def resetAllPeds(self):
         res = self.reset_all_peds_client.call()
-        print(res)
+        rospy.logdebug(res)
 
 
 class ScenarioTask(ABSTask):
@@ -527,25 +481,29 @@ class ScenarioTask(ABSTask):
     ):
         super().__init__(obstacles_manager, robot_manager)
 
-        # load scenario from file
-        self.scenario = ArenaScenario()
-        self.scenario.loadFromFile(scenario_path)
+        # load scenario from file, the compiled scenario is cached by the hash of the file
+        self.scenario = get_compiled_scenario_cache().get(scenario_path, compile_arena_scenario)
 
-        # setup pedsim agents
+        # setup pedsim agents, they are spawned while the static flatland obstacles are spawned
         self.pedsim_manager = None
-        if len(self.scenario.pedsimAgents) > 0:
-            self.pedsim_manager = PedsimManager()
-            peds = [agent.getPedMsg() for agent in self.scenario.pedsimAgents]
-            self.pedsim_manager.spawnPeds(peds)
-
-        # setup static flatland obstacles
-        for obstacle in self.scenario.staticObstacles:
-            self.obstacles_manager._srv_spawn_model.call(
-                obstacle.flatlandModel.path,
-                obstacle.name,
-                "static_obstacles",
-                Pose2D(obstacle.pos[0], obstacle.pos[1], obstacle.angle),
-            )
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            spawn_peds = None
+            if len(self.scenario.peds) > 0:
+                self.pedsim_manager = PedsimManager()
+                spawn_peds = executor.submit(self.pedsim_manager.spawnPeds, self.scenario.peds)
+
+            # setup static flatland obstacles
+            spawn_requests = []
+            for path, name, pos in self.scenario.static_obstacles:
+                spawn_request = SpawnModelRequest()
+                spawn_request.yaml_path = path
+                spawn_request.name = name
+                spawn_request.ns = "static_obstacles"
+                spawn_request.pose = Pose2D(*pos)
+                spawn_requests.append(spawn_request)
+            self.obstacles_manager._spawn_models(spawn_requests)
+            if spawn_peds is not None:
+                spawn_peds.result()
 
         self.reset_count = 0
 
@@ -559,12 +517,7 @@ class ScenarioTask(ABSTask):
 
             # reset robot
             self.robot_manager.set_start_pos_goal_pos(
-                Pose2D(
-                    self.scenario.robotPosition[0],
-                    self.scenario.robotPosition[1],
-                    0,
-                ),
-                Pose2D(self.scenario.robotGoal[0], self.scenario.robotGoal[1], 0),
+                Pose2D(*self.scenario.robot_start_pos), Pose2D(*self.scenario.robot_goal_pos)
             )
 
             # fill info dict
@@ -572,7 +525,7 @@ class ScenarioTask(ABSTask):
                 info["new_scenerio_loaded"] = True
             else:
                 info["new_scenerio_loaded"] = False
-            info["robot_goal_pos"] = self.scenario.robotGoal
+            info["robot_goal_pos"] = list(self.scenario.robot_goal_pos[:2])
             info["num_repeats_curr_scene"] = self.reset_count
             info["max_repeats_curr_scene"] = 1000  # todo: implement max number of repeats for scenario
         return info
@@ -601,8 +554,9 @@ def get_predefined_task(ns: str, mode="random", start_stage: int = 1, PATHS: dic
 
     # get the map
 
-    service_client_get_map = rospy.ServiceProxy("/static_map", GetMap)
-    map_response = service_client_get_map()
+    # the map is fetched and preprocessed once per process, see TaskGenerationService
+    task_generation_service = get_task_generation_service()
+    static_map = task_generation_service.get_static_map()
 
     # use rospkg to get the path where the model config yaml file stored
     models_folder_path = rospkg.RosPack().get_path("simulator_setup")
@@ -611,11 +565,11 @@ def get_predefined_task(ns: str, mode="random", start_stage: int = 1, PATHS: dic
     robot_model = rospy.get_param("model")
     robot_manager = RobotManager(
         ns,
-        map_response.map,
+        static_map,
         os.path.join(models_folder_path, "robot", f"{robot_model}.model.yaml"),
     )
 
-    obstacles_manager = ObstaclesManager(ns, map_response.map)
+    obstacles_manager = ObstaclesManager(ns, static_map)
 
     # only generate 3 static obstaticles
     # obstacles_manager.register_obstacles(3, os.path.join(
@@ -1,7 +1,59 @@
 import math
+import os
+import warnings
 import numpy as np
+import scipy.ndimage
+import yaml
 from nav_msgs.msg import OccupancyGrid
+from PIL import Image
 import random
+from typing import Dict, Union
+
+
+def load_map_yaml(map_yaml_path: str) -> OccupancyGrid:
+    """load a map_server style map (yaml + image) into an OccupancyGrid without a running map_server.
+
+    The thresholding follows the map_server "trinary" mode: the color of a pixel is the integer mean of all its
+    channels (alpha included, like map_server), cells above occupied_thresh are 100, cells below free_thresh are 0
+    and everything in between is unknown (-1). The resolution is rounded to float32 like in the OccupancyGrid message.
+
+    Args:
+        map_yaml_path (str): absolute path of the map.yaml file
+    Returns:
+        map_ (OccupancyGrid): the map in the same format as provided by the /static_map service
+    """
+    with open(map_yaml_path, "r") as fd:
+        map_data = yaml.safe_load(fd)
+
+    image_path = map_data["image"]
+    if not os.path.isabs(image_path):
+        image_path = os.path.join(os.path.dirname(map_yaml_path), image_path)
+    image = Image.open(image_path)
+    if image.mode not in ("L", "LA", "RGB", "RGBA"):
+        # palette and bilevel images, map_server reads them through SDL as RGB(A) as well
+        image = image.convert("RGBA" if "transparency" in image.info or image.mode == "PA" else "RGB")
+    channels = np.asarray(image, dtype=np.int64).reshape(image.height, image.width, -1)
+    # map_server averages the channels with an integer division instead of computing the luma
+    color = channels.sum(axis=2) // channels.shape[2]
+    if map_data.get("negate", 0):
+        color = 255 - color
+    occ_prob = (255.0 - color) / 255.0
+
+    grid = np.full(occ_prob.shape, -1, dtype=np.int8)
+    grid[occ_prob > map_data["occupied_thresh"]] = 100
+    grid[occ_prob < map_data["free_thresh"]] = 0
+    # the first row of the image is the top of the map, the first row of the grid is the bottom
+    grid = np.flipud(grid)
+
+    map_ = OccupancyGrid()
+    map_.header.frame_id = "map"
+    map_.info.resolution = float(np.float32(map_data["resolution"]))
+    map_.info.height, map_.info.width = grid.shape
+    map_.info.origin.position.x = map_data["origin"][0]
+    map_.info.origin.position.y = map_data["origin"][1]
+    map_.info.origin.orientation.w = 1.0
+    map_.data = grid.flatten().tolist()
+    return map_
 
 
 def generate_freespace_indices(map_: OccupancyGrid) -> tuple:
@@ -82,3 +134,169 @@ def get_random_pos_on_map(free_space_indices, map_: OccupancyGrid, safe_dist: fl
     theta = random.uniform(-math.pi, math.pi)
 
     return x_in_meters, y_in_meters, theta
+
+
+class FreeSpaceSampler:
+    """
+    Samples random poses on the free space of a map from a precomputed clearance map.
+
+    The distance transform of the occupancy grid is computed once per map, the free cells with a clearance of at
+    least r are kept as index array per requested r. Poses are drawn in batches, the forbidden zones are checked
+    for all candidates of a batch at once. Unlike get_random_pos_on_map it never gives up: if rejection sampling
+    does not find enough poses, the candidates are filtered exactly and if no cell satisfies the constraints at
+    all, the cells which violate them least are used and a warning is emitted.
+    """
+
+    def __init__(self, map_: OccupancyGrid, seed: Union[int, None] = None, clearance: Union[np.ndarray, None] = None,
+                 free_cells: Union[dict, None] = None):
+        """
+        Args:
+            map_ (OccupancyGrid): map proviced by the ros map service
+            seed (int, optional): seed of the random generator
+            clearance (np.ndarray, optional): precomputed clearance map of map_, see compute_clearance
+            free_cells (dict, optional): cache of the free cells shared with other samplers of the same map
+        """
+        self._rng = np.random.default_rng(seed)
+        self.update_map(map_, clearance, free_cells)
+
+    @staticmethod
+    def compute_clearance(map_: OccupancyGrid) -> np.ndarray:
+        """distance of every cell (flat, y * width + x) to the closest occupied cell in meters"""
+        height, width = map_.info.height, map_.info.width
+        # unknown cells are occupied, the cells outside of the map as well, therefore the grid is padded
+        free = np.zeros((height + 2, width + 2), dtype=bool)
+        free[1:-1, 1:-1] = np.reshape(map_.data, (height, width)) == 0
+        return scipy.ndimage.distance_transform_edt(free)[1:-1, 1:-1].ravel() * map_.info.resolution
+
+    def update_map(self, map_: OccupancyGrid, clearance: Union[np.ndarray, None] = None,
+                   free_cells: Union[dict, None] = None):
+        self.map = map_
+        self._resolution = map_.info.resolution
+        self._origin = np.array([map_.info.origin.position.x, map_.info.origin.position.y])
+        self.clearance = self.compute_clearance(map_) if clearance is None else clearance
+        self._width = map_.info.width
+        self._free_cells: Dict[float, np.ndarray] = {} if free_cells is None else free_cells
+
+    def free_cells(self, safe_dist: float) -> np.ndarray:
+        """flat indices (y * width + x) of the cells with a clearance of at least safe_dist"""
+        # the clearances are multiples of the resolution (or their diagonals), rounding the key keeps the cache small
+        key = round(safe_dist / self._resolution, 2)
+        if key not in self._free_cells:
+            self._free_cells[key] = np.flatnonzero(self.clearance >= safe_dist)
+        return self._free_cells[key]
+
+    def _cells_to_positions(self, cells: np.ndarray) -> np.ndarray:
+        # the clearance is the distance from the center of a cell, therefore the centers are returned
+        return (np.stack([cells % self._width, cells // self._width], axis=1) + 0.5) * self._resolution + self._origin
+
+    @staticmethod
+    def _zone_margin(positions: np.ndarray, zones: np.ndarray, safe_dist: float) -> np.ndarray:
+        """distance to the closest forbidden zone boundary minus safe_dist, negative inside a zone"""
+        if len(positions) * len(zones) <= 4096:
+            dist = np.hypot(positions[:, None, 0] - zones[:, 0], positions[:, None, 1] - zones[:, 1])
+            return (dist - zones[:, 2] - safe_dist).min(axis=1, initial=np.inf)
+        margin = np.full(len(positions), np.inf)
+        # one pass per zone, so that filtering all cells of a large map needs no (cells, zones) array
+        for x, y, r in zones:
+            np.minimum(margin, np.hypot(positions[:, 0] - x, positions[:, 1] - y) - r - safe_dist, out=margin)
+        return margin
+
+    def sample(self, num: int, safe_dist: float, forbidden_zones: list = None, max_rounds: int = 3) -> np.ndarray:
+        """
+        Args:
+            num (int): number of poses
+            safe_dist (float): minimum clearance in meters
+            forbidden_zones (list of 3 elementary tuple(x,y,r)): zones the poses keep safe_dist away from
+            max_rounds (int): batches of rejection sampling before all candidates are filtered exactly
+        Returns:
+            poses (np.ndarray): array of shape (num, 3) with x, y in meters and theta
+        """
+        zones = np.asarray([] if forbidden_zones is None else forbidden_zones, dtype=np.float64).reshape(-1, 3)
+        theta = self._rng.uniform(-math.pi, math.pi, num)
+        cells = self.free_cells(safe_dist)
+        if len(cells) and len(zones) == 0:
+            positions = self._cells_to_positions(cells[self._rng.integers(0, len(cells), num)])
+            return np.column_stack([positions, theta])
+
+        accepted = []
+        n_accepted = 0
+        if len(cells):
+            for _ in range(max_rounds):
+                candidates = self._cells_to_positions(cells[self._rng.integers(0, len(cells), 2 * num + 8)])
+                candidates = candidates[self._zone_margin(candidates, zones, safe_dist) >= 0]
+                accepted.append(candidates[: num - n_accepted])
+                n_accepted += len(accepted[-1])
+                if n_accepted == num:
+                    return np.column_stack([np.concatenate(accepted), theta])
+
+            # most of the free space is forbidden, filter all candidates exactly
+            positions = self._cells_to_positions(cells)
+            valid = positions[self._zone_margin(positions, zones, safe_dist) >= 0]
+            if len(valid):
+                accepted.append(valid[self._rng.integers(0, len(valid), num - n_accepted)])
+                return np.column_stack([np.concatenate(accepted), theta])
+
+        # no cell satisfies the constraints, the cells violating them least are used
+        warnings.warn(f"no free cell with a clearance of {safe_dist} m outside of the forbidden zones")
+        candidates = np.flatnonzero(self.clearance > 0)
+        if len(candidates) == 0:
+            candidates = np.arange(len(self.clearance))
+        positions = self._cells_to_positions(candidates)
+        margin = np.minimum(self.clearance[candidates] - safe_dist, self._zone_margin(positions, zones, safe_dist))
+        best = positions[margin >= margin.max()]
+        return np.column_stack([best[self._rng.integers(0, len(best), num)], theta])
+
+    def sample_separated(self, radii: np.ndarray, forbidden_zones: list = None, num_candidates: int = 8) -> np.ndarray:
+        """
+        Samples the poses of a group of circular objects, e.g. obstacles, which neither overlap each other nor the
+        occupied cells or the forbidden zones.
+
+        num_candidates positions per object are drawn and checked against the map and the forbidden zones at once,
+        then the objects are placed from the largest to the smallest on their first candidate which does not overlap
+        the objects placed before. If all candidates of an object overlap, it is placed with sample, which treats
+        the objects placed before as forbidden zones.
+
+        Args:
+            radii (np.ndarray): radius of every object
+            forbidden_zones (list of 3 elementary tuple(x,y,r)): zones the objects must not overlap
+            num_candidates (int): candidate positions drawn per object
+        Returns:
+            poses (np.ndarray): array of shape (len(radii), 3) with x, y in meters and theta
+        """
+        radii = np.asarray(radii, dtype=np.float64)
+        zones = np.asarray([] if forbidden_zones is None else forbidden_zones, dtype=np.float64).reshape(-1, 3)
+        poses = np.zeros((len(radii), 3))
+        poses[:, 2] = self._rng.uniform(-math.pi, math.pi, len(radii))
+
+        candidates = np.zeros((len(radii), num_candidates, 2))
+        valid = np.zeros((len(radii), num_candidates), dtype=bool)
+        for radius in np.unique(radii):
+            group = np.flatnonzero(radii == radius)
+            cells = self.free_cells(radius)
+            if len(cells) == 0:
+                continue
+            positions = self._cells_to_positions(cells[self._rng.integers(0, len(cells), len(group) * num_candidates)])
+            candidates[group] = positions.reshape(len(group), num_candidates, 2)
+            valid[group] = (self._zone_margin(positions, zones, radius) >= 0).reshape(len(group), num_candidates)
+
+        placed = np.zeros((0, 3))
+        for i in np.argsort(-radii, kind="stable"):
+            free = candidates[i][valid[i]]
+            if len(free) and len(placed):
+                dist = np.hypot(free[:, None, 0] - placed[:, 0], free[:, None, 1] - placed[:, 1])
+                free = free[(dist >= placed[:, 2] + radii[i]).all(axis=1)]
+            if len(free):
+                poses[i, :2] = free[0]
+            else:
+                poses[i, :2] = self.sample(1, radii[i], np.concatenate([zones, placed]))[0, :2]
+            placed = np.concatenate([placed, [[poses[i, 0], poses[i, 1], radii[i]]]])
+        return poses
+
+    def sample_pos(self, safe_dist: float, forbidden_zones: list = None) -> tuple:
+        """drop-in replacement of get_random_pos_on_map
+
+        Returns:
+            x_in_meters,y_in_meters,theta
+        """
+        x, y, theta = self.sample(1, safe_dist, forbidden_zones)[0]
+        return x, y, theta